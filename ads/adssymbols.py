@@ -28,12 +28,18 @@
 
 
 from . import cpyads
+from .cpyads import deadline
+from .layout import LeafLayout
 from .nonzerobasedarray import NonzeroBasedArray
 from ctypes import *
 from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
 import re
 import itertools
+import threading
 import warnings
+import weakref
 import struct
 
 
@@ -44,6 +50,12 @@ ADSIGRP_SYM_UPLOADINFO = 0xF00C
 ADSIGRP_SYM_UPLOAD = 0xF00B
 ADSIGRP_SYM_UPLOADINFO2	= 0xF00F
 ADSIGRP_SYM_DT_UPLOAD = 0xF00E
+ADSIGRP_SUMUP_READ = 0xF080
+ADSIGRP_SUMUP_WRITE = 0xF081
+ADSIGRP_SUMUP_READWRITE = 0xF082
+
+# Maximum number of sub-requests in a sum request, like TwinCAT
+MAX_SUM_REQUESTS = 500
 
 
 class Dummy(Array):
@@ -116,7 +128,7 @@ class Entry:
         p = 0
         while p<len(data):
             # The first 4 bytes of each entry are always its length
-            length, = struct.unpack('L', data[p:p+4])
+            length, = struct.unpack('<L', data[p:p+4])
             
             # Create an object of our class from the data
             yield cls(data[p:p+length])
@@ -132,7 +144,7 @@ class AdsDatatypeEntry(Entry):
         'dataType', 'flags', 'nameLength', 'typeLength', 'commentLength',
         'arrayDim', 'subItemsCount'
         ]
-    _fieldsformat = 'LLLLLLLLHHHHH'
+    _fieldsformat = '<LLLLLLLLHHHHH'
 
     def __init__(self, data):
         # Parse fixed structure
@@ -149,7 +161,7 @@ class AdsDatatypeEntry(Entry):
             dim, remainder = self._field(8, remainder)
             # Note: lbound is unsigned according to TcAdsDef.h, but in fact
             # lbound can be negative so it needs to be signed
-            dims.append(struct.unpack('lL', dim))
+            dims.append(struct.unpack('<lL', dim))
         
         self.array = dims
 
@@ -157,7 +169,7 @@ class AdsDatatypeEntry(Entry):
         subItems = OrderedDict()
         
         for i in range(self.subItemsCount):
-            length, = struct.unpack('L', remainder[:4])
+            length, = struct.unpack('<L', remainder[:4])
             
             subItemData, remainder = self._field(length, remainder)
             subItem = AdsDatatypeEntry(subItemData)
@@ -187,7 +199,10 @@ class AdsSymbolEntry(Entry):
         'entryLength', 'iGroup', 'iOffs', 'size', 'dataType', 'flags',
         'nameLength', 'typeLength', 'commentLength'
         ]
-    _fieldsformat = 'LLLLLLHHH'
+    _fieldsformat = '<LLLLLLHHH'
+    
+    # Set to False when the symbol is no longer part of the PLC program
+    valid = True
     
     def __init__(self, data):
         
@@ -240,6 +255,19 @@ class PLCString(Structure):
         return self.data.decode('latin-1')
 
 
+def ctypesValue(data):
+    """
+    Convert a ctypes object to the value that is returned when reading a
+    variable: a str for PLC strings, the ctypes object itself for arrays and
+    structures, and the Python value for simple types
+    """
+    if isinstance(data, PLCString):
+        return str(data)
+    elif not isinstance(data, (Array, Structure)):
+        return data.value
+    return data
+
+
 VariableInfo = namedtuple('VariableInfo', 'name symbol offset datatype ctype variablesDefinition')
 
 class Variable:
@@ -335,6 +363,15 @@ class Variable:
         if offset is None:
             self.__offset = 0
 
+    def __address(self):
+        """
+        Returns the index group and index offset of this variable
+        """
+        if not self.__symbol.valid:
+            raise InvalidatedVariableError(
+                'Symbol %s was changed or removed from the PLC program' % self.__symbol.name)
+        return self.__symbol.iGroup, self.__symbol.iOffs + self.__offset
+
     def __invert__(self):
         """ 
         The ~ operator overload is 'abused' to get auxiliary data from this
@@ -445,7 +482,8 @@ class Variable:
             if step!=1:
                 raise ValueError('Step size should be 1')
             
-            data = cpyads.adsSyncReadReq(self.__vardef.amsAddress, self.__symbol.iGroup, self.__symbol.iOffs + self.__offset + start, cpyads.c_ubyte * (stop-start))
+            indexGroup, indexOffset = self.__address()
+            data = self.__vardef.adsRead(indexGroup, indexOffset + start, c_ubyte * (stop-start))
             return data
             
         if self.__datatype is None or len(self.__datatype.array) == 0:
@@ -453,25 +491,9 @@ class Variable:
             
         if not isinstance(idx, tuple):
             idx = idx,
-            
-        if len(idx) != len(self.__datatype.array):
-            raise IndexError(
-                'Incorrect number of dimensions. %s has %d but %d given' 
-                % (self.__datatype.name, len(self.__datatype.array), len(idx)))
         
-        # Compute the linear index in the array and the number of elements in the array
-        linearIndex = 0
-        nItems = 1
-        for i, (lower, elements) in zip(idx, self.__datatype.array):
-            if i<lower or i >= lower+elements:
-                raise IndexError('Index out of range')
-
-            linearIndex *= elements
-            linearIndex += i-lower
-            nItems *= elements
-        
-        assert (self.__datatype.size % nItems) == 0
-        elementSize = self.__datatype.size // nItems
+        linearIndex = self.__linearIndex(idx)
+        elementSize = self.__datatype.size // len(self)
         
         type = self.__datatype.type
         if not type:
@@ -486,6 +508,94 @@ class Variable:
         
         return Variable(self.__vardef, idxStr, self.__symbol, type, offset)
 
+    def __linearIndex(self, idx, end = False):
+        """
+        Compute the linear index in the array of the item with index idx (a
+        tuple). With end, the index in the last dimension may also be one
+        past the upper bound, to denote the end of a range
+        """
+        if len(idx) != len(self.__datatype.array):
+            raise IndexError(
+                'Incorrect number of dimensions. %s has %d but %d given' 
+                % (self.__datatype.name, len(self.__datatype.array), len(idx)))
+        
+        linearIndex = 0
+        for dim, (i, (lower, elements)) in enumerate(zip(idx, self.__datatype.array)):
+            upper = lower + elements
+            if end and dim == len(idx) - 1:
+                upper += 1
+            if i<lower or i >= upper:
+                raise IndexError('Index out of range')
+
+            linearIndex *= elements
+            linearIndex += i-lower
+        
+        return linearIndex
+    
+    def __range(self, lo, hi):
+        """
+        Returns the ctype and size of the items, the linear index of lo and
+        the number of items of the range lo..hi
+        """
+        if self.__datatype is None or not self.__datatype.array:
+            raise TypeError('Variable is not an array datatype')
+        
+        if not isinstance(lo, tuple):
+            lo = lo,
+        first = self.__linearIndex(lo)
+        
+        if hi is None:
+            n = len(self) - first
+        else:
+            if not isinstance(hi, tuple):
+                hi = hi,
+            n = self.__linearIndex(hi, end = True) - first
+            if n < 0:
+                raise IndexError('Range end precedes its start')
+        
+        ctype = (~self[lo]).ctype
+        assert ctype is not None
+        return ctype, self.__datatype.size // len(self), first, n
+    
+    def read_range(self, lo, hi = None):
+        """
+        Read the items from index lo up to (not including) index hi in a
+        single request. hi defaults to the end of the array.
+        
+        Multidimensional arrays are indexed with tuples, and the range is
+        taken in memory order, e.g. var.read_range((2, 0), (2, 10)) reads
+        items [2,0] to [2,9] and var.read_range((2, 0), (3, 0)) the whole
+        row 2 of an ARRAY [..., 0..n] OF ...
+        
+        Returns a ctypes array of the items. For a one-dimensional array, it
+        is indexed like the PLC array (starting at lo), otherwise it is a
+        flat array starting at 0.
+        """
+        ctype, itemSize, first, n = self.__range(lo, hi)
+        
+        lbound = lo if len(self.__datatype.array) == 1 and not isinstance(lo, tuple) else 0
+        if lbound == 0:
+            data = (ctype * n)()
+        else:
+            data = NonzeroBasedArray.create(ctype, lbound, n)()
+        self.readinto(data, first * itemSize)
+        return data
+    
+    def write_range(self, lo, data):
+        """
+        Write the items in data (a ctypes array of the item type, or a
+        sequence of values of the items) to the items starting at index lo,
+        in a single request
+        """
+        ctype, itemSize, first, n = self.__range(lo, None)
+        if len(data) > n:
+            raise IndexError('Range exceeds the array')
+        
+        if not isinstance(data, Array) or data._type_ is not ctype:
+            data = (ctype * len(data))(*[
+                item if isinstance(item, ctype) else ctype(item) for item in data])
+        self.write_buffer(data, first * itemSize)
+    
     def __setitem__(self, idx, data):
         """
 
@@ -498,19 +608,58 @@ class Variable:
         if step!=1:
             raise ValueError('Step size should be 1')
 
-        view = memoryview(data)
-        # Quirck to get a ctypes object which maps to the memoryview, see 
-        # https://lists.gt.net/python/dev/1011232
-        address = c_void_p()
-        length = c_ssize_t()
-        pythonapi.PyObject_AsReadBuffer(py_object(view), byref(address), byref(length))
-        
-        if stop-start != length.value:
+        if stop-start != memoryview(data).nbytes:
             raise ValueError('data length does not match slice size')
         
-        cbyte_array = (c_ubyte * length.value).from_address(address.value)
+        self.write_buffer(data, start)
+    
+    def __size(self):
+        if self.__datatype is not None:
+            return self.__datatype.size
+        return sizeof(self.__ctype)
+    
+    def __bytes(self, buffer, start):
+        """
+        Returns a memoryview of buffer as bytes, checking that it fits in
+        this variable when starting at byte start
+        """
+        view = memoryview(buffer).cast('B')
+        if start < 0 or start + len(view) > self.__size():
+            raise ValueError('buffer of %d bytes starting at %d exceeds the variable size of %d bytes'
+                % (len(view), start, self.__size()))
+        return view
+    
+    def readinto(self, buffer, start=0):
+        """
+        Read raw data of this variable, starting at byte start, directly into
+        buffer: any writable, contiguous object supporting the buffer
+        protocol (e.g. bytearray, memoryview, array, numpy array, mmap).
+        len(buffer) bytes are read, without intermediate copies.
         
-        cpyads.adsSyncWriteReq(self.__vardef.amsAddress, self.__symbol.iGroup, self.__symbol.iOffs + self.__offset + start, cbyte_array)
+        Returns the number of bytes read
+        """
+        view = self.__bytes(buffer, start)
+        if len(view):
+            indexGroup, indexOffset = self.__address()
+            data = (c_ubyte * len(view)).from_buffer(view)
+            self.__vardef.adsReadInto(indexGroup, indexOffset + start, data)
+        return len(view)
+    
+    def write_buffer(self, buffer, start=0):
+        """
+        Write the contents of buffer (any contiguous object supporting the
+        buffer protocol) as raw data to this variable, starting at byte
+        start. Writable buffers are passed without copying; read-only ones
+        (e.g. bytes) are copied once.
+        """
+        view = self.__bytes(buffer, start)
+        if len(view):
+            indexGroup, indexOffset = self.__address()
+            if view.readonly:
+                data = (c_ubyte * len(view)).from_buffer_copy(view)
+            else:
+                data = (c_ubyte * len(view)).from_buffer(view)
+            self.__vardef.adsWrite(indexGroup, indexOffset + start, data)
     
 
     def __call__(self, *args, **kwargs):
@@ -530,13 +679,8 @@ class Variable:
         if len(args)==0 and len(kwargs) == 0:
             # Read
             assert self.__ctype is not None
-            data = cpyads.adsSyncReadReq(self.__vardef.amsAddress, self.__symbol.iGroup, self.__symbol.iOffs + self.__offset, self.__ctype)
-            
-            if issubclass(self.__ctype, PLCString):
-                data = str(data)
-            elif not issubclass(self.__ctype, (Array, Structure)):
-                data = data.value
-            return data   
+            data = self.__vardef.adsRead(*self.__address(), self.__ctype)
+            return ctypesValue(data)
             
         else:
             # Write
@@ -548,9 +692,72 @@ class Variable:
                 # Not exactly one argument or not of the correct type. Try to make
                 # it into the correct type using the ctype class constructor
                 data = self.__ctype(*args, **kwargs)
-            cpyads.adsSyncWriteReq(self.__vardef.amsAddress, self.__symbol.iGroup, self.__symbol.iOffs + self.__offset, data)
+            self.__vardef.adsWrite(*self.__address(), data)
                 
 
+    def exchange(self, writeValue, readVar):
+        """
+        Write writeValue to this variable and then read readVar (a
+        Variable of the same PLC) in a single round trip, e.g. to write a
+        command to a mailbox and read back the response. writeValue is
+        converted to the ctype of this variable like when calling it.
+        
+        Returns the value read, like calling readVar
+        """
+        readInfo = ~readVar
+        if readInfo.variablesDefinition is not self.__vardef:
+            raise ValueError('readVar must be a variable of the same PLC')
+        assert self.__ctype is not None and readInfo.ctype is not None
+        
+        if isinstance(writeValue, self.__ctype):
+            writeData = writeValue
+        else:
+            writeData = self.__ctype(writeValue)
+        writeGroup, writeOffset = self.__address()
+        readGroup, readOffset = readVar.__address()
+        readSize = sizeof(readInfo.ctype)
+        
+        # Sum read-write request of a write (without read) and a read
+        # (without write): the request holds the (indexGroup, indexOffset,
+        # readLength, writeLength) of both followed by the written data; the
+        # response holds the (error, length) of both followed by the data read
+        request = struct.pack('<8L',
+            writeGroup, writeOffset, 0, sizeof(writeData),
+            readGroup, readOffset, readSize, 0) + bytes(writeData)
+        request = (c_ubyte * len(request)).from_buffer_copy(request)
+        response = (c_ubyte * (16 + readSize))()
+        self.__vardef.adsReadWriteInto(ADSIGRP_SUMUP_READWRITE, 2, response, request)
+        
+        writeError, writeLength, readError, readLength = struct.unpack_from('<4L', response)
+        cpyads.checkError(writeError)
+        cpyads.checkError(readError)
+        return ctypesValue(readInfo.ctype.from_buffer_copy(response, 16))
+    
+    def edit(self):
+        """
+        Read this structure or array variable once into a local mirror.
+        Assignments to members and items of the mirror are written back to
+        the PLC, merged into as few requests as possible, on commit() (see
+        mirror.Mirror):
+        
+            with var.edit() as m:
+                m.speed = 1.5
+                m.axes[2].enabled = True
+        """
+        from .mirror import Mirror
+        return Mirror(self)
+    
+    def read_python(self):
+        """
+        Read the variable from the PLC and return its value as native Python
+        objects: dicts for structures, lists for arrays, str for strings (see
+        codec.Codec). This is much faster than converting the ctypes object
+        returned by var() for large structures and arrays.
+        """
+        assert self.__ctype is not None
+        data = self.__vardef.adsRead(*self.__address(), self.__ctype)
+        return self.__vardef.getCodec(self.__ctype).decode(data)
+
     def __repr__(self):
         if self.__ctype is not None:
             return '<Variable %s = %r>' % (self.__name, self())
@@ -560,61 +767,203 @@ class Variable:
             return '<Variable (unknown type)>'
             
             
+# A single element of a variable path: .name (the dot is optional at the
+# start) or [index] / [index,index]
+_pathElement = re.compile(r'(\.?)([^.\[\]]+)|\[([^\]]*)\]')
+
 class Variables():
     def __iter__(self):
         return iter(self.__dict__.items())
 
-class AdsVariablesDefinition():
-    def __init__(self, address):
-        self.dtypes = {}
-        self.ctypes = basictypes.copy()
-        self.amsAddress = address
+RefreshResult = namedtuple('RefreshResult', 'added removed changed datatypes')
 
-        # Get symbol upload info; read symbol info and data types
-        symbolUploadInfo = cpyads.adsSyncReadReq(address, ADSIGRP_SYM_UPLOADINFO2, 0, c_ulong * 6)
-        
-        nSymbols, nSymSize, nDatatypes, nDatatypeSize, nMaxDynSymbols, nUsedDynSymbols = symbolUploadInfo
-        
-        symbolsData = cpyads.adsSyncReadReq(address, ADSIGRP_SYM_UPLOAD, 0, c_char * nSymSize)
-        datatypesData = cpyads.adsSyncReadReq(address, ADSIGRP_SYM_DT_UPLOAD, 0, c_char * nDatatypeSize)
-        
-        # Create a mapping of name -> PLC AdsDataType
+class InvalidatedVariableError(RuntimeError):
+    """
+    Raised when reading or writing a variable of which the symbol was
+    removed or changed by an online change (see
+    AdsVariablesDefinition.refresh)
+    """
+
+class DatatypeSet:
+    """
+    The datatypes of a PLC program: the AdsDatatypeEntry objects parsed from
+    the datatype blob (dtypes), and the ctypes, codecs and leaf layouts that
+    are generated from them on demand.
+    
+    Definitions of PLCs that run the same program share a single
+    DatatypeSet (see TypeRegistry), so the datatypes are parsed and the
+    ctypes generated once; only the symbols are kept per definition.
+    
+    previous: the DatatypeSet of the previous version of the program (see
+      AdsVariablesDefinition.refresh). Its entries, ctypes, codecs and
+      layouts of the datatypes that did not change are reused, so existing
+      Variables of unchanged datatypes remain compatible. See
+      addEquivalents for sets that were not derived from the previous one
+    """
+    def __init__(self, datatypesData, previous = None):
+        # Lock protecting the caches, so variables can be created and used
+        # from multiple threads
+        self.lock = threading.RLock()
+        self.digest = hashlib.sha1(datatypesData).digest()
         self.dtypes = {t.name: t for t in AdsDatatypeEntry.iter(datatypesData)}
+        self.ctypes = basictypes.copy()
+        self.codecs = {} # ctype -> codec.Codec
+        self.layouts = {} # datatype name -> layout.LeafLayout
+        # id -> AdsDatatypeEntry of other sets that is equal to the entry of
+        # the same name in this set, see addEquivalents
+        self.equivalents = {}
+        
+        if previous is not None:
+            with previous.lock:
+                changed = previous.changedDatatypes(self.dtypes)
+                self.dtypes = {name: dtype if name in changed else previous.dtypes[name]
+                    for name, dtype in self.dtypes.items()}
+                self.ctypes.update((name, c) for name, c in previous.ctypes.items()
+                    if name not in changed)
+                self.layouts.update((name, l) for name, l in previous.layouts.items()
+                    if name not in changed)
+                self.codecs.update(previous.codecs)
         
         # Create Ctypes classes for all PLC AdsDataTypes
         for dtypename in self.dtypes.keys():
             self.getCtype(dtypename)
+    
+    def changedDatatypes(self, dtypes):
+        """
+        Returns the names of the datatypes that differ between self.dtypes
+        and dtypes (a new mapping of name -> AdsDatatypeEntry), including the
+        datatypes that refer to a changed datatype
+        """
+        def key(dtype):
+            if dtype.hashValue:
+                # TwinCAT 3 hash value of the datatype
+                return dtype.hashValue, dtype.typeHashValue, dtype.size
+            return (dtype.size, dtype.type, tuple(dtype.array),
+                tuple((s.name, s.type, s.offs, s.size) for s in dtype.subItems.values()))
         
-        # Get a list of symbols
-        symbols = list(AdsSymbolEntry.iter(symbolsData))
-
-        vars = Variables()
+        changed = set(self.dtypes.keys() ^ dtypes.keys())
+        changed.update(name for name, dtype in dtypes.items()
+            if name in self.dtypes and key(self.dtypes[name]) != key(dtype))
         
-        for symbol in symbols:
+        # Datatypes which refer to a changed datatype are changed as well
+        references = {name: {dtype.type}.union(s.type for s in dtype.subItems.values())
+            for name, dtype in dtypes.items()}
+        while True:
+            referring = {name for name, types in references.items()
+                if name not in changed and not types.isdisjoint(changed)}
+            if not referring:
+                return changed
+            changed |= referring
+
+    def addEquivalents(self, other, names):
+        """
+        Treat the entries of the datatypes names of other, a DatatypeSet
+        from which this set was not derived, as entries of this set, so the
+        layouts of existing Variables of other are cached as well. The
+        datatypes names must be unchanged between other and this set (see
+        changedDatatypes)
+        """
+        with self.lock, other.lock:
+            entries = list(other.dtypes.values()) + list(other.equivalents.values())
+            for dtype in entries:
+                if dtype.name in names and dtype is not self.dtypes.get(dtype.name):
+                    self.equivalents[id(dtype)] = dtype
+    
+    def _owns(self, dtype):
+        """
+        Whether dtype is the entry of its datatype in this set, or equivalent
+        to it
+        """
+        return (dtype is self.dtypes.get(dtype.name)
+            or self.equivalents.get(id(dtype)) is dtype)
+    
+    def layout(self, dtype):
+        """
+        Returns the layout.LeafLayout of the AdsDatatypeEntry dtype, which
+        is built once per datatype
+        """
+        with self.lock:
+            return self._datatypeLayout(dtype)
+    
+    def _datatypeLayout(self, dtype):
+        layout = self.layouts.get(dtype.name)
+        if layout is not None and self._owns(dtype):
+            return layout
         
-            # if symbol.type not in self.dtypes and symbol.type not in basictypes:
-            #     print(symbol.type, '!!', symbol.name, symbol.comment)
+        if dtype.array and dtype.type:
+            # Array: the layout of the item repeated for all indices
+            elements = 1
+            for lbound, n in dtype.array:
+                elements *= n
+            itemSize = dtype.size // elements
+            item = self._typeLayout(dtype.type, itemSize)
             
-            rest = symbol.name
-            parent = vars
-            while True:
-                name, dot, rest = rest.partition('.')
-                if rest == '':
-                    break
+            layout = LeafLayout()
+            dims = [range(lbound, lbound + n) for lbound, n in dtype.array]
+            for i, idx in enumerate(itertools.product(*dims)):
+                layout.extend(item, '[%s]' % ','.join(map(str, idx)), i * itemSize)
+                
+        elif dtype.subItems and not dtype.array:
+            layout = LeafLayout()
+            for subItem in dtype.subItems.values():
+                if subItem.type:
+                    member = self._typeLayout(subItem.type, subItem.size)
+                else:
+                    member = self._datatypeLayout(subItem)
+                layout.extend(member, '.' + subItem.name, subItem.offs)
+                
+        else:
+            # A datatype without members or items, e.g. a pointer
+            ctype = self.getCtype(dtype.name, dtype.size)
+            layout = LeafLayout() if ctype is None else LeafLayout.single(sizeof(ctype), ctype)
         
-                try:
-                    parent = getattr(parent, name)
-                except AttributeError:
-                    child = Variables()
-                    setattr(parent, name, child)
-                    parent = child
+        if self._owns(dtype):
+            self.layouts[dtype.name] = layout
+        return layout
+    
+    def _typeLayout(self, typename, size):
+        """
+        Layout of a member or item of the given type, resolved like Variable
+        resolves its datatype
+        """
+        dtype = self.dtypes.get(typename)
+        if dtype is not None:
+            if (dtype.type != '' and not dtype.array and not dtype.subItems
+                    and not dtype.name.startswith('POINTER TO ')):
+                # Alias e.g. enum
+                return self._typeLayout(dtype.type, size)
+            return self._datatypeLayout(dtype)
         
-                
-            setattr(parent, name, Variable(self, name, symbol, symbol.type, 0))
+        if typename in basictypes or re.match(r'STRING\((\d+)\)', typename):
+            ctype = self.getCtype(typename)
+            return LeafLayout.single(sizeof(ctype), ctype)
         
-        self.variables = vars
- 
+        # Unknown type
+        return LeafLayout()
+    
+    def getCodec(self, ctype):
+        """
+        Returns the codec.Codec that decodes ctype to Python objects, which
+        is compiled once per ctype
+        """
+        codec = self.codecs.get(ctype)
+        if codec is None:
+            from .codec import Codec
+            with self.lock:
+                codec = self.codecs.get(ctype)
+                if codec is None:
+                    codec = self.codecs[ctype] = Codec(ctype)
+        return codec
+    
     def getCtype(self, dtypename, size = None):
+        ctype = self.ctypes.get(dtypename)
+        if ctype is not None:
+            return ctype
+        
+        with self.lock:
+            return self._getCtype(dtypename, size)
+    
+    def _getCtype(self, dtypename, size):
         if dtypename in self.ctypes:
             return self.ctypes[dtypename]
         
@@ -696,14 +1045,445 @@ class AdsVariablesDefinition():
  
     
         self.ctypes[dtypename] = ctype
-        return ctype        
+        return ctype
+
+
+class TypeRegistry:
+    """
+    Process-wide cache of DatatypeSets by the digest of their datatype blob,
+    so AdsVariablesDefinitions of PLCs that run the same program share their
+    datatypes (see typeRegistry). DatatypeSets that are no longer used by
+    any definition are dropped.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sets = weakref.WeakValueDictionary() # digest -> DatatypeSet
+    
+    def get(self, datatypesData, previous = None):
+        """
+        Returns the DatatypeSet of datatypesData, which is created (from
+        previous, see DatatypeSet) if there is none yet
+        """
+        digest = hashlib.sha1(datatypesData).digest()
+        # The lock is held while parsing, so PLCs that connect concurrently
+        # wait for a single parse of their common program
+        with self._lock:
+            types = self._sets.get(digest)
+            if types is None:
+                types = self._sets[digest] = DatatypeSet(datatypesData, previous)
+            return types
+    
+    def __len__(self):
+        return len(self._sets)
+
+# The default registry of AdsVariablesDefinition
+typeRegistry = TypeRegistry()
+
+
+class AdsVariablesDefinition():
+    """
+    The symbols and datatypes of a PLC, and the tree of Variables (in
+    self.variables) through which they are read and written.
+    
+    timeout: time [s] within which each ADS request of this definition and
+      its variables must complete, or None for the timeout of the port (see
+      cpyads.deadline). Install a resilience.ResilientAdsDll to retry
+      requests that fail within this time
+    registry: the TypeRegistry from which the datatypes (a DatatypeSet) are
+      obtained, so they are shared with other definitions of PLCs running
+      the same program. Use None to keep the datatypes private to this
+      definition
+    """
+    def __init__(self, address, timeout = None, registry = typeRegistry):
+        self.timeout = timeout
+        self.registry = registry
+        # Lock protecting the symbols and the variable tree
+        self._lock = threading.RLock()
+        self.symbols = OrderedDict() # name -> AdsSymbolEntry
+        self.amsAddress = address
+        self.variables = Variables()
+
+        self.uploadInfo, symbolsData, datatypesData = self._upload()
+        
+        # The parsed datatypes and their ctypes
+        self.types = self._datatypeSet(datatypesData)
+        
+        for symbol in AdsSymbolEntry.iter(symbolsData):
+        
+            # if symbol.type not in self.dtypes and symbol.type not in basictypes:
+            #     print(symbol.type, '!!', symbol.name, symbol.comment)
+            
+            self._addSymbol(symbol)
+        
+        self._symbolsDigest = hashlib.sha1(symbolsData).digest()
+    
+    def _datatypeSet(self, datatypesData, previous = None):
+        if self.registry is None:
+            return DatatypeSet(datatypesData, previous)
+        return self.registry.get(datatypesData, previous)
+    
+    # The datatypes, ctypes, codecs and layouts are those of self.types
+    
+    @property
+    def dtypes(self):
+        return self.types.dtypes
+    
+    @property
+    def ctypes(self):
+        return self.types.ctypes
+    
+    @property
+    def codecs(self):
+        return self.types.codecs
+    
+    @property
+    def layouts(self):
+        return self.types.layouts
+    
+    @property
+    def _datatypesDigest(self):
+        return self.types.digest
+    
+    def _upload(self):
+        """
+        Read the symbol upload info, and the symbol and datatype blobs
+        """
+        # Get symbol upload info; read symbol info and data types
+        symbolUploadInfo = tuple(self.adsRead(ADSIGRP_SYM_UPLOADINFO2, 0, c_uint32 * 6))
+        
+        nSymbols, nSymSize, nDatatypes, nDatatypeSize, nMaxDynSymbols, nUsedDynSymbols = symbolUploadInfo
+        
+        symbolsData = self.adsRead(ADSIGRP_SYM_UPLOAD, 0, c_char * nSymSize).raw
+        datatypesData = self.adsRead(ADSIGRP_SYM_DT_UPLOAD, 0, c_char * nDatatypeSize).raw
+        
+        return symbolUploadInfo, symbolsData, datatypesData
+    
+    # All ADS requests of this definition and its Variables go through the
+    # methods below, so subclasses can redirect them. Each request must
+    # complete within self.timeout [s] if it is set (see cpyads.deadline)
+    
+    def adsRead(self, indexGroup, indexOffset, ctype):
+        with deadline(self.timeout):
+            return cpyads.adsSyncReadReq(self.amsAddress, indexGroup, indexOffset, ctype)
+    
+    def adsReadInto(self, indexGroup, indexOffset, data):
+        with deadline(self.timeout):
+            cpyads.adsSyncReadReqInto(self.amsAddress, indexGroup, indexOffset, data)
+    
+    def adsWrite(self, indexGroup, indexOffset, data):
+        with deadline(self.timeout):
+            cpyads.adsSyncWriteReq(self.amsAddress, indexGroup, indexOffset, data)
+    
+    def adsReadWriteInto(self, indexGroup, indexOffset, data, writeData):
+        with deadline(self.timeout):
+            cpyads.adsSyncReadWriteReqInto(self.amsAddress, indexGroup, indexOffset, data, writeData)
+    
+    def _addSymbol(self, symbol):
+        """
+        Add symbol to self.symbols and add a Variable for it to the variable
+        tree
+        """
+        self.symbols[symbol.name] = symbol
+        
+        rest = symbol.name
+        parent = self.variables
+        while True:
+            name, dot, rest = rest.partition('.')
+            if rest == '':
+                break
+    
+            try:
+                parent = getattr(parent, name)
+            except AttributeError:
+                child = Variables()
+                setattr(parent, name, child)
+                parent = child
+    
+            
+        setattr(parent, name, Variable(self, name, symbol, symbol.type, 0))
+    
+    def _removeSymbol(self, symbol):
+        """
+        Remove symbol from self.symbols and from the variable tree (including
+        Variables nodes that become empty), and invalidate it
+        """
+        del self.symbols[symbol.name]
+        symbol.valid = False
+        
+        names = symbol.name.split('.')
+        nodes = [self.variables]
+        for name in names[:-1]:
+            nodes.append(getattr(nodes[-1], name))
+        
+        for node, name in reversed(list(zip(nodes, names))):
+            delattr(node, name)
+            if node.__dict__:
+                break
+    
+    def refresh(self):
+        """
+        Update this definition after the PLC program was changed (e.g. by an
+        online change or a download and restart).
+        
+        The symbols and datatypes are uploaded again and compared with the
+        current ones; only the datatypes and symbols that were changed are
+        parsed into new ctypes and Variables. Variables of unchanged symbols
+        remain valid. Variables of changed or removed symbols are
+        invalidated: using them raises InvalidatedVariableError; they need to
+        be obtained again from self.variables.
+        
+        Returns a RefreshResult of the names of added, removed and changed
+        symbols and the names of the changed datatypes
+        """
+        with self._lock:
+            uploadInfo, symbolsData, datatypesData = self._upload()
+            symbolsDigest = hashlib.sha1(symbolsData).digest()
+            datatypesDigest = hashlib.sha1(datatypesData).digest()
+            
+            if (uploadInfo == self.uploadInfo and symbolsDigest == self._symbolsDigest
+                    and datatypesDigest == self._datatypesDigest):
+                return RefreshResult([], [], [], [])
+            
+            changedDatatypes = set()
+            rebind = False
+            if datatypesDigest != self._datatypesDigest:
+                # A new DatatypeSet reuses the unchanged datatypes of the
+                # current one. If another PLC already runs the new program,
+                # its DatatypeSet is used: the Variables of unchanged
+                # symbols are then created again from its entries and
+                # ctypes, and Variables that were obtained before keep their
+                # own ones
+                types = self._datatypeSet(datatypesData, self.types)
+                changedDatatypes = self.types.changedDatatypes(types.dtypes)
+                rebind = any(types.dtypes.get(name) is not dtype
+                    for name, dtype in self.types.dtypes.items() if name not in changedDatatypes)
+                if rebind:
+                    types.addEquivalents(self.types, types.dtypes.keys() - changedDatatypes)
+                self.types = types
+            
+            added, removed, changed = [], [], []
+            symbols = OrderedDict((s.name, s) for s in AdsSymbolEntry.iter(symbolsData))
+            
+            for name, old in list(self.symbols.items()):
+                new = symbols.get(name)
+                if new is None:
+                    removed.append(name)
+                    self._removeSymbol(old)
+                elif ((old.iGroup, old.iOffs, old.size, old.type) != (new.iGroup, new.iOffs, new.size, new.type)
+                        or old.type in changedDatatypes):
+                    changed.append(name)
+                    self._removeSymbol(old)
+                else:
+                    # Keep the existing entry
+                    symbols[name] = old
+            
+            # Rebuild self.symbols in the order of the new upload
+            unchanged = self.symbols
+            self.symbols = OrderedDict()
+            for name, symbol in symbols.items():
+                if name in unchanged:
+                    if rebind:
+                        self._addSymbol(symbol)
+                    else:
+                        self.symbols[name] = symbol
+                else:
+                    if name not in changed:
+                        added.append(name)
+                    self._addSymbol(symbol)
+            
+            self.uploadInfo = uploadInfo
+            self._symbolsDigest = symbolsDigest
+            
+            return RefreshResult(added, removed, changed, sorted(changedDatatypes))
+    
+    def getVariable(self, path):
+        """
+        Look up a variable by its path, e.g. 'MAIN.axes[2].status.state' or
+        'GVL.matrix[1,3]'. Raises KeyError if the path does not exist
+        """
+        node = self.variables
+        p = 0
+        for match in _pathElement.finditer(path):
+            dot, name, index = match.groups()
+            if match.start() != p:
+                break
+            if (name is None and p == 0) or (name is not None and (dot == '') != (p == 0)):
+                break
+            p = match.end()
+            try:
+                if name is not None:
+                    node = getattr(node, name)
+                else:
+                    node = node[tuple(int(i) for i in index.split(','))]
+            except (AttributeError, IndexError, TypeError, ValueError):
+                raise KeyError(path)
+        
+        if p != len(path) or not isinstance(node, Variable):
+            raise KeyError(path)
+        return node
  
-def getVariables(netId = None, port = 851):
+    def leaves(self, var):
+        """
+        Returns a layout.LeafLayout of the leaves (simple variables) of
+        var, with their paths and offsets relative to var. For a simple
+        variable, this is a single leaf with an empty path.
+        
+        The layout of each datatype is built once from the datatype entries,
+        so this is much faster than iterating over the Variables of a large
+        structure or array.
+        """
+        info = ~var
+        if info.datatype is None:
+            if info.ctype is None:
+                return LeafLayout()
+            return LeafLayout.single(sizeof(info.ctype), info.ctype)
+        
+        return self.types.layout(info.datatype)
+    
+    def getCodec(self, ctype):
+        """
+        Returns the codec.Codec that decodes ctype to Python objects, which
+        is compiled once per ctype
+        """
+        return self.types.getCodec(ctype)
+    
+    def getCtype(self, dtypename, size = None):
+        """
+        Returns the ctype of the datatype dtypename, which is generated once
+        per datatype
+        """
+        return self.types.getCtype(dtypename, size)
+    
+def readSum(variables):
+    """
+    Read a list of variables of the same PLC in a single sum read request
+    (ADSIGRP_SUMUP_READ), e.g. to sample a set of variables consistently
+    and with one round trip. More than MAX_SUM_REQUESTS variables are read
+    in several requests.
+    
+    Returns a list of the values, in the order of variables, like calling
+    each variable
+    """
+    infos = [~var for var in variables]
+    if not infos:
+        return []
+    definition = infos[0].variablesDefinition
+    reads = []
+    for info in infos:
+        if info.variablesDefinition is not definition:
+            raise ValueError('All variables must be variables of the same PLC')
+        if not info.symbol.valid:
+            raise InvalidatedVariableError(
+                'Symbol %s was changed or removed from the PLC program' % info.symbol.name)
+        assert info.ctype is not None
+        reads.append((info.symbol.iGroup, info.symbol.iOffs + info.offset, sizeof(info.ctype)))
+    
+    return [ctypesValue(info.ctype.from_buffer_copy(data))
+        for info, data in zip(infos, readSumRaw(definition, reads))]
+
+def readSumRaw(definition, reads):
+    """
+    Read the raw data at a list of (indexGroup, indexOffset, length)
+    addresses of the PLC of definition, in sum read requests
+    (ADSIGRP_SUMUP_READ) of at most MAX_SUM_REQUESTS reads.
+    
+    Returns a list of bytes, in the order of reads
+    """
+    results = []
+    for first in range(0, len(reads), MAX_SUM_REQUESTS):
+        chunk = reads[first:first + MAX_SUM_REQUESTS]
+        request = b''.join(struct.pack('<3L', *read) for read in chunk)
+        request = (c_ubyte * len(request)).from_buffer_copy(request)
+        response = (c_ubyte * (4 * len(chunk) + sum(length for _, _, length in chunk)))()
+        definition.adsReadWriteInto(ADSIGRP_SUMUP_READ, len(chunk), response, request)
+        
+        # The response holds the error codes of all reads followed by the
+        # data of all reads
+        view = memoryview(response).cast('B')
+        offset = 4 * len(chunk)
+        for error, (_, _, length) in zip(struct.unpack_from('<%dL' % len(chunk), response), chunk):
+            cpyads.checkError(error)
+            results.append(bytes(view[offset:offset + length]))
+            offset += length
+    return results
+
+def writeSumRaw(definition, writes):
+    """
+    Write raw data to a list of (indexGroup, indexOffset, data) addresses of
+    the PLC of definition, where data is any contiguous object supporting
+    the buffer protocol, in sum write requests (ADSIGRP_SUMUP_WRITE) of at
+    most MAX_SUM_REQUESTS writes. A single write is sent as a plain write
+    request.
+    
+    Returns the number of requests
+    """
+    requests = 0
+    for first in range(0, len(writes), MAX_SUM_REQUESTS):
+        chunk = writes[first:first + MAX_SUM_REQUESTS]
+        views = [memoryview(data).cast('B') for _, _, data in chunk]
+        if len(chunk) == 1:
+            indexGroup, indexOffset, _ = chunk[0]
+            view = views[0]
+            if view.readonly:
+                data = (c_ubyte * len(view)).from_buffer_copy(view)
+            else:
+                data = (c_ubyte * len(view)).from_buffer(view)
+            definition.adsWrite(indexGroup, indexOffset, data)
+        else:
+            # The request holds the addresses and lengths of all writes
+            # followed by the data of all writes, the response the error
+            # codes of all writes
+            request = bytearray()
+            for (indexGroup, indexOffset, _), view in zip(chunk, views):
+                request += struct.pack('<3L', indexGroup, indexOffset, len(view))
+            for view in views:
+                request += view
+            response = (c_uint32 * len(chunk))()
+            definition.adsReadWriteInto(ADSIGRP_SUMUP_WRITE, len(chunk), response,
+                (c_ubyte * len(request)).from_buffer(request))
+            for error in response:
+                cpyads.checkError(error)
+        requests += 1
+    return requests
+
+def readParallel(variables, workers = 4):
+    """
+    Read a list of variables using a pool of worker threads. Each worker
+    opens its own ADS port, so the reads are performed concurrently rather than
+    queued on a single port. This is useful when the device does not support
+    sum commands, or when the variables are on different devices.
+    
+    Returns a list of the values, in the order of variables
+    """
+    ports = []
+    portsLock = threading.Lock()
+    
+    def openWorkerPort():
+        port = cpyads.adsPortOpenEx()
+        with portsLock:
+            ports.append(port)
+        cpyads.setThreadPort(port)
+    
+    try:
+        with ThreadPoolExecutor(workers, initializer=openWorkerPort) as executor:
+            return list(executor.map(Variable.__call__, variables))
+    finally:
+        for port in ports:
+            cpyads.adsPortCloseEx(port)
+ 
+def getVariables(netId = None, port = 851, timeout = None):
+    """
+    Open the ADS port and return the variable tree of the PLC at netId
+    (default: the local system), port.
+    
+    timeout: time [s] within which each ADS request must complete, or None
+      for the timeout of the port (see AdsVariablesDefinition)
+    """
     cpyads.adsPortOpen()
     
     addr = cpyads.SAmsAddr(netId, port)
     
-    return AdsVariablesDefinition(addr).variables
+    return AdsVariablesDefinition(addr, timeout).variables
     
     
 
@@ -34,6 +34,8 @@ if __package__ is None:
     import pyads
     
 from . import adssymbols
+from .pathindex import PathIndex
+from .trend import Trend
 from PySide import QtCore, QtGui
 
 
@@ -54,6 +56,19 @@ class TreeItem:
         self.name = name
         self.variable = variable
         
+    def getPath(self):
+        """
+        Returns the path of the variable e.g. 'MAIN.axes[2].position'
+        """
+        path = ''
+        item = self
+        while item.parent is not None:
+            if path and not path.startswith('['):
+                path = '.' + path
+            path = item.name + path
+            item = item.parent
+        return path
+        
     def getChildren(self):
         if self.children is None:
             children = []
@@ -69,6 +84,34 @@ class TreeItem:
             
         return self.children
 
+class FilterItem(TreeItem):
+    """
+    Item in the variable tree filtered by a search. Items that match the
+    search have all their children, like a TreeItem; their ancestors only
+    have the children that lead to a match, which are added by
+    FilteredVariableModel.addMatches
+    """
+    def __init__(self, parent, row, name, variable, match):
+        super().__init__(parent, row, name, variable)
+        self.match = match
+        self.filtered = []
+        self.byName = {}
+    
+    def getChildren(self):
+        if self.match:
+            return super().getChildren()
+        return self.filtered
+    
+    def getChild(self, name):
+        """
+        Returns the variable of the child named name (as shown in the tree,
+        e.g. 'axis' or '[1,2]')
+        """
+        if name.startswith('['):
+            return self.variable[tuple(int(i) for i in name[1:-1].split(','))]
+        return getattr(self.variable, name)
+    
+
 class AdsVariableModel(QtCore.QAbstractItemModel):
     """
     Tree model of an ADS variable tree fit for the QT model-view framework
@@ -137,33 +180,251 @@ class AdsVariableModel(QtCore.QAbstractItemModel):
             parent = parent.internalPointer()
         return len(parent.getChildren())
  
+
+
+class FilteredVariableModel(AdsVariableModel):
+    """
+    Tree model of the variables that match a search, and their ancestors.
+    Matches (node indices of a PathIndex) are added while the search
+    proceeds; only the variables of the matches and their ancestors are
+    created
+    """
+    def __init__(self, definition, pathIndex):
+        super().__init__(definition.variables)
+        self.root = FilterItem(None, 0, '', definition.variables, False)
+        self.pathIndex = pathIndex
+    
+    def addMatches(self, nodes):
+        """
+        Add the nodes of the path index to the tree. Returns the indices of
+        the ancestors that were added, which the view should expand
+        """
+        added = []
+        for node in nodes:
+            names = self.pathIndex.names(node)
+            item = self.root
+            index = QtCore.QModelIndex()
+            for depth, name in enumerate(names):
+                child = item.byName.get(name)
+                if child is None:
+                    row = len(item.filtered)
+                    self.beginInsertRows(index, row, row)
+                    child = FilterItem(item, row, name, item.getChild(name),
+                        depth == len(names) - 1)
+                    item.filtered.append(child)
+                    item.byName[name] = child
+                    self.endInsertRows()
+                    if not child.match:
+                        added.append(self.createIndex(row, 0, child))
+                item = child
+                index = self.createIndex(item.row, 0, item)
+        return added
  
+
+def _definition(node):
+    """
+    Returns the AdsVariablesDefinition of the variables in the variable tree
+    node
+    """
+    if isinstance(node, adssymbols.Variable):
+        return (~node).variablesDefinition
+    for name, child in node:
+        definition = _definition(child)
+        if definition is not None:
+            return definition
+
+
 class AdsVariableBrowser(QtGui.QTreeView):
     def __init__(self, parent, rootVariable, updateInterval):
         """
         updateInterval: update interval [s]
         """
         super().__init__(parent)
-        model = AdsVariableModel(rootVariable)
-        self.setModel(model)
+        self.rootVariable = rootVariable
+        self.variableModel = AdsVariableModel(rootVariable)
+        self.setModel(self.variableModel)
+        self.pathIndex = None
+        self.search = None
     
         def update():
             # Signal all data (may) have changed
-            model.dataChanged.emit(QtCore.QModelIndex(), QtCore.QModelIndex())
+            self.model().dataChanged.emit(QtCore.QModelIndex(), QtCore.QModelIndex())
         
         self.timer = QtCore.QTimer()
         self.timer.timeout.connect(update)
         self.timer.start(updateInterval * 1000)
         
+        # Results of a search are added whenever the GUI is idle
+        self.searchTimer = QtCore.QTimer()
+        self.searchTimer.timeout.connect(self._searchStep)
+        
+        self.setSelectionMode(QtGui.QAbstractItemView.ExtendedSelection)
+        
+    def selectedVariables(self):
+        """
+        Returns a list of (path, variable) of the selected numeric variables
+        (e.g. to plot them)
+        """
+        selected = []
+        for index in self.selectionModel().selectedRows():
+            item = index.internalPointer()
+            if not isinstance(item.variable, adssymbols.Variable):
+                continue
+            ctype = (~item.variable).ctype
+            if getattr(ctype, '_type_', None) in tuple('bBhHiIlLqQfd?'):
+                selected.append((item.getPath(), item.variable))
+        return selected
+        
+    def setFilter(self, query, limit=1000):
+        """
+        Show only the variables of which the path contains all (whitespace
+        separated) terms of query, and their ancestors. Shows all variables
+        if the query is empty.
+        
+        The search runs incrementally while the GUI is idle, on a path index
+        of all variables of the PLC that is built in a background thread on
+        the first search. At most limit matches are shown.
+        """
+        self.searchTimer.stop()
+        self.search = None
+        if not query.strip():
+            self.setModel(self.variableModel)
+            return
+        
+        definition = _definition(self.rootVariable)
+        if self.pathIndex is None:
+            self.pathIndex = PathIndex(definition).start()
+        self.setModel(FilteredVariableModel(definition, self.pathIndex))
+        self.search = self.pathIndex.search(query, limit)
+        self.searchTimer.start(0)
+    
+    def _searchStep(self):
+        try:
+            nodes = next(self.search)
+        except StopIteration:
+            self.searchTimer.stop()
+            return
+        for index in self.model().addMatches(nodes):
+            self.expand(index)
+
+
+class AdsVariableSearchBrowser(QtGui.QWidget):
+    """
+    AdsVariableBrowser with a search box that filters the variables as the
+    user types
+    """
+    def __init__(self, parent, rootVariable, updateInterval):
+        super().__init__(parent)
+        self.searchBox = QtGui.QLineEdit(self)
+        self.searchBox.setPlaceholderText('Search')
+        self.browser = AdsVariableBrowser(self, rootVariable, updateInterval)
+        self.searchBox.textChanged.connect(self.browser.setFilter)
+        self.trendButton = QtGui.QPushButton('Trend', self)
+        self.trendButton.clicked.connect(self.trendSelected)
+        self.trendPanes = []
+        
+        layout = QtGui.QVBoxLayout(self)
+        layout.addWidget(self.searchBox)
+        layout.addWidget(self.browser)
+        layout.addWidget(self.trendButton)
+    
+    def trendSelected(self):
+        """
+        Open a TrendPane of the selected numeric variables
+        """
+        selected = self.browser.selectedVariables()
+        if selected:
+            paths, variables = zip(*selected)
+            pane = TrendPane(None, variables, paths)
+            pane.show()
+            self.trendPanes.append(pane)
+
+
+class TrendPlot(QtGui.QWidget):
+    """
+    Plot of the samples of a Trend, drawn from the min/max envelope of the
+    samples with one bin per pixel column, so drawing takes the same time
+    regardless of the number of samples
+    
+    duration: time span [s] to plot, default all samples in the trend
+    """
+    colors = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd',
+        '#8c564b', '#e377c2', '#7f7f7f', '#bcbd22', '#17becf']
+    
+    def __init__(self, parent, trend, updateInterval=0.1, duration=None):
+        super().__init__(parent)
+        self.trend = trend
+        self.duration = duration
+        self.setMinimumSize(300, 150)
+        
+        self.timer = QtCore.QTimer()
+        self.timer.timeout.connect(self.update)
+        self.timer.start(updateInterval * 1000)
+    
+    def paintEvent(self, event):
+        painter = QtGui.QPainter(self)
+        painter.fillRect(self.rect(), QtCore.Qt.white)
+        width, height = self.width(), self.height()
+        
+        times, signals = self.trend.envelope(width, self.duration)
+        if times:
+            low = min(min(mins) for mins, maxs in signals)
+            high = max(max(maxs) for mins, maxs in signals)
+            if high == low:
+                low, high = low - 1, high + 1
+            tscale = (width - 1) / max(times[-1] - times[0], 1e-9)
+            vscale = (height - 1) / (high - low)
+            
+            for i, (mins, maxs) in enumerate(signals):
+                # Zigzag through the minimum and maximum of each bin
+                points = []
+                for t, vmin, vmax in zip(times, mins, maxs):
+                    x = (t - times[0]) * tscale
+                    points.append(QtCore.QPointF(x, (high - vmin) * vscale))
+                    points.append(QtCore.QPointF(x, (high - vmax) * vscale))
+                painter.setPen(QtGui.QColor(self.colors[i % len(self.colors)]))
+                painter.drawPolyline(QtGui.QPolygonF(points))
+            
+            painter.setPen(QtCore.Qt.black)
+            painter.drawText(4, height - 4, '%g' % low)
+            painter.drawText(4, 14, '%g' % high)
+        
+        # Legend
+        for i, name in enumerate(self.trend.names):
+            painter.setPen(QtGui.QColor(self.colors[i % len(self.colors)]))
+            painter.drawText(width // 2, 14 * (i + 1), name)
+    
+
+class TrendPane(QtGui.QWidget):
+    """
+    Live trend of a list of numeric variables, sampled every period [s] on
+    a background thread (see trend.Trend). The last duration [s] of samples
+    is kept and plotted
+    """
+    def __init__(self, parent, variables, names=None, period=0.01, duration=600,
+            updateInterval=0.1):
+        super().__init__(parent)
+        self.trend = Trend(variables, period, duration, names)
+        self.plot = TrendPlot(self, self.trend, updateInterval)
+        self.setWindowTitle(', '.join(self.trend.names))
+        
+        layout = QtGui.QVBoxLayout(self)
+        layout.addWidget(self.plot)
+        self.trend.start()
+    
+    def closeEvent(self, event):
+        self.trend.stop()
+        super().closeEvent(event)
+        
 
 
 if __name__ == '__main__':
     v = pyads.adssymbols.getVariables()
 
-    browser = AdsVariableBrowser(None, v, .1)
+    browser = AdsVariableSearchBrowser(None, v, .1)
     browser.show()
 
 
-__all__ = ['AdsVariableBrowser']
+__all__ = ['AdsVariableBrowser', 'AdsVariableSearchBrowser', 'TrendPane']
 
 
@@ -0,0 +1,177 @@
+# Copyright (c) 2018, DEMCON advanced mechatronics
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# 
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+
+"""
+Client-side change detection for polled variables, for targets on which
+device notifications are not available
+"""
+
+from .adssymbols import ctypesValue
+from bisect import bisect_right
+from collections import namedtuple
+from ctypes import c_ubyte, sizeof
+import numbers
+import time
+
+
+Change = namedtuple('Change', 'path value')
+
+
+class _Region:
+    """
+    A polled variable: its address, leaves and the bytes of the previous poll
+    """
+    def __init__(self, name, var):
+        info = ~var
+        self.definition = info.variablesDefinition
+        self.indexGroup = info.symbol.iGroup
+        self.indexOffset = info.symbol.iOffs + info.offset
+        self.ctype = c_ubyte * sizeof(info.ctype)
+        self.leaves = [leaf._replace(path=name + leaf.path)
+            for leaf in self.definition.leaves(var)]
+        self.leaves.sort(key=lambda leaf: leaf.offset)
+        self.starts = [leaf.offset for leaf in self.leaves]
+        self.previous = None
+        self.spare = bytearray(sizeof(self.ctype))
+
+    def read(self):
+        """
+        Read into the spare buffer, which is returned
+        """
+        data = self.spare
+        self.definition.adsReadInto(self.indexGroup, self.indexOffset, self.ctype.from_buffer(data))
+        return data
+
+    def changedLeaves(self, data, blockSize):
+        """
+        Returns the leaves whose bytes differ between data and the bytes of
+        the previous poll. The regions are compared in blocks of blockSize
+        bytes first; only the leaves in blocks that differ are compared.
+        """
+        previous = self.previous
+        if previous is None:
+            return self.leaves
+
+        old, new = memoryview(previous), memoryview(data)
+        changed = []
+        last = -1 # Index of the last leaf that was compared
+        for start in range(0, len(data), blockSize):
+            end = start + blockSize
+            if old[start:end] == new[start:end]:
+                continue
+
+            # The first leaf that overlaps this block may start before it
+            i = max(bisect_right(self.starts, start) - 1, last + 1)
+            while i < len(self.leaves) and self.starts[i] < end:
+                leaf = self.leaves[i]
+                o = leaf.offset
+                if old[o:o + leaf.size] != new[o:o + leaf.size]:
+                    changed.append(leaf)
+                last = i
+                i += 1
+        return changed
+
+
+class ChangeStream:
+    """
+    Polls a set of variables and reports the (leaf) variables that changed.
+
+    Each poll reads the raw bytes of each variable (a simple variable, or a
+    structure or array as a whole) in a single request, and compares them
+    with the bytes of the previous poll: first the complete buffer, then the
+    blocks of the buffer, then the leaves in the blocks that differ. Only
+    the leaves whose bytes changed are decoded.
+
+    variables: dict of name -> Variable, or a list of Variables (named by
+      their name). Leaves are named by appending their member and index path
+      to the name, e.g. 'axis.status.errorId' or 'table[3].x'
+    deadbands: dict of leaf path -> deadband. A numeric leaf with a deadband
+      is only reported when its value differs at least deadband from the
+      last reported value
+    blockSize: size [bytes] of the blocks in which buffers are compared
+    """
+    def __init__(self, variables, deadbands=None, blockSize=64):
+        if not isinstance(variables, dict):
+            variables = {(~var).name: var for var in variables}
+
+        self.regions = [_Region(name, var) for name, var in variables.items()]
+        self.blockSize = blockSize
+        self.deadbands = dict(deadbands or {})
+        self._reported = {} # path -> last reported value, for leaves with a deadband
+
+        paths = {leaf.path for region in self.regions for leaf in region.leaves}
+        unknown = set(self.deadbands) - paths
+        if unknown:
+            raise ValueError('Deadband for unknown variable(s) %s' % ', '.join(sorted(unknown)))
+
+    def poll(self):
+        """
+        Read all variables and return a list of Change(path, value) tuples
+        for the leaves that changed since the previous poll. The first poll
+        reports all leaves.
+        """
+        changes = []
+        for region in self.regions:
+            data = region.read()
+            if data == region.previous:
+                continue
+
+            for leaf in region.changedLeaves(data, self.blockSize):
+                value = ctypesValue(leaf.ctype.from_buffer_copy(data, leaf.offset))
+                deadband = self.deadbands.get(leaf.path)
+                if deadband is not None and isinstance(value, numbers.Real):
+                    reported = self._reported.get(leaf.path)
+                    if reported is not None and abs(value - reported) < deadband:
+                        continue
+                    self._reported[leaf.path] = value
+                changes.append(Change(leaf.path, value))
+
+            # Swap buffers
+            region.spare = region.previous or bytearray(len(data))
+            region.previous = data
+        return changes
+
+    def stream(self, period):
+        """
+        Poll every period seconds. Yields the (non-empty) lists of changes
+        """
+        deadline = time.monotonic()
+        while True:
+            changes = self.poll()
+            if changes:
+                yield changes
+
+            deadline += period
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                # Too late, do not try to catch up
+                deadline = time.monotonic()
@@ -0,0 +1,403 @@
+# Copyright (c) 2018, DEMCON advanced mechatronics
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# 
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+
+"""
+Command line tool to dump variables of a PLC to a file and to restore them,
+e.g. to back up and restore machine parameters:
+
+    python -m ads dump 'GVL_Param*' -o params.jsonl
+    python -m ads restore params.jsonl
+
+Symbols are selected by (case insensitive) fnmatch patterns. The selected
+symbols are read in as few requests as possible: symbols that are close
+together in the same index group are read in a single request. The output
+is streamed in one of the formats:
+
+jsonl: a line {"path": ..., "value": ...} per leaf (simple variable)
+csv: a row path,value per leaf, after a header row
+raw: per symbol the (little endian) length of its name as 16 bit integer,
+  the name (UTF-8), the size of the data as 32 bit integer and the raw data
+
+On restore, symbols of which all leaves are restored are written as a whole,
+data that is adjacent in the PLC memory is merged and all data is written in
+sum write requests. A summary of the throughput is printed to stderr.
+"""
+
+from . import adssymbols, cpyads
+from .adssymbols import ctypesValue, PLCString
+from ctypes import Array, c_bool, c_char, c_double, c_float, c_ubyte
+import argparse
+import csv
+import fnmatch
+import json
+import os
+import struct
+import sys
+import time
+
+
+FORMATS = ('jsonl', 'csv', 'raw')
+
+
+def selectSymbols(definition, patterns):
+    """
+    Returns the symbols of definition of which the name matches any of the
+    patterns, ordered by index group and offset
+    """
+    patterns = [p.upper() for p in patterns]
+    symbols = [s for name, s in definition.symbols.items()
+        if any(fnmatch.fnmatchcase(name.upper(), p) for p in patterns)]
+    symbols.sort(key=lambda s: (s.iGroup, s.iOffs))
+    return symbols
+
+def spans(symbols, maxGap, maxSize):
+    """
+    Group symbols (ordered by index group and offset) into spans that are
+    read in a single request. Yields (indexGroup, indexOffset, size, symbols)
+    """
+    current = None
+    for symbol in symbols:
+        if (current is not None and symbol.iGroup == current[0]
+                and symbol.iOffs <= current[1] + current[2] + maxGap
+                and max(current[2], symbol.iOffs + symbol.size - current[1]) <= maxSize):
+            current[2] = max(current[2], symbol.iOffs + symbol.size - current[1])
+            current[3].append(symbol)
+        else:
+            if current is not None:
+                yield tuple(current)
+            current = [symbol.iGroup, symbol.iOffs, symbol.size, [symbol]]
+    if current is not None:
+        yield tuple(current)
+
+def encodeValue(ctype, data, offset):
+    """
+    The value of the leaf of ctype at offset in data, as a JSON compatible
+    value: raw data (of unknown types) as a hex string
+    """
+    value = ctypesValue(ctype.from_buffer_copy(data, offset))
+    if isinstance(value, Array):
+        return bytes(value).hex()
+    if isinstance(value, bytes):
+        return value.decode('latin-1')
+    return value
+
+def decodeValue(ctype, value):
+    """
+    The inverse of encodeValue; value may also be a string (read from csv).
+    Returns the data as bytes
+    """
+    if issubclass(ctype, Array):
+        return bytes.fromhex(value)
+    if issubclass(ctype, PLCString):
+        return bytes(ctype(value))
+    if ctype is c_char:
+        return value.encode('latin-1')
+    if isinstance(value, str):
+        if ctype is c_bool:
+            value = value in ('True', 'true', '1')
+        elif ctype in (c_float, c_double):
+            value = float(value)
+        else:
+            value = int(value)
+    return bytes(ctype(value))
+
+
+class Statistics:
+    def __init__(self, action):
+        self.action = action
+        self.symbols = 0
+        self.leaves = 0
+        self.bytes = 0
+        self.requests = 0
+        self.start = time.perf_counter()
+
+    def report(self, file=None):
+        seconds = max(time.perf_counter() - self.start, 1e-9)
+        print('%s: %d symbols, %d leaves, %d bytes in %d requests, %.3f s '
+            '(%.0f leaves/s, %.3f MB/s)' % (self.action, self.symbols,
+            self.leaves, self.bytes, self.requests, seconds,
+            self.leaves / seconds, self.bytes / seconds / 1e6), file=file or sys.stderr)
+
+
+def dump(definition, patterns, output, format='jsonl', maxGap=64, maxSize=65536):
+    """
+    Dump the symbols matching patterns to the text (jsonl, csv) or binary
+    (raw) file object output. Returns the Statistics
+    """
+    statistics = Statistics('dump')
+    writer = csv.writer(output) if format == 'csv' else None
+    if writer is not None:
+        writer.writerow(['path', 'value'])
+
+    selected = selectSymbols(definition, patterns)
+    for indexGroup, indexOffset, size, symbols in spans(selected, maxGap, maxSize):
+        data = bytearray(size)
+        definition.adsReadInto(indexGroup, indexOffset, (c_ubyte * size).from_buffer(data))
+        statistics.requests += 1
+        statistics.bytes += size
+
+        for symbol in symbols:
+            start = symbol.iOffs - indexOffset
+            statistics.symbols += 1
+            if format == 'raw':
+                name = symbol.name.encode('utf-8')
+                output.write(struct.pack('<H', len(name)) + name
+                    + struct.pack('<L', symbol.size) + data[start:start + symbol.size])
+                continue
+
+            layout = definition.leaves(definition.getVariable(symbol.name))
+            for path, offset, leafSize, ctype in layout:
+                value = encodeValue(ctype, data, start + offset)
+                if writer is not None:
+                    writer.writerow([symbol.name + path, value])
+                else:
+                    output.write(json.dumps({'path': symbol.name + path, 'value': value}) + '\n')
+            statistics.leaves += len(layout)
+    return statistics
+
+
+class _WriteBatch:
+    """
+    Collects writes, merges adjacent data and writes it in sum write requests
+    """
+    def __init__(self, definition, statistics, size):
+        self.definition = definition
+        self.statistics = statistics
+        self.size = size
+        self.pending = [] # (indexGroup, indexOffset, data)
+        self.pendingBytes = 0
+
+    def add(self, indexGroup, indexOffset, data):
+        self.pending.append((indexGroup, indexOffset, data))
+        self.pendingBytes += len(data)
+        if self.pendingBytes >= self.size:
+            self.flush()
+
+    def flush(self):
+        self.pending.sort(key=lambda w: w[:2])
+        merged = []
+        for indexGroup, indexOffset, data in self.pending:
+            if (merged and merged[-1][0] == indexGroup
+                    and merged[-1][1] + len(merged[-1][2]) == indexOffset):
+                merged[-1][2].extend(data)
+            else:
+                merged.append((indexGroup, indexOffset, bytearray(data)))
+        self.statistics.requests += adssymbols.writeSumRaw(self.definition, merged)
+        self.statistics.bytes += sum(len(data) for _, _, data in merged)
+        self.pending = []
+        self.pendingBytes = 0
+
+
+def _covers(layout, size):
+    """
+    Whether the leaves of layout cover all size bytes, i.e. the datatype has
+    no padding and no members without leaves
+    """
+    end = 0
+    for offset, leafSize in sorted(zip(layout.offsets, layout.sizes)):
+        if offset > end:
+            return False
+        end = max(end, offset + leafSize)
+    return end >= size
+
+
+def _readRecords(input, format):
+    """
+    Yields (path, value) of the leaves in a jsonl or csv file
+    """
+    if format == 'csv':
+        reader = csv.reader(input)
+        next(reader, None) # header
+        for row in reader:
+            yield row[0], row[1]
+    else:
+        for line in input:
+            if line.strip():
+                record = json.loads(line)
+                yield record['path'], record['value']
+
+
+def restore(definition, input, format='jsonl', patterns=('*',), batchSize=65536):
+    """
+    Restore the symbols matching patterns from input, a file object as
+    written by dump. Returns the Statistics
+    """
+    statistics = Statistics('restore')
+    batch = _WriteBatch(definition, statistics, batchSize)
+    patterns = [p.upper() for p in patterns]
+    symbols = {name.upper(): s for name, s in definition.symbols.items()}
+    selected = {} # symbol name -> whether it matches patterns
+
+    def select(symbol):
+        if symbol.name not in selected:
+            name = symbol.name.upper()
+            selected[symbol.name] = any(fnmatch.fnmatchcase(name, p) for p in patterns)
+            if selected[symbol.name]:
+                statistics.symbols += 1
+        return selected[symbol.name]
+
+    if format == 'raw':
+        while True:
+            header = input.read(2)
+            if not header:
+                break
+            name = input.read(struct.unpack('<H', header)[0]).decode('utf-8')
+            data = input.read(struct.unpack('<L', input.read(4))[0])
+            symbol = symbols.get(name.upper())
+            if symbol is None:
+                raise KeyError('Symbol %s does not exist' % name)
+            if len(data) != symbol.size:
+                raise ValueError('Size of symbol %s changed from %d to %d bytes'
+                    % (name, len(data), symbol.size))
+            if select(symbol):
+                batch.add(symbol.iGroup, symbol.iOffs, data)
+        batch.flush()
+        return statistics
+
+    # symbol name -> (layout, dict of leaf path -> index, whether the leaves
+    # cover all bytes of the symbol)
+    leaves = {}
+    # Symbols of which leaves are being restored: name -> (symbol, data,
+    # indices of the restored leaves). When all leaves of a symbol are
+    # restored, it is written as a whole if they cover all of its bytes.
+    # Otherwise only the leaves are written, so padding and members without
+    # leaves (e.g. of unknown types) keep their values
+    incomplete = {}
+
+    def addLeaves(symbol, layout, data, restored):
+        for i in sorted(restored):
+            offset = layout.offsets[i]
+            batch.add(symbol.iGroup, symbol.iOffs + offset, data[offset:offset + layout.sizes[i]])
+    
+    for path, value in _readRecords(input, format):
+        # The symbol is the longest prefix of the path that is a symbol name
+        symbol = None
+        for end in range(len(path), 0, -1):
+            if end == len(path) or path[end] in '.[':
+                symbol = symbols.get(path[:end].upper())
+                if symbol is not None:
+                    break
+        if symbol is None:
+            raise KeyError('Symbol of %s does not exist' % path)
+        if not select(symbol):
+            continue
+
+        if symbol.name not in leaves:
+            layout = definition.leaves(definition.getVariable(symbol.name))
+            index = {p.upper(): i for i, p in enumerate(layout.paths())}
+            leaves[symbol.name] = layout, index, _covers(layout, symbol.size)
+        layout, index, covered = leaves[symbol.name]
+        i = index.get(path[end:].upper())
+        if i is None:
+            raise KeyError(path)
+
+        if symbol.name not in incomplete:
+            incomplete[symbol.name] = symbol, bytearray(symbol.size), set()
+        symbol, data, restored = incomplete[symbol.name]
+        offset = layout.offsets[i]
+        data[offset:offset + layout.sizes[i]] = decodeValue(layout.ctypes[i], value)
+        restored.add(i)
+        statistics.leaves += 1
+
+        if len(restored) == len(layout):
+            if covered:
+                batch.add(symbol.iGroup, symbol.iOffs, data)
+            else:
+                addLeaves(symbol, layout, data, restored)
+            del incomplete[symbol.name]
+
+    # Write the leaves of partially restored symbols
+    for symbol, data, restored in incomplete.values():
+        addLeaves(symbol, leaves[symbol.name][0], data, restored)
+    batch.flush()
+    return statistics
+
+
+def _format(args, path):
+    if args.format is not None:
+        return args.format
+    extension = os.path.splitext(path or '')[1].lstrip('.').lower()
+    return extension if extension in FORMATS else 'jsonl'
+
+def _open(path, mode, format, default):
+    if format == 'raw':
+        return open(path, mode + 'b') if path else default.buffer
+    return open(path, mode, newline='') if path else default
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m ads',
+        description='Dump and restore PLC variables')
+    parser.add_argument('--netid', help='AMS net id of the PLC (default: local)')
+    parser.add_argument('--port', type=int, default=851, help='ADS port of the PLC runtime')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    dumpParser = commands.add_parser('dump', help='dump symbols to a file')
+    dumpParser.add_argument('patterns', nargs='*', default=['*'], help='symbol name patterns')
+    dumpParser.add_argument('-o', '--output', help='output file (default: stdout)')
+    dumpParser.add_argument('-f', '--format', choices=FORMATS,
+        help='output format (default: from the output file extension, or jsonl)')
+    dumpParser.add_argument('--gap', type=int, default=64,
+        help='maximum gap [bytes] between symbols that are read in one request')
+    dumpParser.add_argument('--max-request', type=int, default=65536,
+        help='maximum size [bytes] of a single read request')
+
+    restoreParser = commands.add_parser('restore', help='restore symbols from a file')
+    restoreParser.add_argument('input', help='input file, as written by dump (- for stdin)')
+    restoreParser.add_argument('patterns', nargs='*', default=['*'],
+        help='restore only the symbols matching these patterns')
+    restoreParser.add_argument('-f', '--format', choices=FORMATS,
+        help='input format (default: from the input file extension, or jsonl)')
+    restoreParser.add_argument('--batch', type=int, default=65536,
+        help='number of bytes collected before writing')
+
+    args = parser.parse_args(argv)
+
+    cpyads.adsPortOpen()
+    definition = adssymbols.AdsVariablesDefinition(cpyads.SAmsAddr(args.netid, args.port))
+
+    if args.command == 'dump':
+        format = _format(args, args.output)
+        output = _open(args.output, 'w', format, sys.stdout)
+        try:
+            statistics = dump(definition, args.patterns, output, format, args.gap, args.max_request)
+        finally:
+            if args.output:
+                output.close()
+    else:
+        path = None if args.input == '-' else args.input
+        format = _format(args, path)
+        input = _open(path, 'r', format, sys.stdin)
+        try:
+            statistics = restore(definition, input, format, args.patterns, args.batch)
+        finally:
+            if path:
+                input.close()
+    statistics.report()
@@ -0,0 +1,190 @@
+# Copyright (c) 2018, DEMCON advanced mechatronics
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# 
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+
+"""
+Decoding of the raw data of PLC variables to native Python objects with a
+single struct.unpack_from call per value, instead of attribute access on
+ctypes objects:
+
+    codec = Codec(ctype)
+    value = codec.decode(buffer)
+
+A Codec is compiled once per ctypes type (as created by
+AdsVariablesDefinition.getCtype) into a flat struct format, which covers all
+leaves of the type including the padding, and a decoding function that
+builds the nested value from the unpacked tuple:
+
+- structures decode to dicts of member name -> value (or to tuples in
+  member order)
+- arrays decode to lists; a multidimensional array to nested lists. The
+  first item corresponds to the lower bound of the array (see bounds)
+- strings decode to str, unknown (dummy) types to bytes
+- simple types decode to their Python value
+"""
+
+from .adssymbols import PLCString, Dummy
+from ctypes import Array, Structure, c_bool, c_char, sizeof
+import struct
+
+
+def _decodeString(data):
+    return data.split(b'\0', 1)[0].decode('latin-1')
+
+# Struct format characters of ctypes _type_ codes whose standard size depends
+# on the platform
+_sizedFormats = {
+    'l': {4: 'i', 8: 'q'},
+    'L': {4: 'I', 8: 'Q'},
+    'P': {4: 'I', 8: 'Q'},
+    }
+
+
+class _Node:
+    """
+    Decoding plan of a (part of a) type: its struct format, the number of
+    values it unpacks to, and a function that returns the Python source of
+    the expression that decodes it from the unpacked values v, starting at
+    index base
+    """
+    def __init__(self, format, count, expression):
+        self.format = format
+        self.count = count
+        self.expression = expression
+
+
+def _index(base, offset=0):
+    variable, constant = base
+    constant += offset
+    if not variable:
+        return str(constant)
+    return '%s+%d' % (variable, constant) if constant else variable
+
+
+class Codec:
+    """
+    Decoder of the raw data of a ctypes type to Python objects (see the
+    module documentation).
+
+    ctype: the ctypes type (a simple type, PLCString, Structure or Array)
+    tuples: decode structures to tuples rather than dicts
+
+    Attributes: size is the size of the data in bytes, format the struct
+    format and bounds a list of the (lBound, elements) of each dimension if
+    ctype is an array.
+    """
+    def __init__(self, ctype, tuples=False):
+        self.ctype = ctype
+        self.size = sizeof(ctype)
+        self.tuples = tuples
+        self._depth = 0
+
+        node = self._compile(ctype)
+        self.format = '<' + node.format
+        self.struct = struct.Struct(self.format)
+        assert self.struct.size == self.size
+
+        source = 'lambda v: ' + node.expression(('', 0))
+        self._decode = eval(source, {'_decodeString': _decodeString})
+
+        self.bounds = []
+        while issubclass(ctype, Array) and not issubclass(ctype, Dummy):
+            self.bounds.append((getattr(ctype, '_lbound_', 0), ctype._length_))
+            ctype = ctype._type_
+
+    def decode(self, buffer, offset=0):
+        """
+        Decode the data at offset in buffer (any object supporting the buffer
+        protocol, e.g. bytes, bytearray or a ctypes object of the type)
+        """
+        return self._decode(self.struct.unpack_from(buffer, offset))
+
+    def _compile(self, ctype):
+        size = sizeof(ctype)
+        if issubclass(ctype, PLCString):
+            return _Node('%ds' % size, 1, lambda base: '_decodeString(v[%s])' % _index(base))
+        if issubclass(ctype, Dummy) or (issubclass(ctype, Array) and ctype._type_ is c_char):
+            return _Node('%ds' % size, 1, lambda base: 'v[%s]' % _index(base))
+        if issubclass(ctype, Structure):
+            return self._compileStructure(ctype)
+        if issubclass(ctype, Array):
+            return self._compileArray(ctype)
+
+        if ctype is c_bool:
+            format = '?'
+        else:
+            format = _sizedFormats.get(ctype._type_, {}).get(size, ctype._type_)
+        return _Node(format, 1, lambda base: 'v[%s]' % _index(base))
+
+    def _compileStructure(self, ctype):
+        formats = []
+        members = [] # (name, node, index of the first value)
+        position = 0
+        count = 0
+        for field in ctype._fields_:
+            name = field[0]
+            if not name:
+                # Padding, covered by the offset of the next member
+                continue
+            offset = getattr(ctype, name).offset
+            if offset > position:
+                formats.append('%dx' % (offset - position))
+            node = self._compile(field[1])
+            formats.append(node.format)
+            members.append((name, node, count))
+            count += node.count
+            position = offset + sizeof(field[1])
+        if sizeof(ctype) > position:
+            formats.append('%dx' % (sizeof(ctype) - position))
+
+        def expression(base):
+            if self.tuples:
+                items = [node.expression((base[0], base[1] + i)) for name, node, i in members]
+                return '(%s,)' % ', '.join(items) if items else '()'
+            return '{%s}' % ', '.join('%r: %s' % (name, node.expression((base[0], base[1] + i)))
+                for name, node, i in members)
+
+        return _Node(''.join(formats), count, expression)
+
+    def _compileArray(self, ctype):
+        length = ctype._length_
+        element = self._compile(ctype._type_)
+
+        if element.count == 1 and element.expression(('', 0)) == 'v[0]':
+            # Items that need no conversion: slice the unpacked values
+            return _Node('%d%s' % (length, element.format), length,
+                lambda base: 'list(v[%s:%s])' % (_index(base), _index(base, length)))
+
+        self._depth += 1
+        k = 'k%d' % self._depth
+        def expression(base):
+            item = element.expression((_index(base) + '+%s*%d' % (k, element.count) if base[0] or base[1]
+                else '%s*%d' % (k, element.count), 0))
+            return '[%s for %s in range(%d)]' % (item, k, length)
+        return _Node(element.format * length, element.count * length, expression)
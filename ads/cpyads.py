@@ -31,8 +31,33 @@ from ctypes import (
     c_byte, c_ubyte, c_short, c_ushort, c_long, c_ulong, c_void_p,
     byref, sizeof, POINTER, CDLL, Structure
     )
+from contextlib import contextmanager
+import threading
+import time
 
 
+# ADS return codes
+ADSERR_NOERR = 0x00
+ADSERR_TARGET_PORT_NOT_FOUND = 0x06
+ADSERR_TARGET_MACHINE_NOT_FOUND = 0x07
+ADSERR_DEVICE_SRVNOTSUPP = 0x701
+ADSERR_DEVICE_INVALIDGRP = 0x702
+ADSERR_DEVICE_INVALIDOFFSET = 0x703
+ADSERR_DEVICE_INVALIDSIZE = 0x705
+ADSERR_DEVICE_INVALIDDATA = 0x706
+ADSERR_DEVICE_SYMBOLNOTFOUND = 0x710
+ADSERR_CLIENT_SYNCTIMEOUT = 0x745
+ADSERR_CLIENT_PORTNOTOPEN = 0x748
+ADSERR_CLIENT_NOAMSADDR = 0x749
+
+# ADS states
+ADSSTATE_INVALID = 0
+ADSSTATE_IDLE = 1
+ADSSTATE_RESET = 2
+ADSSTATE_INIT = 3
+ADSSTATE_START = 4
+ADSSTATE_RUN = 5
+ADSSTATE_STOP = 6
 
 
 class SAdsVersion(Structure):
@@ -71,73 +96,317 @@ class SAmsAddr(Structure):
     def __repr__(self):
         return '%s:%d' % ('.'.join(map(str, self.netId)), self.port)
 
+class AdsError(IOError):
+    """
+    Error returned by an ADS request. The ADS return code is in e.code
+    """
+    def __init__(self, code):
+        name = _errorNames.get(code)
+        super().__init__('Error %d' % code if name is None else 'Error %d (%s)' % (code, name))
+        self.code = code
+
+class AdsTimeoutError(AdsError, TimeoutError):
+    """
+    The request was not answered within the timeout
+    """
+
+class AdsTargetError(AdsError):
+    """
+    The target machine or port could not be reached
+    """
+
+_errorNames = {value: name for name, value in globals().items() if name.startswith('ADSERR_')}
+
+_errorClasses = {
+    ADSERR_CLIENT_SYNCTIMEOUT: AdsTimeoutError,
+    ADSERR_TARGET_PORT_NOT_FOUND: AdsTargetError,
+    ADSERR_TARGET_MACHINE_NOT_FOUND: AdsTargetError,
+    ADSERR_CLIENT_NOAMSADDR: AdsTargetError,
+    }
+
 def checkError(error):
     if error != 0:
-        raise IOError('Error ' + str(error))
+        raise _errorClasses.get(error, AdsError)(error)
 
 class AdsDll:
     _lib = None
+    _lock = threading.Lock()
+    
+    @classmethod
+    def install(cls, lib):
+        """
+        Use lib instead of AdsDll.dll for all subsequent ADS calls. lib must
+        provide the AdsDll.dll functions that are used, with the same
+        arguments, raising an error in the same way checkError does (see e.g.
+        simulator.SimulatedAdsDll). Passing None reverts to AdsDll.dll.
+        
+        Returns the previously installed lib
+        """
+        previous = cls._lib
+        cls._lib = lib
+        return previous
     
     @classmethod
     def lib(cls):
         if cls._lib is None:
+            with cls._lock:
+                if cls._lib is None:
+                    cls._lib = cls._load()
+        return cls._lib
+    
+    @staticmethod
+    def _load():
+        lib = CDLL("AdsDll.dll")
+        for function in (lib.AdsPortOpen, lib.AdsPortOpenEx):
+            function.restype = c_long
+            function.argtypes = []
+        
+        for function, argtypes in [
+            (lib.AdsPortClose, []),
+            (lib.AdsGetLocalAddress, [POINTER(SAmsAddr)]),
+            (lib.AdsSyncReadReq, [POINTER(SAmsAddr), c_ulong, c_ulong, c_ulong, c_void_p]),
+            (lib.AdsSyncWriteReq, [POINTER(SAmsAddr), c_ulong, c_ulong, c_ulong, c_void_p]),
+            (lib.AdsSyncReadWriteReq, [POINTER(SAmsAddr), c_ulong, c_ulong, c_ulong, c_void_p, c_ulong, c_void_p]),
+            (lib.AdsSyncWriteControlReq, [POINTER(SAmsAddr), c_ushort, c_ushort, c_ulong, c_void_p]),
+            (lib.AdsSyncReadStateReq, [POINTER(SAmsAddr), POINTER(c_ushort), POINTER(c_ushort)]),
+            (lib.AdsSyncSetTimeout, [c_long]),
             
-
-            lib = CDLL("AdsDll.dll")
-            lib.AdsPortOpen.restype = c_long
-            lib.AdsPortOpen.argtypes = []
+            # Functions operating on a port opened with AdsPortOpenEx
+            (lib.AdsPortCloseEx, [c_long]),
+            (lib.AdsGetLocalAddressEx, [c_long, POINTER(SAmsAddr)]),
+            (lib.AdsSyncReadReqEx2, [c_long, POINTER(SAmsAddr), c_ulong, c_ulong, c_ulong, c_void_p, POINTER(c_ulong)]),
+            (lib.AdsSyncWriteReqEx, [c_long, POINTER(SAmsAddr), c_ulong, c_ulong, c_ulong, c_void_p]),
+            (lib.AdsSyncReadWriteReqEx2, [c_long, POINTER(SAmsAddr), c_ulong, c_ulong, c_ulong, c_void_p, c_ulong, c_void_p, POINTER(c_ulong)]),
+            (lib.AdsSyncWriteControlReqEx, [c_long, POINTER(SAmsAddr), c_ushort, c_ushort, c_ulong, c_void_p]),
+            (lib.AdsSyncReadStateReqEx, [c_long, POINTER(SAmsAddr), POINTER(c_ushort), POINTER(c_ushort)]),
+            (lib.AdsSyncSetTimeoutEx, [c_long, c_long]),
+        ]:
             
-            for function, argtypes in [
-                (lib.AdsPortClose, []),
-                (lib.AdsGetLocalAddress, [POINTER(SAmsAddr)]),
-                (lib.AdsSyncReadReq, [POINTER(SAmsAddr), c_ulong, c_ulong, c_ulong, c_void_p]),
-                (lib.AdsSyncWriteReq, [POINTER(SAmsAddr), c_ulong, c_ulong, c_ulong, c_void_p]),
-                (lib.AdsSyncWriteControlReq, [POINTER(SAmsAddr), c_ushort, c_ushort, c_ulong, c_void_p]),
-                (lib.AdsSyncReadStateReq, [POINTER(SAmsAddr), POINTER(c_ushort), POINTER(c_ushort)])
-            ]:
-                
-                function.argtypes = argtypes
-                function.restype = checkError
-        
-            cls._lib = lib
-        return cls._lib
+            function.argtypes = argtypes
+            function.restype = checkError
+    
+        return lib
+
+_threadState = threading.local()
+
+def setThreadPort(port):
+    """
+    Use port (opened with adsPortOpenEx) for all ADS calls from the current
+    thread that do not specify a port explicitly. Each thread can use its own
+    port, so calls from different threads do not share a port. Passing None
+    reverts to the port opened with adsPortOpen.
+    
+    Returns the previous port of this thread
+    """
+    previous = getThreadPort()
+    _threadState.port = port
+    return previous
+
+def getThreadPort():
+    return getattr(_threadState, 'port', None)
+
+def _port(port):
+    if port is None:
+        return getattr(_threadState, 'port', None)
+    return port
+
+def getThreadDeadline():
+    """
+    Returns the deadline (time.monotonic() time) of the current thread, or
+    None
+    """
+    return getattr(_threadState, 'deadline', None)
+
+@contextmanager
+def deadline(timeout):
+    """
+    All ADS requests from the current thread within the with block must
+    complete within timeout [s] from now. Nested deadlines can only shorten
+    the deadline. A timeout of None does not set a deadline.
+    
+    The timeout of the port of each request is limited to the time left
+    until the deadline, and requests fail with AdsTimeoutError without being
+    sent when the deadline has passed. The port timeout applies to all
+    threads using the port, so threads that use different deadlines should
+    use their own port (see setThreadPort). See also
+    resilience.ResilientAdsDll, which adds retries
+    """
+    previous = getThreadDeadline()
+    if timeout is not None:
+        end = time.monotonic() + timeout
+        _threadState.deadline = end if previous is None else min(previous, end)
+    try:
+        yield
+    finally:
+        _threadState.deadline = previous
+
+# Default timeout [ms] of requests on a port, like the AMS router
+DEFAULT_TIMEOUT = 5000
+
+_portTimeouts = {} # port (None for the port of adsPortOpen) -> timeout [ms] set by adsSyncSetTimeout
+_deadlineTimeouts = {} # port -> timeout [ms] set on the port for a deadline
+# Lock protecting _portTimeouts and _deadlineTimeouts, held while setting the
+# timeout so the timeout of each port matches them
+_timeoutLock = threading.Lock()
+
+def _setTimeout(port, timeout):
+    if port is None:
+        AdsDll.lib().AdsSyncSetTimeout(timeout)
+    else:
+        AdsDll.lib().AdsSyncSetTimeoutEx(port, timeout)
+
+def _applyDeadline(port):
+    """
+    Limit the timeout of port to the time left until the deadline of the
+    current thread, or restore its timeout after a deadline. Libs that apply
+    deadlines themselves (with an appliesDeadlines attribute, see
+    resilience.ResilientAdsDll) are left to do so
+    """
+    end = getattr(_threadState, 'deadline', None)
+    if end is None:
+        if port in _deadlineTimeouts:
+            with _timeoutLock:
+                if port in _deadlineTimeouts:
+                    _setTimeout(port, _portTimeouts.get(port, DEFAULT_TIMEOUT))
+                    del _deadlineTimeouts[port]
+        return
+    if getattr(AdsDll.lib(), 'appliesDeadlines', False):
+        return
+    
+    remaining = end - time.monotonic()
+    if remaining <= 0:
+        raise AdsTimeoutError(ADSERR_CLIENT_SYNCTIMEOUT)
+    with _timeoutLock:
+        timeout = min(_portTimeouts.get(port, DEFAULT_TIMEOUT), max(1, int(remaining * 1000)))
+        if _deadlineTimeouts.get(port) != timeout:
+            _setTimeout(port, timeout)
+            _deadlineTimeouts[port] = timeout
+
+def _resetTimeout(port):
+    # A newly opened port has the default timeout
+    with _timeoutLock:
+        _portTimeouts.pop(port, None)
+        _deadlineTimeouts.pop(port, None)
 
 def adsPortOpen():
+    _resetTimeout(None)
     return AdsDll.lib().AdsPortOpen()
 
+def adsPortOpenEx():
+    """
+    Open a new port, which is independent from the port opened by
+    adsPortOpen. Returns the port number
+    """
+    port = AdsDll.lib().AdsPortOpenEx()
+    if port == 0:
+        raise IOError('Could not open port')
+    _resetTimeout(port)
+    return port
+
+def adsPortCloseEx(port):
+    AdsDll.lib().AdsPortCloseEx(port)
+    _resetTimeout(port)
+
 def adsGetLocalAddress():
     return SAmsAddr()
 
-def adsSyncReadReq(amsAddr, indexGroup, indexOffset, ctype):
+# The functions below use the port given by the port argument. If it is None,
+# the port of the current thread (see setThreadPort) is used or, if that is
+# not set either, the port opened with adsPortOpen
+
+def adsSyncSetTimeout(timeout, port=None):
+    """
+    Set the timeout [ms] of requests on the port
+    """
+    port = _port(port)
+    with _timeoutLock:
+        _setTimeout(port, timeout)
+        _portTimeouts[port] = timeout
+        _deadlineTimeouts.pop(port, None)
+
+def adsSyncReadReq(amsAddr, indexGroup, indexOffset, ctype, port=None):
     data = ctype() # Create object to be read into
-    AdsDll.lib().AdsSyncReadReq(byref(amsAddr), indexGroup, indexOffset, sizeof(data), byref(data))    
+    adsSyncReadReqInto(amsAddr, indexGroup, indexOffset, data, port)
+    return data
+
+def adsSyncReadReqInto(amsAddr, indexGroup, indexOffset, data, port=None):
+    """
+    Read into an existing ctypes object data, e.g. one created with
+    from_buffer to read into memory owned by another object
+    """
+    port = _port(port)
+    _applyDeadline(port)
+    if port is None:
+        AdsDll.lib().AdsSyncReadReq(byref(amsAddr), indexGroup, indexOffset, sizeof(data), byref(data))    
+    else:
+        AdsDll.lib().AdsSyncReadReqEx2(port, byref(amsAddr), indexGroup, indexOffset, sizeof(data), byref(data), None)
+
+def adsSyncWriteReq(amsAddr, indexGroup, indexOffset, data, port=None):
+    port = _port(port)
+    _applyDeadline(port)
+    if port is None:
+        AdsDll.lib().AdsSyncWriteReq(byref(amsAddr), indexGroup, indexOffset, sizeof(data), byref(data))
+    else:
+        AdsDll.lib().AdsSyncWriteReqEx(port, byref(amsAddr), indexGroup, indexOffset, sizeof(data), byref(data))
+
+def adsSyncReadWriteReq(amsAddr, indexGroup, indexOffset, ctype, writeData=None, port=None):
+    """
+    Write writeData (a ctypes object, or None to write nothing) and read an
+    object of ctype in a single request. Returns the object read
+    """
+    data = ctype()
+    adsSyncReadWriteReqInto(amsAddr, indexGroup, indexOffset, data, writeData, port)
     return data
 
-def adsSyncWriteReq(amsAddr, indexGroup, indexOffset, data):
-    AdsDll.lib().AdsSyncWriteReq(byref(amsAddr), indexGroup, indexOffset, sizeof(data), byref(data))
+def adsSyncReadWriteReqInto(amsAddr, indexGroup, indexOffset, data, writeData=None, port=None):
+    """
+    Like adsSyncReadWriteReq, but reads into an existing ctypes object data
+    """
+    if writeData is None:
+        writeLength, pWriteData = 0, None
+    else:
+        writeLength, pWriteData = sizeof(writeData), byref(writeData)
+    port = _port(port)
+    _applyDeadline(port)
+    if port is None:
+        AdsDll.lib().AdsSyncReadWriteReq(byref(amsAddr), indexGroup, indexOffset,
+            sizeof(data), byref(data), writeLength, pWriteData)
+    else:
+        AdsDll.lib().AdsSyncReadWriteReqEx2(port, byref(amsAddr), indexGroup, indexOffset,
+            sizeof(data), byref(data), writeLength, pWriteData, None)
 
-def adsGetAdsAndDeviceState(amsAddr):
+def adsGetAdsAndDeviceState(amsAddr, port=None):
     adsState = c_ushort(0)
     deviceState = c_ushort(0)
-    AdsDll.lib().AdsSyncReadStateReq(byref(amsAddr), byref(adsState), byref(deviceState))
+    port = _port(port)
+    _applyDeadline(port)
+    if port is None:
+        AdsDll.lib().AdsSyncReadStateReq(byref(amsAddr), byref(adsState), byref(deviceState))
+    else:
+        AdsDll.lib().AdsSyncReadStateReqEx(port, byref(amsAddr), byref(adsState), byref(deviceState))
     return adsState, deviceState
 
-def adsSetState(amsAddr, adsState=None, deviceState=None):
-    currentAdsState, currentDeviceState = adsGetAdsAndDeviceState(amsAddr)
+def adsSetState(amsAddr, adsState=None, deviceState=None, port=None):
+    currentAdsState, currentDeviceState = adsGetAdsAndDeviceState(amsAddr, port)
     if adsState is None:
         adsState = currentAdsState
     if deviceState is None:
         deviceState = currentDeviceState
-    AdsDll.lib().AdsSyncWriteControlReq(byref(amsAddr), adsState, deviceState, 0, c_void_p())
+    port = _port(port)
+    _applyDeadline(port)
+    if port is None:
+        AdsDll.lib().AdsSyncWriteControlReq(byref(amsAddr), adsState, deviceState, 0, c_void_p())
+    else:
+        AdsDll.lib().AdsSyncWriteControlReqEx(port, byref(amsAddr), adsState, deviceState, 0, c_void_p())
 
 def adsStop(amsAddr):
-    adsSetState(amsAddr=amsAddr, adsState=c_ushort(6))
+    adsSetState(amsAddr=amsAddr, adsState=c_ushort(ADSSTATE_STOP))
 
 def adsReset(amsAddr):
-    adsSetState(amsAddr=amsAddr, adsState=c_ushort(2))
+    adsSetState(amsAddr=amsAddr, adsState=c_ushort(ADSSTATE_RESET))
 
 def adsStart(amsAddr):
-    adsSetState(amsAddr=amsAddr, adsState=c_ushort(5))
+    adsSetState(amsAddr=amsAddr, adsState=c_ushort(ADSSTATE_RUN))
 
 def adsRestart(amsAddr):
     try:
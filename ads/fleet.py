@@ -0,0 +1,223 @@
+# Copyright (c) 2018, DEMCON advanced mechatronics
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# 
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+
+"""
+Reading the same set of variables from many PLCs running the same program
+"""
+
+from . import adssymbols, cpyads
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import time
+
+
+class FleetResult:
+    """
+    Result of Fleet.read(): a table of targets x paths.
+
+    values[i][j] is the value of paths[j] read from targets[i], or None if
+    it could not be read, in which case errors[i][j] holds the exception.
+    """
+    def __init__(self, targets, paths, timestamp):
+        self.targets = targets
+        self.paths = paths
+        self.timestamp = timestamp
+        self.values = [[None] * len(paths) for t in targets]
+        self.errors = [[None] * len(paths) for t in targets]
+
+    def _fail(self, row, error):
+        self.values[row] = [None] * len(self.paths)
+        self.errors[row] = [error] * len(self.paths)
+
+    def ok(self, row):
+        """
+        True if all paths were read successfully from targets[row]
+        """
+        return not any(self.errors[row])
+
+    def asDict(self):
+        """
+        Returns {str(target): {path: value}} for all values that were read
+        """
+        return {
+            repr(target): {path: value
+                for path, value, error in zip(self.paths, values, errors)
+                if error is None}
+            for target, values, errors in zip(self.targets, self.values, self.errors)
+            }
+
+
+class _Target:
+    """
+    State of a single target of a Fleet. Only accessed by one worker at a
+    time.
+    """
+    def __init__(self, address):
+        self.address = address
+        self.port = None
+        self.variables = None # list of Variable or exception per path
+        self.future = None # Future of a read in progress
+        self.started = None # Time at which the read in progress started
+
+
+class Fleet:
+    """
+    Reads the same set of variables from a number of targets (PLCs running
+    identical programs), concurrently.
+
+    targets: list of cpyads.SAmsAddr
+    paths: list of variable paths, e.g. 'MAIN.axis.position'
+    workers: maximum number of targets that are read at the same time
+    timeout: time [s] after which the read of a single target is abandoned
+    
+    Each target uses its own port. The variable paths are resolved once per
+    target, on the first read. A target that fails or does not respond within
+    the timeout does not affect the results of the other targets; a target
+    whose previous read is still in progress is skipped.
+
+    Use as a context manager, or call close() when done.
+    """
+    def __init__(self, targets, paths, workers=8, timeout=1.0):
+        self.paths = list(paths)
+        self.timeout = timeout
+        self.workers = workers
+        self._targets = [_Target(address) for address in targets]
+        self._executor = ThreadPoolExecutor(workers)
+
+    @property
+    def targets(self):
+        return [target.address for target in self._targets]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """
+        Wait for reads in progress and close the ports of all targets
+        """
+        self._executor.shutdown(wait=True)
+        for target in self._targets:
+            if target.port is not None:
+                cpyads.adsPortCloseEx(target.port)
+                target.port = None
+
+    def _resolve(self, target):
+        if target.port is None:
+            target.port = cpyads.adsPortOpenEx()
+        cpyads.setThreadPort(target.port)
+
+        if target.variables is None:
+            definition = adssymbols.AdsVariablesDefinition(target.address)
+            variables = []
+            for path in self.paths:
+                try:
+                    variables.append(definition.getVariable(path))
+                except KeyError as e:
+                    variables.append(e)
+            target.variables = variables
+
+    def _read(self, target):
+        """
+        Read all variables of target. Runs in a worker thread; returns a list
+        of (value, error) tuples
+        """
+        target.started = time.monotonic()
+        try:
+            # The timeout also limits the port timeout of the requests, so an
+            # offline target does not block the worker any longer
+            with cpyads.deadline(self.timeout):
+                self._resolve(target)
+                results = []
+                for var in target.variables:
+                    if isinstance(var, Exception):
+                        results.append((None, var))
+                        continue
+                    try:
+                        results.append((var(), None))
+                    except Exception as e:
+                        results.append((None, e))
+                return results
+        finally:
+            cpyads.setThreadPort(None)
+
+    def read(self):
+        """
+        Read all paths from all targets. Returns a FleetResult
+        """
+        result = FleetResult(self.targets, self.paths, time.time())
+        pending = {}
+        for row, target in enumerate(self._targets):
+            if target.future is not None:
+                result._fail(row, TimeoutError('Previous read of %r still in progress' % target.address))
+                continue
+            target.started = None
+            target.future = self._executor.submit(self._read, target)
+            pending[target.future] = row
+
+        # Reads that have not started after this time are cancelled
+        rounds = -(-len(pending) // self.workers)
+        cycleDeadline = time.monotonic() + self.timeout * max(rounds, 1)
+
+        while pending:
+            now = time.monotonic()
+            deadlines = [cycleDeadline] + [self._targets[row].started + self.timeout
+                for row in pending.values() if self._targets[row].started is not None]
+            done, notDone = wait(pending, max(0, min(deadlines) - now), FIRST_COMPLETED)
+
+            now = time.monotonic()
+            for future in list(pending):
+                row = pending[future]
+                target = self._targets[row]
+                if future.done():
+                    del pending[future]
+                    target.future = None
+                    if future.cancelled():
+                        result._fail(row, TimeoutError('Read of %r not started in time' % target.address))
+                    elif future.exception() is not None:
+                        result._fail(row, future.exception())
+                        target.variables = None # Resolve again in the next read
+                    else:
+                        for column, (value, error) in enumerate(future.result()):
+                            result.values[row][column] = value
+                            result.errors[row][column] = error
+
+                elif target.started is not None and now >= target.started + self.timeout:
+                    # Abandon this read; target.future stays set until it
+                    # finishes, so the target is skipped in the meantime
+                    del pending[future]
+                    future.add_done_callback(lambda f, target=target: setattr(target, 'future', None))
+                    result._fail(row, TimeoutError('Read of %r timed out' % target.address))
+
+                elif target.started is None and now >= cycleDeadline:
+                    future.cancel()
+
+        return result
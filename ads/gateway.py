@@ -0,0 +1,297 @@
+# Copyright (c) 2018, DEMCON advanced mechatronics
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# 
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+
+"""
+Shared memory gateway: a single process reads a set of variables from the PLC
+and publishes the raw data in a shared memory segment, from which any number
+of local processes read the variables without ADS traffic.
+
+Gateway process:
+
+    cpyads.adsPortOpen()
+    definition = AdsVariablesDefinition(cpyads.SAmsAddr(netId, 851))
+    with Gateway(definition, ['MAIN.axes', 'GVL.status'], 'plc1', period=0.05):
+        ...
+
+Client processes:
+
+    with GatewayClient('plc1') as client:
+        client.variables.MAIN.axes[1].position()
+
+The segment holds the symbol and datatype tables of the PLC program, so
+clients use the same ctypes layouts as the gateway. The data is published
+with a sequence lock: the sequence number is odd while the gateway writes,
+and readers retry when it was odd or changed during their copy.
+"""
+
+from .adssymbols import AdsVariablesDefinition
+from .sampler import CyclicSampler
+from bisect import bisect_right
+from ctypes import sizeof
+from multiprocessing import resource_tracker, shared_memory
+import json
+import struct
+import sys
+import time
+
+
+MAGIC = b'ADSG'
+VERSION = 1
+
+# magic, version, sequence, cycle, timestamp, metadata offset and size,
+# data offset and size
+_header = struct.Struct('<4sLQQdQQQQ')
+_sequence = struct.Struct('<Q')
+_SEQUENCE_OFFSET = 8
+
+
+class Gateway:
+    """
+    Publishes the raw data of a set of variables in a shared memory segment.
+
+    definition: AdsVariablesDefinition of the PLC
+    paths: paths of the variables to publish (simple variables, structures
+      or arrays)
+    name: name of the shared memory segment (default: generated)
+    period: poll period [s] used by start()
+
+    Call poll() to read and publish once, or start() and stop() to poll
+    periodically on a separate thread. Use as a context manager, or call
+    close() to remove the segment.
+    """
+    def __init__(self, definition, paths, name=None, period=0.1):
+        self.definition = definition
+        self.period = period
+        self.cycle = 0
+
+        regions = []
+        offset = 0
+        for path in paths:
+            var = definition.getVariable(path)
+            info = ~var
+            size = sizeof(info.ctype) if info.datatype is None else info.datatype.size
+            regions.append(dict(path=path, indexGroup=info.symbol.iGroup,
+                indexOffset=info.symbol.iOffs + info.offset, size=size, offset=offset))
+            offset += size
+        self.variables = [definition.getVariable(path) for path in paths]
+        self.regions = regions
+
+        uploadInfo, symbolsData, datatypesData = definition._upload()
+        metadata = json.dumps(dict(regions=regions, uploadInfo=uploadInfo,
+            symbolsSize=len(symbolsData))).encode()
+        metadata = struct.pack('<L', len(metadata)) + metadata + symbolsData + datatypesData
+
+        metadataOffset = _header.size
+        dataOffset = (metadataOffset + len(metadata) + 7) // 8 * 8
+        self.shm = shared_memory.SharedMemory(name, create=True, size=max(dataOffset + offset, 1))
+        self.shm.buf[metadataOffset:metadataOffset + len(metadata)] = metadata
+        _header.pack_into(self.shm.buf, 0, MAGIC, VERSION, 0, 0, 0.0,
+            metadataOffset, len(metadata), dataOffset, offset)
+
+        self._data = self.shm.buf[dataOffset:dataOffset + offset]
+        self._staging = bytearray(offset)
+        self._sampler = None
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def poll(self):
+        """
+        Read all variables and publish their data
+        """
+        staging = memoryview(self._staging)
+        for var, region in zip(self.variables, self.regions):
+            var.readinto(staging[region['offset']:region['offset'] + region['size']])
+
+        buf = self.shm.buf
+        sequence, = _sequence.unpack_from(buf, _SEQUENCE_OFFSET)
+        _sequence.pack_into(buf, _SEQUENCE_OFFSET, sequence + 1)
+        self._data[:] = self._staging
+        self.cycle += 1
+        struct.pack_into('<Qd', buf, _SEQUENCE_OFFSET + 8, self.cycle, time.time())
+        _sequence.pack_into(buf, _SEQUENCE_OFFSET, sequence + 2)
+
+    def start(self):
+        """
+        Start polling every self.period seconds on a separate thread
+        """
+        self._sampler = CyclicSampler([], self.period, read=lambda variables: self.poll())
+        self._sampler.start()
+
+    def stop(self):
+        if self._sampler is not None:
+            self._sampler.stop()
+
+    def statistics(self):
+        """
+        Poll statistics (see CyclicSampler.statistics)
+        """
+        return self._sampler.statistics()
+
+    def close(self):
+        self.stop()
+        self._data.release()
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            # Already removed, e.g. by the resource tracker of a client
+            # process of an older version
+            pass
+
+
+class SharedMemoryDefinition(AdsVariablesDefinition):
+    """
+    AdsVariablesDefinition whose symbols and datatypes and variable data
+    are read from a Gateway's shared memory segment rather than over ADS.
+    Only the variables published by the gateway (and their members) can be
+    read; writing is not possible.
+    """
+    def __init__(self, shm, retries=10000):
+        self.shm = shm
+        self.retries = retries
+
+        (magic, version, sequence, cycle, timestamp, metadataOffset,
+            metadataSize, self._dataOffset, dataSize) = _header.unpack_from(shm.buf, 0)
+        if magic != MAGIC or version != VERSION:
+            raise IOError('%s is not an ADS gateway segment' % shm.name)
+
+        metadata = bytes(shm.buf[metadataOffset:metadataOffset + metadataSize])
+        length, = struct.unpack_from('<L', metadata)
+        info = json.loads(metadata[4:4 + length].decode())
+        symbolsEnd = 4 + length + info['symbolsSize']
+        self._blobs = (tuple(info['uploadInfo']), metadata[4 + length:symbolsEnd], metadata[symbolsEnd:])
+
+        self.regions = sorted(info['regions'], key=lambda r: (r['indexGroup'], r['indexOffset']))
+        self._starts = [(r['indexGroup'], r['indexOffset']) for r in self.regions]
+
+        super().__init__(None)
+
+    def _upload(self):
+        return self._blobs
+
+    def _region(self, indexGroup, indexOffset, size):
+        i = bisect_right(self._starts, (indexGroup, indexOffset)) - 1
+        if i >= 0:
+            region = self.regions[i]
+            if (region['indexGroup'] == indexGroup
+                    and indexOffset + size <= region['indexOffset'] + region['size']):
+                return self._dataOffset + region['offset'] + indexOffset - region['indexOffset']
+        raise IOError('Data at 0x%x:0x%x is not published by the gateway' % (indexGroup, indexOffset))
+
+    def snapshot(self, offset, data):
+        """
+        Copy sizeof(data) bytes at offset in the segment consistently into the
+        ctypes object data. Returns the gateway cycle of the data
+        """
+        buf = self.shm.buf
+        target = memoryview(data).cast('B')
+        size = len(target)
+        for i in range(self.retries):
+            sequence, = _sequence.unpack_from(buf, _SEQUENCE_OFFSET)
+            if sequence & 1:
+                # Gateway is writing
+                time.sleep(0)
+                continue
+            target[:] = buf[offset:offset + size]
+            cycle, = struct.unpack_from('<Q', buf, _SEQUENCE_OFFSET + 8)
+            if _sequence.unpack_from(buf, _SEQUENCE_OFFSET)[0] == sequence:
+                return cycle
+        raise IOError('No consistent data could be read from %s' % self.shm.name)
+
+    def adsRead(self, indexGroup, indexOffset, ctype):
+        data = ctype()
+        self.adsReadInto(indexGroup, indexOffset, data)
+        return data
+
+    def adsReadInto(self, indexGroup, indexOffset, data):
+        self.snapshot(self._region(indexGroup, indexOffset, sizeof(data)), data)
+
+    def adsWrite(self, indexGroup, indexOffset, data):
+        raise IOError('Variables cannot be written through the gateway')
+
+    def adsReadWriteInto(self, indexGroup, indexOffset, data, writeData):
+        raise IOError('Variables cannot be written through the gateway')
+
+
+def _attach(name):
+    """
+    Attach to the existing shared memory segment name. The segment is not
+    registered with the resource tracker of this process (which Python
+    before 3.13 does), since the tracker would unlink the segment of the
+    gateway when this process exits
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name, track=False)
+    shm = shared_memory.SharedMemory(name)
+    if getattr(shared_memory, '_USE_POSIX', False):
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
+
+
+class GatewayClient:
+    """
+    Reads variables from the shared memory segment of a Gateway, using the
+    same interface as variables read over ADS:
+
+        client.variables.MAIN.counter()
+        client.getVariable('MAIN.axes[1].position')()
+
+    Use as a context manager, or call close() when done.
+    """
+    def __init__(self, name):
+        self.shm = _attach(name)
+        self.definition = SharedMemoryDefinition(self.shm)
+        self.variables = self.definition.variables
+
+    def getVariable(self, path):
+        return self.definition.getVariable(path)
+
+    def status(self):
+        """
+        Returns (cycle, timestamp) of the last data published by the gateway
+        """
+        return struct.unpack_from('<Qd', self.shm.buf, _SEQUENCE_OFFSET + 8)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.shm.close()
@@ -0,0 +1,127 @@
+# Copyright (c) 2018, DEMCON advanced mechatronics
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# 
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+
+"""
+Flattened layout of the leaves (simple variables) of PLC datatypes, so the
+leaves of a large structure or array can be processed from their offsets
+without creating a Variable per node (see AdsVariablesDefinition.leaves)
+"""
+
+from array import array
+from collections import namedtuple
+
+
+Leaf = namedtuple('Leaf', 'path offset size ctype')
+
+
+class LeafLayout:
+    """
+    The leaves of a datatype in a flat table: per leaf its offset and size
+    in bytes relative to the start of the datatype, its ctype and its path
+    relative to the datatype, e.g. '.status.errorId' or '[3].x'.
+
+    The paths are stored as a tree of path segments (nodes) in which each
+    node refers to its parent node, so the common prefixes of the paths are
+    stored once. Use paths() to obtain all paths at once; iterating over the
+    layout yields Leaf tuples.
+
+    LeafLayouts are built once per datatype and shared, so they must not be
+    modified.
+    """
+    def __init__(self):
+        self.segments = [] # per node: path segment e.g. '.x' or '[3]'
+        self.parents = array('l') # per node: index of the parent node, -1 for none
+        self.nodes = array('l') # per leaf: index of its node, -1 for the datatype itself
+        self.offsets = array('L')
+        self.sizes = array('L')
+        self.ctypes = []
+
+    @classmethod
+    def single(cls, size, ctype):
+        """
+        Layout of a simple datatype: a single leaf with an empty path
+        """
+        layout = cls()
+        layout.nodes.append(-1)
+        layout.offsets.append(0)
+        layout.sizes.append(size)
+        layout.ctypes.append(ctype)
+        return layout
+
+    def extend(self, child, segment, offset):
+        """
+        Append the leaves of the LeafLayout child, as a member or item with
+        path segment segment at offset
+        """
+        parent = len(self.segments)
+        self.segments.append(segment)
+        self.parents.append(-1)
+
+        base = parent + 1
+        self.segments.extend(child.segments)
+        self.parents.extend([parent if p < 0 else p + base for p in child.parents])
+        self.nodes.extend([parent if n < 0 else n + base for n in child.nodes])
+        if offset:
+            self.offsets.extend([o + offset for o in child.offsets])
+        else:
+            self.offsets.extend(child.offsets)
+        self.sizes.extend(child.sizes)
+        self.ctypes.extend(child.ctypes)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def path(self, i):
+        """
+        Returns the path of leaf i
+        """
+        segments = []
+        node = self.nodes[i]
+        while node >= 0:
+            segments.append(self.segments[node])
+            node = self.parents[node]
+        return ''.join(reversed(segments))
+
+    def paths(self):
+        """
+        Returns a list of the paths of all leaves
+        """
+        # A parent node always precedes its children
+        nodePaths = []
+        append = nodePaths.append
+        for segment, parent in zip(self.segments, self.parents):
+            append(segment if parent < 0 else nodePaths[parent] + segment)
+        return [nodePaths[n] if n >= 0 else '' for n in self.nodes]
+
+    def __getitem__(self, i):
+        return Leaf(self.path(i), self.offsets[i], self.sizes[i], self.ctypes[i])
+
+    def __iter__(self):
+        return map(Leaf, self.paths(), self.offsets, self.sizes, self.ctypes)
@@ -0,0 +1,224 @@
+# Copyright (c) 2018, DEMCON advanced mechatronics
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# 
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+
+"""
+Local mirrors of PLC variables, which are read once, modified locally and of
+which only the modified bytes are written back:
+
+    with v.MAIN.config.edit() as config:
+        config.speed = 1.5
+        config.axes[2].enabled = True
+        config.name = 'recipe 3'
+    # The modified byte ranges are written on leaving the with block
+
+Members and items of a mirror are accessed like those of a Variable, but
+without ADS requests: reading a simple member returns its value from the
+local data, and assigning a member or item updates the local data and
+records the modified byte range. A structure can be assigned as a dict of
+member values, an array as a list of items. commit() merges adjacent ranges and writes
+all merged ranges in a single sum write request.
+"""
+
+from .adssymbols import (
+    ctypesValue, readSumRaw, writeSumRaw, InvalidatedVariableError
+    )
+from ctypes import Array, sizeof
+
+
+class VerifyError(IOError):
+    """
+    Raised by Mirror.commit(verify=True) when the data read back differs
+    from the data written. ranges holds the (start, end) byte ranges that
+    differ
+    """
+    def __init__(self, ranges):
+        super().__init__('Data read back differs in byte ranges %s' % ranges)
+        self.ranges = ranges
+
+
+def _convert(ctype, value):
+    """
+    Convert value to ctype: dicts of member values to structures, lists of
+    items to arrays (recursively) and other values with the ctype
+    constructor
+    """
+    if isinstance(value, ctype):
+        return value
+    if isinstance(value, dict):
+        fields = dict(ctype._fields_)
+        return ctype(**{name: _convert(fields[name], v) for name, v in value.items()})
+    if isinstance(value, (tuple, list)) and issubclass(ctype, Array):
+        return ctype(*[_convert(ctype._type_, v) for v in value])
+    return ctype(value)
+
+def _isLeaf(info):
+    return info.datatype is None or not (info.datatype.array or info.datatype.subItems)
+
+
+class MirrorNode:
+    """
+    A structure or array within a Mirror
+    """
+    __slots__ = ('_mirror', '_var')
+
+    def __init__(self, mirror, var):
+        object.__setattr__(self, '_mirror', mirror)
+        object.__setattr__(self, '_var', var)
+
+    def __getattr__(self, name):
+        return self._mirror._get(getattr(self._var, name))
+
+    def __setattr__(self, name, value):
+        self._mirror._set(getattr(self._var, name), value)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            raise TypeError('Mirrors cannot be sliced')
+        return self._mirror._get(self._var[idx])
+
+    def __setitem__(self, idx, value):
+        if isinstance(idx, slice):
+            raise TypeError('Mirrors cannot be sliced')
+        self._mirror._set(self._var[idx], value)
+
+    def __dir__(self):
+        return dir(self._var)
+
+    def __call__(self):
+        """
+        Returns a copy of the local data as a ctypes object
+        """
+        return self._mirror._value(self._var)
+
+
+class Mirror(MirrorNode):
+    """
+    Local mirror of a variable (a structure or array), see the module
+    documentation. Create it with Variable.edit().
+
+    Members whose names clash with the methods of Mirror can be accessed
+    through mirror.root.
+    """
+    __slots__ = ('root', 'data', '_offset', '_dirty')
+
+    def __init__(self, var):
+        info = ~var
+        if _isLeaf(info):
+            raise TypeError('Only structures and arrays can be edited')
+        super().__init__(self, var)
+        object.__setattr__(self, 'root', MirrorNode(self, var))
+        object.__setattr__(self, 'data', bytearray(info.datatype.size))
+        object.__setattr__(self, '_offset', info.offset)
+        object.__setattr__(self, '_dirty', [])
+        self.discard()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, *exc):
+        if excType is None:
+            self.commit()
+
+    def _range(self, var):
+        info = ~var
+        start = info.offset - self._offset
+        return info, start, start + sizeof(info.ctype)
+
+    def _address(self, start):
+        """
+        Returns the index group and index offset of byte start of the mirror
+        """
+        info = ~self._var
+        if not info.symbol.valid:
+            raise InvalidatedVariableError(
+                'Symbol %s was changed or removed from the PLC program' % info.symbol.name)
+        return info.symbol.iGroup, info.symbol.iOffs + info.offset + start
+
+    def _value(self, var):
+        info, start, end = self._range(var)
+        return info.ctype.from_buffer_copy(self.data, start)
+
+    def _get(self, var):
+        info = ~var
+        if not _isLeaf(info):
+            return MirrorNode(self, var)
+        return ctypesValue(self._value(var))
+
+    def _set(self, var, value):
+        info, start, end = self._range(var)
+        value = _convert(info.ctype, value)
+        self.data[start:end] = memoryview(value).cast('B')
+        self._dirty.append((start, end))
+
+    def dirtyRanges(self, gap=0):
+        """
+        Returns the sorted list of merged (start, end) byte ranges that were
+        modified. Ranges separated by at most gap bytes are merged as well
+        (the unmodified bytes in between are then written too).
+        """
+        merged = []
+        for start, end in sorted(self._dirty):
+            if merged and start <= merged[-1][1] + gap:
+                if end > merged[-1][1]:
+                    merged[-1] = (merged[-1][0], end)
+            else:
+                merged.append((start, end))
+        return merged
+
+    def commit(self, verify=False, gap=0):
+        """
+        Write the modified byte ranges to the PLC in a single sum write
+        request of all merged ranges (see dirtyRanges). With verify, the
+        written ranges are read back in a single sum read request and
+        compared, raising VerifyError if they differ.
+
+        Returns the list of written ranges
+        """
+        ranges = self.dirtyRanges(gap)
+        definition = (~self._var).variablesDefinition
+        view = memoryview(self.data)
+        writes = [self._address(start) + (view[start:end],) for start, end in ranges]
+        writeSumRaw(definition, writes)
+        del self._dirty[:]
+
+        if verify and ranges:
+            reads = [self._address(start) + (end - start,) for start, end in ranges]
+            different = [(start, end) for (start, end), readBack
+                in zip(ranges, readSumRaw(definition, reads)) if readBack != view[start:end]]
+            if different:
+                raise VerifyError(different)
+        return ranges
+
+    def discard(self):
+        """
+        Discard all modifications and read the variable again
+        """
+        self._var.readinto(self.data)
+        del self._dirty[:]
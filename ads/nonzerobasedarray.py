@@ -30,6 +30,12 @@
 # Ctypes non-zero-based array
 import ctypes
 
+_getitem = ctypes.Array.__getitem__
+_setitem = ctypes.Array.__setitem__
+
+# Number of items decoded at a time when iterating
+_CHUNK = 64
+
 class NonzeroBasedArray:
     """
     This class is a support for PLC arrays, which do not necessarily start at
@@ -54,14 +60,26 @@ class NonzeroBasedArray:
     def __init__(self, *args):
         super().__init__()
         
+        # The initializers are positional, so they need no index conversion
         for i, v in enumerate(args):
-            self[i + self._lbound_] = v
+            _setitem(self, i, v)
     
     def __getitem__(self, index):
-        return super().__getitem__(self.__convertindex__(index))
+        if index.__class__ is int:
+            # Fast path for the most common case
+            index -= self._lbound_
+            if index < 0:
+                raise IndexError('invalid index')
+            return _getitem(self, index)
+        return _getitem(self, self.__convertindex__(index))
 
     def __setitem__(self, index, value):
-        return super().__setitem__(self.__convertindex__(index), value)
+        if index.__class__ is int:
+            index -= self._lbound_
+            if index < 0:
+                raise IndexError('invalid index')
+            return _setitem(self, index, value)
+        return _setitem(self, self.__convertindex__(index), value)
 
     def __convertindex__(self, index):
         if isinstance(index, int):
@@ -92,15 +110,46 @@ class NonzeroBasedArray:
         
     def __iter__(self):
         '''
-        Iterate over the array
+        Iterate over the array. The items are decoded in chunks, so stopping
+        early does not decode the whole array
+        '''
+        for start in range(0, self._length_, _CHUNK):
+            yield from self.__items(start, min(start + _CHUNK, self._length_))
+    
+    def __reversed__(self):
+        for stop in range(self._length_, 0, -_CHUNK):
+            yield from reversed(self.__items(max(0, stop - _CHUNK), stop))
+    
+    def tolist(self):
+        '''
+        Returns a list of all items in the array. For arrays of structures or
+        arrays, the items refer to the memory of this array (like indexing)
+        '''
+        return self.__items(0, self._length_)
+    
+    def __items(self, start, stop):
+        '''
+        Returns a list of the items from (zero based) index start to stop
+        '''
+        # Let ctypes.Array do the work in one go
+        items = _getitem(self, slice(start, stop))
+        if isinstance(items, bytes):
+            # c_char array, keep items as single-character bytes like indexing
+            return [items[i:i+1] for i in range(len(items))]
+        return list(items)
+    
+    def view(self):
+        '''
+        Returns a memoryview of the array data without copying. For arrays of
+        simple numeric types, the memoryview has the native format of the
+        items (so it can be used by e.g. numpy.frombuffer or tolist()).
+        Otherwise, it is a view of the raw bytes.
         '''
-        i = self._lbound_
-        while True:
-            try:
-                yield self[i]
-            except IndexError:
-                raise StopIteration
-            i += 1
+        view = memoryview(self).cast('B')
+        format = getattr(self._type_, '_type_', None)
+        if isinstance(format, str) and len(format) == 1 and format in 'bBhHiIlLqQfd?c':
+            return view.cast(format)
+        return view
    
 if __name__ == '__main__':
         
@@ -0,0 +1,250 @@
+# Copyright (c) 2018, DEMCON advanced mechatronics
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# 
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+
+"""
+Search index of the paths of all variables of a PLC, so variables can be
+found by (part of) their name without creating a Variable for every node of
+the variable tree (see browser.AdsVariableBrowser)
+"""
+
+from array import array
+import itertools
+import threading
+
+
+class PathIndex:
+    """
+    The nodes of the variable tree of an AdsVariablesDefinition in a flat
+    table: per node its path segment (e.g. 'MAIN', '.axis' or '[3]') and the
+    index of its parent node (-1 for top level nodes). A parent node always
+    precedes its children.
+
+    The nodes are the namespaces (e.g. 'MAIN' of 'MAIN.axis'), symbols,
+    structure members and array items. The items of arrays of more than
+    maxArrayItems items are not indexed, but the array itself is.
+
+    For searching, the full path in lower case is stored for namespaces and
+    symbols; nodes within a symbol store their path relative to the symbol.
+    These relative paths are built once per datatype and shared by all
+    symbols of that datatype, so the index costs a few pointers per node.
+
+    The index is built by build(), or in a background thread by start().
+    It can be searched while it is being built; the search then covers the
+    nodes indexed so far and waits for the rest (see search()).
+    """
+    def __init__(self, definition, maxArrayItems=20):
+        self.definition = definition
+        self.maxArrayItems = maxArrayItems
+        self.segments = []
+        self.parents = array('l')
+        self.roots = array('l') # per node: its symbol node, -1 for namespaces and symbols
+        self.keys = [] # per node: (relative) path in lower case
+        self.ready = threading.Event()
+        self._templates = {} # datatype name -> list of (segment, relative parent, relative key)
+        self._last = None # (terms, indices of matching nodes) of the last complete search
+        self._thread = None
+
+    def start(self):
+        """
+        Build the index in a background thread
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.build, daemon=True)
+            self._thread.start()
+        return self
+
+    def build(self):
+        if self.ready.is_set():
+            return
+        namespaces = {} # namespace path -> node index
+        dtypes = self.definition.dtypes
+        for name in list(self.definition.symbols):
+            symbol = self.definition.symbols[name]
+            parent = -1
+            names = symbol.name.split('.')
+            for i in range(len(names) - 1):
+                path = '.'.join(names[:i + 1])
+                node = namespaces.get(path)
+                if node is None:
+                    node = namespaces[path] = self._add(
+                        names[i] if i == 0 else '.' + names[i], parent, -1, path.lower())
+                parent = node
+            node = self._add(names[-1] if parent < 0 else '.' + names[-1],
+                parent, -1, symbol.name.lower())
+            base = len(self.keys)
+            for segment, p, key in self._template(dtypes.get(symbol.type)):
+                self._add(segment, node if p < 0 else p + base, node, key)
+        self.ready.set()
+
+    def _add(self, segment, parent, root, key):
+        self.segments.append(segment)
+        self.parents.append(parent)
+        self.roots.append(root)
+        # Appended last, so nodes below len(self.keys) are complete
+        self.keys.append(key)
+        return len(self.keys) - 1
+
+    def _template(self, dtype):
+        """
+        Returns the descendants of a node of datatype dtype (an
+        AdsDatatypeEntry or None) as a list of (segment, parent, key) tuples,
+        in which parent is relative to the first descendant or -1 for the
+        node itself, and key is the path relative to the node in lower case
+        """
+        if dtype is None:
+            return []
+        dtypes = self.definition.dtypes
+        shared = dtype is dtypes.get(dtype.name)
+        if shared and dtype.name in self._templates:
+            return self._templates[dtype.name]
+
+        template = []
+        def add(segment, child):
+            parent = len(template)
+            key = segment.lower()
+            template.append((segment, -1, key))
+            template.extend((s, parent if p < 0 else p + parent + 1, key + k)
+                for s, p, k in self._template(child))
+
+        if dtype.array:
+            elements = 1
+            for lbound, n in dtype.array:
+                elements *= n
+            if elements <= self.maxArrayItems:
+                child = dtypes.get(dtype.type)
+                dims = [range(lbound, lbound + n) for lbound, n in dtype.array]
+                for idx in itertools.product(*dims):
+                    add('[%s]' % ','.join(str(i) for i in idx), child)
+
+        elif dtype.subItems:
+            for name, subItem in dtype.subItems.items():
+                add('.' + name, dtypes.get(subItem.type) if subItem.type else subItem)
+
+        elif dtype.type and not dtype.name.startswith('POINTER TO '):
+            # Alias e.g. enum
+            template = self._template(dtypes.get(dtype.type))
+
+        if shared:
+            self._templates[dtype.name] = template
+        return template
+
+    def __len__(self):
+        return len(self.keys)
+
+    def path(self, i):
+        """
+        Returns the path of node i, e.g. 'MAIN.axes[2].status', which can be
+        looked up with AdsVariablesDefinition.getVariable
+        """
+        segments = []
+        while i >= 0:
+            segments.append(self.segments[i])
+            i = self.parents[i]
+        return ''.join(reversed(segments))
+
+    def names(self, i):
+        """
+        Returns the names of node i and its ancestors as they appear in the
+        variable tree, e.g. ['MAIN', 'axes', '[2]', 'status']
+        """
+        names = []
+        while i >= 0:
+            names.append(self.segments[i].lstrip('.'))
+            i = self.parents[i]
+        return names[::-1]
+
+    def search(self, query, limit=1000, batchSize=100, scanSize=20000):
+        """
+        Search for the nodes of which the path contains all (whitespace
+        separated) terms of query, case insensitive. Descendants of a
+        matching node are not reported, as they are found by expanding it.
+
+        Returns a generator that yields lists of node indices, so the
+        results can be processed while the search proceeds: a list when
+        batchSize results were found, and after every scanSize nodes
+        scanned or while waiting for the index to be built (which may be an
+        empty list). It stops after limit results.
+
+        A search that narrows down the last complete search (e.g. while the
+        query is being typed) only scans the nodes that matched before.
+        """
+        terms = query.lower().split()
+        last = self._last
+        if last is not None and all(any(t in n for n in terms) for t in last[0]):
+            candidates = last[1]
+        else:
+            candidates = None
+        return self._search(terms, candidates, limit, batchSize, scanSize)
+
+    def _search(self, terms, candidates, limit, batchSize, scanSize):
+        keys, parents, roots = self.keys, self.parents, self.roots
+        matches = array('l')
+        matched = bytearray()
+        results = []
+        count = 0
+        i = 0
+        while True:
+            ready = candidates is not None or self.ready.is_set()
+            end = len(candidates) if candidates is not None else len(keys)
+            matched.extend(bytes(len(keys) - len(matched)))
+            while i < end:
+                for n in (candidates[i:i + scanSize] if candidates is not None
+                        else range(i, min(i + scanSize, end))):
+                    root = roots[n]
+                    key = keys[n] if root < 0 else keys[root] + keys[n]
+                    for t in terms:
+                        if t not in key:
+                            break
+                    else:
+                        matches.append(n)
+                        matched[n] = 1
+                        parent = parents[n]
+                        if parent < 0 or not matched[parent]:
+                            results.append(n)
+                            count += 1
+                            if count >= limit:
+                                yield results
+                                return
+                            if len(results) >= batchSize:
+                                yield results
+                                results = []
+                i = min(i + scanSize, end)
+                if i < end:
+                    yield results
+                    results = []
+            if ready:
+                break
+            yield results
+            results = []
+            self.ready.wait(0.01)
+
+        if results:
+            yield results
+        self._last = (terms, matches)
@@ -0,0 +1,354 @@
+# Copyright (c) 2018, DEMCON advanced mechatronics
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# 
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+
+"""
+Description of a PLC program in terms of data types and symbols, and encoding
+of that description into the binary blobs that a PLC serves through
+ADSIGRP_SYM_UPLOAD and ADSIGRP_SYM_DT_UPLOAD.
+
+This makes it possible to exercise the adssymbols module without a PLC, e.g.
+for benchmarks and tests. The blobs are parsed back by AdsSymbolEntry and
+AdsDatatypeEntry.
+"""
+
+from .adssymbols import basictypes
+from collections import OrderedDict, namedtuple
+from ctypes import sizeof
+import random
+import re
+import struct
+import zlib
+
+
+# Data type identifiers (ADST_*) as used in the dataType field of entries
+ADST_VOID = 0
+ADST_INT16 = 2
+ADST_INT32 = 3
+ADST_REAL32 = 4
+ADST_REAL64 = 5
+ADST_INT8 = 16
+ADST_UINT8 = 17
+ADST_UINT16 = 18
+ADST_UINT32 = 19
+ADST_INT64 = 20
+ADST_UINT64 = 21
+ADST_STRING = 30
+ADST_BIT = 33
+ADST_BIGTYPE = 65
+
+ADSDATATYPEFLAG_DATATYPE = 0x1
+ADSDATATYPEFLAG_DATAITEM = 0x2
+
+# Index group in which the generated symbols are located
+ADSIGRP_PLC_DATA = 0x4040
+
+basicDatatypeIds = {
+    'BOOL': ADST_BIT,
+    'BIT': ADST_BIT,
+    'BYTE': ADST_UINT8,
+    'DATE': ADST_UINT32,
+    'DINT': ADST_INT32,
+    'DT': ADST_UINT32,
+    'DWORD': ADST_UINT32,
+    'INT': ADST_INT16,
+    'LREAL': ADST_REAL64,
+    'REAL': ADST_REAL32,
+    'SINT': ADST_INT8,
+    'TIME': ADST_UINT32,
+    'TOD': ADST_UINT32,
+    'UDINT': ADST_UINT32,
+    'UINT': ADST_UINT16,
+    'USINT': ADST_UINT8,
+    'WORD': ADST_UINT16,
+    'LINT': ADST_INT64,
+    'ULINT': ADST_UINT64,
+    'PVOID': ADST_UINT64,
+    'OTCID': ADST_UINT32,
+}
+
+# Structures are packed like TwinCAT does by default: natural alignment of
+# each member, but at most 8 bytes
+MAX_ALIGNMENT = 8
+
+
+Member = namedtuple('Member', 'name type offs size comment')
+Datatype = namedtuple('Datatype', 'name type size alignment members array comment')
+Symbol = namedtuple('Symbol', 'name type iGroup iOffs size comment')
+
+
+def _align(offset, alignment):
+    return (offset + alignment - 1) // alignment * alignment
+
+def _entry(header, fieldsformat, strings, tail=b''):
+    """
+    Pack a symbol or datatype entry. The first field of the header (the
+    entry length) is filled in; the entry is padded to a multiple of 4 bytes
+    """
+    body = b''.join(s.encode('latin-1') + b'\0' for s in strings) + tail
+    length = _align(struct.calcsize(fieldsformat) + len(body), 4)
+    data = struct.pack(fieldsformat, length, *header) + body
+    return data + b'\0' * (length - len(data))
+
+def encodeDatatypeEntry(name, type, size, offs=0, dataType=ADST_BIGTYPE,
+        flags=ADSDATATYPEFLAG_DATATYPE, comment='', array=(), subItems=(),
+        hashValue=0, typeHashValue=0):
+    """
+    Encode a single datatype entry, in the format parsed by AdsDatatypeEntry.
+
+    array: list of (lBound, elements) tuples
+    subItems: list of already encoded datatype entries
+    """
+    tail = b''.join(struct.pack('<lL', lbound, elements) for lbound, elements in array)
+    tail += b''.join(subItems)
+    header = (1, hashValue, typeHashValue, size, offs, dataType, flags,
+        len(name), len(type), len(comment), len(array), len(subItems))
+    return _entry(header, '<LLLLLLLLHHHHH', (name, type, comment), tail)
+
+def encodeSymbolEntry(name, type, iGroup, iOffs, size, dataType=ADST_BIGTYPE,
+        flags=0, comment=''):
+    """
+    Encode a single symbol entry, in the format parsed by AdsSymbolEntry
+    """
+    header = (iGroup, iOffs, size, dataType, flags, len(name), len(type), len(comment))
+    return _entry(header, '<LLLLLLHHH', (name, type, comment))
+
+def arrayTypeName(elementType, array):
+    """
+    Compose the name TwinCAT uses for an array type, e.g.
+    ARRAY [1..4,0..9] OF INT
+    """
+    dims = ','.join('%d..%d' % (lbound, lbound + elements - 1) for lbound, elements in array)
+    return 'ARRAY [%s] OF %s' % (dims, elementType)
+
+
+class PlcProgram:
+    """
+    Description of the data types and symbols of a PLC program.
+
+    Data types are added with addStruct, addAlias and arrayType; symbols with
+    addSymbol. Symbols are allocated consecutively in a single index group.
+    The encoded blobs are obtained with symbolsBlob() and datatypesBlob().
+    """
+    def __init__(self, indexGroup=ADSIGRP_PLC_DATA):
+        self.indexGroup = indexGroup
+        self.datatypes = OrderedDict() # name -> Datatype
+        self.symbols = OrderedDict() # name -> Symbol
+        self.imageSize = 0
+
+    def sizeof(self, typename):
+        return self._layout(typename)[0]
+
+    def _layout(self, typename):
+        """
+        Returns (size, alignment) of a type given by name
+        """
+        dtype = self.datatypes.get(typename)
+        if dtype is not None:
+            return dtype.size, dtype.alignment
+
+        stringMatch = re.match(r'STRING\((\d+)\)', typename)
+        if stringMatch is not None:
+            return int(stringMatch.group(1)) + 1, 1
+
+        try:
+            size = sizeof(basictypes[typename])
+        except KeyError:
+            raise ValueError('Unknown type %s' % typename)
+        return size, min(size, MAX_ALIGNMENT)
+
+    def addStruct(self, name, members, comment=''):
+        """
+        Add a structure type. members is a list of (name, typename) tuples;
+        the member offsets are computed from the member types.
+        """
+        offset = 0
+        alignment = 1
+        layout = []
+        for memberName, memberType in members:
+            size, memberAlignment = self._layout(memberType)
+            offset = _align(offset, memberAlignment)
+            layout.append(Member(memberName, memberType, offset, size, ''))
+            offset += size
+            alignment = max(alignment, memberAlignment)
+
+        self.datatypes[name] = Datatype(name, '', _align(offset, alignment),
+            alignment, layout, [], comment)
+        return name
+
+    def addAlias(self, name, basetype, comment=''):
+        """
+        Add an alias type (which is how enums are represented)
+        """
+        size, alignment = self._layout(basetype)
+        self.datatypes[name] = Datatype(name, basetype, size, alignment, [], [], comment)
+        return name
+
+    def arrayType(self, elementType, array):
+        """
+        Returns the name of the array type of elementType with the given
+        dimensions (list of (lBound, elements) tuples), adding it if required
+        """
+        name = arrayTypeName(elementType, array)
+        if name not in self.datatypes:
+            size, alignment = self._layout(elementType)
+            for lbound, elements in array:
+                size *= elements
+            self.datatypes[name] = Datatype(name, elementType, size, alignment, [], list(array), '')
+        return name
+
+    def addSymbol(self, name, type, comment=''):
+        """
+        Add a symbol of the given type, allocated after the previous symbol
+        """
+        size, alignment = self._layout(type)
+        offset = _align(self.imageSize, alignment)
+        symbol = Symbol(name, type, self.indexGroup, offset, size, comment)
+        self.symbols[name] = symbol
+        self.imageSize = offset + size
+        return symbol
+
+    def _dataType(self, typename):
+        if typename in basicDatatypeIds:
+            return basicDatatypeIds[typename]
+        if typename.startswith('STRING('):
+            return ADST_STRING
+        dtype = self.datatypes.get(typename)
+        if dtype is not None and dtype.type and not dtype.array:
+            return self._dataType(dtype.type)
+        return ADST_BIGTYPE
+
+    def typeHash(self, typename, _cache=None):
+        """
+        Hash of the layout of a type, including the layout of all types it
+        refers to. This is what the hashValue field of a datatype entry holds.
+        """
+        if _cache is None:
+            _cache = {}
+        if typename in _cache:
+            return _cache[typename]
+
+        dtype = self.datatypes.get(typename)
+        if dtype is None:
+            description = typename
+        else:
+            description = '%s;%s;%d;%r;%s;%s' % (
+                dtype.name, dtype.type, dtype.size, dtype.array,
+                self.typeHash(dtype.type, _cache) if dtype.type else '',
+                ','.join('%s:%d:%d' % (m.name, m.offs, self.typeHash(m.type, _cache))
+                    for m in dtype.members))
+
+        _cache[typename] = value = zlib.crc32(description.encode('latin-1'))
+        return value
+
+    def datatypesBlob(self):
+        cache = {}
+        entries = []
+        for dtype in self.datatypes.values():
+            subItems = [
+                encodeDatatypeEntry(m.name, m.type, m.size, m.offs,
+                    dataType=self._dataType(m.type),
+                    flags=ADSDATATYPEFLAG_DATAITEM, comment=m.comment,
+                    hashValue=self.typeHash(m.type, cache))
+                for m in dtype.members
+                ]
+            entries.append(encodeDatatypeEntry(dtype.name, dtype.type,
+                dtype.size, dataType=self._dataType(dtype.name),
+                comment=dtype.comment, array=dtype.array, subItems=subItems,
+                hashValue=self.typeHash(dtype.name, cache),
+                typeHashValue=self.typeHash(dtype.type, cache) if dtype.type else 0))
+        return b''.join(entries)
+
+    def symbolsBlob(self):
+        return b''.join(
+            encodeSymbolEntry(s.name, s.type, s.iGroup, s.iOffs, s.size,
+                dataType=self._dataType(s.type), comment=s.comment)
+            for s in self.symbols.values())
+
+    def uploadInfo(self):
+        """
+        Returns the 6 values read through ADSIGRP_SYM_UPLOADINFO2: number of
+        symbols, size of the symbols blob, number of datatypes, size of the
+        datatypes blob, max and used dynamic symbols
+        """
+        return (len(self.symbols), len(self.symbolsBlob()),
+            len(self.datatypes), len(self.datatypesBlob()), 0, 0)
+
+
+def syntheticProgram(nSymbols, seed=0, symbolsPerPou=50):
+    """
+    Generate a PlcProgram with nSymbols symbols of a realistic mix of types:
+    basic types, enums (aliases), strings, nested structures and (non-zero
+    based, multi-dimensional) arrays, spread over a number of POUs.
+
+    The generated program is deterministic for a given seed.
+    """
+    rnd = random.Random(seed)
+    program = PlcProgram()
+
+    simpleTypes = ['BOOL', 'BYTE', 'INT', 'UINT', 'DINT', 'UDINT', 'REAL',
+        'LREAL', 'TIME', 'LINT', 'STRING(80)']
+
+    eState = program.addAlias('E_State', 'INT')
+    eMode = program.addAlias('E_Mode', 'DINT')
+
+    stVector = program.addStruct('ST_Vector',
+        [('x', 'LREAL'), ('y', 'LREAL'), ('z', 'LREAL')])
+    stStatus = program.addStruct('ST_Status', [
+        ('state', eState), ('busy', 'BOOL'), ('error', 'BOOL'),
+        ('errorId', 'UDINT'), ('message', 'STRING(80)')])
+    stAxis = program.addStruct('ST_Axis', [
+        ('enabled', 'BOOL'), ('position', 'LREAL'), ('velocity', 'REAL'),
+        ('target', stVector), ('status', stStatus),
+        ('history', program.arrayType('LREAL', [(-5, 11)])),
+        ('mode', eMode)])
+    stRecipe = program.addStruct('ST_Recipe', [
+        ('name', 'STRING(31)'), ('id', 'UINT'),
+        ('setpoints', program.arrayType('REAL', [(1, 16)])),
+        ('matrix', program.arrayType('INT', [(0, 3), (1, 4)])),
+        ('axis', stAxis)])
+
+    complexTypes = [
+        stVector, stStatus, stAxis, stRecipe, eState, eMode,
+        program.arrayType(stAxis, [(1, 4)]),
+        program.arrayType('DINT', [(-10, 21)]),
+        program.arrayType('LREAL', [(0, 100)]),
+        program.arrayType(stVector, [(0, 2), (-1, 3)]),
+        program.arrayType('STRING(20)', [(1, 5)]),
+        ]
+
+    for i in range(nSymbols):
+        pou = 'MAIN' if i < symbolsPerPou else 'GVL_%d' % (i // symbolsPerPou)
+        if rnd.random() < 0.6:
+            type = rnd.choice(simpleTypes)
+        else:
+            type = rnd.choice(complexTypes)
+        program.addSymbol('%s.var%d' % (pou, i), type)
+
+    return program
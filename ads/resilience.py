@@ -0,0 +1,303 @@
+# Copyright (c) 2018, DEMCON advanced mechatronics
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# 
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+
+"""
+Deadlines, retries and circuit breaking of ADS requests, so that an
+unreachable target does not stall every caller:
+
+    with ResilientAdsDll(timeout=0.5, retries=2):
+        v = adssymbols.getVariables()
+        with deadline(0.1):
+            v.MAIN.counter()
+
+ResilientAdsDll is installed in place of the ADS lib (see
+cpyads.AdsDll.install) and forwards all requests to the lib it replaced:
+
+- The timeout of each request is limited to the time left until the
+  deadline of the calling thread (see deadline()), or to the timeout of the
+  ResilientAdsDll. When the deadline has passed, requests fail with
+  AdsTimeoutError without being sent.
+- Requests that fail with a transient error (a timeout or an unreachable
+  target) are retried with exponential backoff, as long as the deadline
+  allows. Writes and read-writes (other than sum reads) that timed out are
+  not retried, since they may have been executed by the target (unless
+  retryWrites is set). Without a deadline or timeout, the port has the
+  timeout that was set on it again.
+- Each target has a CircuitBreaker. After a number of consecutive transient
+  failures, requests to the target fail fast with CircuitOpenError, except
+  for a single probe request every probeInterval seconds.
+
+The timeout is set on the port of the request, so threads that use
+different deadlines should use their own port (see cpyads.setThreadPort).
+"""
+
+from . import cpyads
+from .adssymbols import ADSIGRP_SUMUP_READ
+from .cpyads import deadline, getThreadDeadline
+from ctypes import string_at
+import random
+import threading
+import time
+
+
+# Errors after which a request is retried, and which count as a failure of
+# the target
+TRANSIENT_ERRORS = frozenset([
+    cpyads.ADSERR_CLIENT_SYNCTIMEOUT,
+    cpyads.ADSERR_TARGET_PORT_NOT_FOUND,
+    cpyads.ADSERR_TARGET_MACHINE_NOT_FOUND,
+    cpyads.ADSERR_CLIENT_NOAMSADDR,
+    ])
+
+# Requests that can safely be sent again after a timeout, since they have no
+# side effects on the target
+IDEMPOTENT_REQUESTS = ('AdsSyncReadReq', 'AdsSyncReadStateReq')
+
+# Index groups of read-write requests that only read, e.g. sum reads
+IDEMPOTENT_READWRITE_GROUPS = frozenset([ADSIGRP_SUMUP_READ])
+
+
+class CircuitOpenError(cpyads.AdsTargetError):
+    """
+    Raised without sending the request, because the target failed recently.
+    code is the error code of the last failure
+    """
+
+
+class CircuitBreaker:
+    """
+    Tracks the failures of a single target.
+
+    The breaker is closed while the target works. After failures consecutive
+    failures it opens: requests are not allowed, except for a probe request
+    every probeInterval seconds. A successful request closes it again.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+
+    def __init__(self, failures=3, probeInterval=1.0):
+        self.failures = failures
+        self.probeInterval = probeInterval
+        self.state = self.CLOSED
+        self.consecutiveFailures = 0
+        self.lastError = None
+        self._nextProbe = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        Returns whether a request may be sent. While open, True is returned
+        once per probeInterval
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            now = time.monotonic()
+            if now >= self._nextProbe:
+                self._nextProbe = now + self.probeInterval
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.consecutiveFailures = 0
+
+    def failure(self, code):
+        with self._lock:
+            self.lastError = code
+            self.consecutiveFailures += 1
+            if self.state == self.CLOSED and self.consecutiveFailures >= self.failures:
+                self.state = self.OPEN
+                self._nextProbe = time.monotonic() + self.probeInterval
+
+
+class ResilientAdsDll:
+    """
+    Replacement of the ADS lib which applies deadlines, retries and circuit
+    breakers to the requests (see the module documentation).
+
+    lib: lib to which the requests are forwarded (default: the currently
+      installed lib)
+    timeout: timeout [s] of each request attempt, or None to keep the
+      timeout of the port
+    retries: number of times a request that failed with a transient error is
+      retried
+    retryWrites: also retry writes and read-writes that timed out. A timed
+      out request may have been executed by the target, so this repeats its
+      side effects, e.g. of a command sent with Variable.exchange
+    backoff: delay [s] before the first retry; it doubles for each next retry
+      (with random jitter), up to maxBackoff
+    failures, probeInterval: settings of the CircuitBreaker of each target
+
+    Use as a context manager to install it for the duration of the with
+    block, or install it with cpyads.AdsDll.install
+    """
+    # The port timeouts are set by _call rather than by cpyads
+    appliesDeadlines = True
+
+    def __init__(self, lib=None, timeout=None, retries=2, backoff=0.01,
+            maxBackoff=1.0, failures=3, probeInterval=1.0, retryWrites=False):
+        self.lib = cpyads.AdsDll.lib() if lib is None else lib
+        self.timeout = timeout
+        self.retries = retries
+        self.retryWrites = retryWrites
+        self.backoff = backoff
+        self.maxBackoff = maxBackoff
+        self.failures = failures
+        self.probeInterval = probeInterval
+        self.breakers = {} # 'netId:port' -> CircuitBreaker
+        self._timeouts = {} # port (None for the default port) -> timeout [ms] set
+        self._portTimeouts = {} # port -> timeout [ms] set with AdsSyncSetTimeout(Ex)
+        self._lock = threading.Lock()
+        self._random = random.Random()
+        self._previous = None
+
+    def __enter__(self):
+        self._previous = cpyads.AdsDll.install(self)
+        return self
+
+    def __exit__(self, *exc):
+        cpyads.AdsDll.install(self._previous)
+
+    def breaker(self, pAddr):
+        """
+        Returns the CircuitBreaker of the target addressed by pAddr (a
+        pointer to an SAmsAddr)
+        """
+        data = string_at(pAddr, 8)
+        target = '%s:%d' % ('.'.join(map(str, data[:6])), int.from_bytes(data[6:], 'little'))
+        with self._lock:
+            breaker = self.breakers.get(target)
+            if breaker is None:
+                breaker = self.breakers[target] = CircuitBreaker(self.failures, self.probeInterval)
+            return breaker
+
+    def _setTimeout(self, port, timeout):
+        """
+        Set the timeout [s] of port, if it differs from the last one set
+        """
+        ms = max(1, int(timeout * 1000))
+        with self._lock:
+            if self._timeouts.get(port) == ms:
+                return
+            self._setPortTimeout(port, ms)
+            self._timeouts[port] = ms
+
+    def _restoreTimeout(self, port):
+        """
+        Restore the timeout of port after _setTimeout, to the timeout set
+        with AdsSyncSetTimeout(Ex) or the default timeout
+        """
+        with self._lock:
+            if port not in self._timeouts:
+                return
+            self._setPortTimeout(port, self._portTimeouts.get(port, cpyads.DEFAULT_TIMEOUT))
+            del self._timeouts[port]
+
+    def _setPortTimeout(self, port, ms):
+        if port is None:
+            self.lib.AdsSyncSetTimeout(ms)
+        else:
+            self.lib.AdsSyncSetTimeoutEx(port, ms)
+
+    def _idempotent(self, name, request):
+        """
+        Whether the request name with the arguments request (following the
+        port and address) can safely be sent again after a timeout
+        """
+        if self.retryWrites or name.startswith(IDEMPOTENT_REQUESTS):
+            return True
+        return (name.startswith('AdsSyncReadWriteReq')
+            and getattr(request[0], 'value', request[0]) in IDEMPOTENT_READWRITE_GROUPS)
+
+    def _call(self, name, function, port, pAddr, args):
+        idempotent = self._idempotent(name, args[2 if name.endswith(('Ex', 'Ex2')) else 1:])
+        breaker = self.breaker(pAddr)
+        end = getThreadDeadline()
+        attempt = 0
+        while True:
+            timeout = self.timeout
+            if end is not None:
+                remaining = end - time.monotonic()
+                if remaining <= 0:
+                    raise cpyads.AdsTimeoutError(cpyads.ADSERR_CLIENT_SYNCTIMEOUT)
+                timeout = remaining if timeout is None else min(timeout, remaining)
+
+            if not breaker.allow():
+                raise CircuitOpenError(breaker.lastError)
+
+            try:
+                if timeout is not None:
+                    self._setTimeout(port, timeout)
+                else:
+                    self._restoreTimeout(port)
+                result = function(*args)
+            except cpyads.AdsError as e:
+                if e.code not in TRANSIENT_ERRORS:
+                    # The target did respond
+                    breaker.success()
+                    raise
+                breaker.failure(e.code)
+                if attempt >= self.retries or breaker.state == CircuitBreaker.OPEN:
+                    raise
+                if e.code == cpyads.ADSERR_CLIENT_SYNCTIMEOUT and not idempotent:
+                    # The request may have been executed
+                    raise
+                error = e
+            else:
+                breaker.success()
+                return result
+
+            delay = min(self.maxBackoff, self.backoff * 2 ** attempt)
+            delay *= self._random.uniform(0.5, 1.0)
+            if end is not None and time.monotonic() + delay >= end:
+                raise error
+            time.sleep(delay)
+            attempt += 1
+
+    def AdsSyncSetTimeout(self, timeout):
+        self.AdsSyncSetTimeoutEx(None, timeout)
+
+    def AdsSyncSetTimeoutEx(self, port, timeout):
+        with self._lock:
+            self._setPortTimeout(port, timeout)
+            self._portTimeouts[port] = getattr(timeout, 'value', timeout)
+            self._timeouts.pop(port, None)
+
+    def __getattr__(self, name):
+        # Requests are forwarded through _call, other functions (opening
+        # ports etc.) directly
+        function = getattr(self.lib, name)
+        if not name.startswith('AdsSync'):
+            return function
+        if name.endswith(('Ex', 'Ex2')):
+            return lambda port, pAddr, *args: self._call(name, function, port, pAddr, (port, pAddr) + args)
+        return lambda pAddr, *args: self._call(name, function, None, pAddr, (pAddr,) + args)
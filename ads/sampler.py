@@ -0,0 +1,182 @@
+# Copyright (c) 2018, DEMCON advanced mechatronics
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# 
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+
+"""
+Sampling of variables at a fixed period
+"""
+
+from collections import deque, namedtuple
+import queue
+import threading
+import time
+
+
+Sample = namedtuple('Sample', 'cycle deadline timestamp latency values error')
+Sample.__doc__ = """
+A single sample taken by a CyclicSampler
+
+cycle: cycle number, counted from 0 at start (missed cycles are counted too)
+deadline: time.monotonic() time at which the sample was scheduled
+timestamp: time.monotonic() time at which the read started
+latency: duration [s] of the read
+values: list of the values of the variables, or None if the read failed
+error: the exception raised by the read, or None
+"""
+
+
+def percentiles(values, ps=(50, 90, 99)):
+    """
+    Returns a dict of 'p<p>' -> p-th percentile (nearest rank) of values for
+    each p in ps, and 'max'
+    """
+    values = sorted(values)
+    if not values:
+        return {}
+    result = {'p%g' % p: values[min(len(values) - 1, int(len(values) * p / 100))] for p in ps}
+    result['max'] = values[-1]
+    return result
+
+
+class CyclicSampler:
+    """
+    Reads a set of variables at a fixed period on a dedicated thread.
+
+    Cycles are scheduled at absolute deadlines (start + n * period), so the
+    read latency does not make the period drift. When a read takes so long
+    that one or more deadlines have passed by more than a period, those
+    cycles are skipped and counted as missed instead of being caught up.
+
+    variables: list of Variables
+    period: sample period [s]
+    consumer: callable that is called with each Sample, or a queue (an
+      object with a put_nowait method) to which each Sample is put. Samples
+      that do not fit in the queue are counted as dropped.
+    read: callable that reads a list of variables and returns a list of
+      values. By default, the variables are read one by one.
+    history: number of recent samples of which the jitter and latency are
+      kept for statistics()
+
+    Use start() and stop(), or use as a context manager.
+    """
+    def __init__(self, variables, period, consumer=None, read=None, history=10000):
+        self.variables = list(variables)
+        self.period = period
+        self.consumer = consumer
+        self.read = read or (lambda variables: [var() for var in variables])
+
+        self.samples = 0
+        self.missed = 0
+        self.dropped = 0
+        self.errors = 0
+        self._jitter = deque(maxlen=history)
+        self._latency = deque(maxlen=history)
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='CyclicSampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _deliver(self, sample):
+        if self.consumer is None:
+            return
+        put = getattr(self.consumer, 'put_nowait', None)
+        if put is None:
+            self.consumer(sample)
+            return
+        try:
+            put(sample)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        period = self.period
+        deadline = time.monotonic()
+        cycle = 0
+
+        while True:
+            delay = deadline - time.monotonic()
+            if self._stop.wait(delay) if delay > 0 else self._stop.is_set():
+                return
+
+            timestamp = time.monotonic()
+            try:
+                values, error = self.read(self.variables), None
+            except Exception as e:
+                values, error = None, e
+                self.errors += 1
+            latency = time.monotonic() - timestamp
+
+            self.samples += 1
+            self._jitter.append(timestamp - deadline)
+            self._latency.append(latency)
+            self._deliver(Sample(cycle, deadline, timestamp, latency, values, error))
+
+            # Skip the cycles of which the deadline passed more than a period
+            # ago
+            cycle += 1
+            deadline += period
+            now = time.monotonic()
+            if now - deadline >= period:
+                skipped = int((now - deadline) // period)
+                cycle += skipped
+                deadline += skipped * period
+                self.missed += skipped
+
+    def statistics(self):
+        """
+        Returns a dict with the number of samples, missed cycles, dropped
+        samples and read errors, and percentiles of the jitter (the time [s]
+        the read started after its deadline) and the latency (the duration
+        [s] of the read) of recent samples
+        """
+        return dict(
+            samples=self.samples,
+            missed=self.missed,
+            dropped=self.dropped,
+            errors=self.errors,
+            jitter=percentiles(list(self._jitter)),
+            latency=percentiles(list(self._latency)),
+            )
@@ -0,0 +1,245 @@
+# Copyright (c) 2018, DEMCON advanced mechatronics
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# 
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+
+"""
+Scheduling of ADS requests by priority, so that time-critical requests do not
+queue behind bulk transfers:
+
+    with RequestScheduler(limits={BULK: 1}):
+        with priority(BULK):
+            recording = v.MAIN.log()       # read in chunks
+        ...
+        with priority(CONTROL):            # e.g. on another thread
+            v.MAIN.setpoint(1.5)           # goes before the next chunk
+
+The scheduler is installed in place of the ADS lib (see
+cpyads.AdsDll.install) and forwards all requests to the lib it replaced. Each
+request takes the priority class of the thread that issues it (interactive by
+default) and waits until it may start: no more than concurrency requests are
+in progress, no more than the limit of its class, and no request of a higher
+class is waiting that could start. Bulk reads and writes of plain memory are
+split into chunks that are scheduled separately, so a control request waits
+for at most one chunk.
+"""
+
+from . import cpyads
+from .sampler import percentiles
+from collections import deque
+from contextlib import contextmanager
+from ctypes import c_void_p, cast
+import threading
+import time
+
+
+# Priority classes, from high to low
+CONTROL = 'control'
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+PRIORITIES = (CONTROL, INTERACTIVE, BULK)
+
+# Index groups addressing plain process image memory, of which reads and
+# writes can be split at any offset
+ADSIGRP_IOIMAGE_RWIB = 0xF020
+ADSIGRP_IOIMAGE_RWOB = 0xF030
+CHUNKED_GROUPS = (0x4020, 0x4040, ADSIGRP_IOIMAGE_RWIB, ADSIGRP_IOIMAGE_RWOB)
+
+
+_threadState = threading.local()
+
+def setThreadPriority(priority):
+    """
+    Issue all ADS requests from the current thread in the given priority
+    class (CONTROL, INTERACTIVE or BULK).
+
+    Returns the previous priority class of this thread
+    """
+    if priority not in PRIORITIES:
+        raise ValueError('Unknown priority class %r' % (priority,))
+    previous = getThreadPriority()
+    _threadState.priority = priority
+    return previous
+
+def getThreadPriority():
+    return getattr(_threadState, 'priority', INTERACTIVE)
+
+@contextmanager
+def priority(priorityClass):
+    """
+    Issue the ADS requests from the current thread within the with block in
+    the given priority class
+    """
+    previous = setThreadPriority(priorityClass)
+    try:
+        yield
+    finally:
+        setThreadPriority(previous)
+
+
+class RequestScheduler:
+    """
+    Replacement of the ADS lib which schedules requests by priority class.
+
+    lib: lib to which the requests are forwarded (default: the currently
+      installed lib)
+    concurrency: maximum number of requests in progress at the same time
+    limits: dict of priority class -> maximum number of requests of that
+      class in progress at the same time (default: concurrency)
+    chunkSize: bulk reads and writes of more than chunkSize bytes in one of
+      chunkedGroups are split into chunks of chunkSize bytes. Note that the
+      data of a chunked read is not read consistently as a whole.
+    history: number of recent requests per class of which the queue wait is
+      kept for statistics()
+
+    Use as a context manager to install it for the duration of the with
+    block, or install it with cpyads.AdsDll.install
+    """
+    def __init__(self, lib=None, concurrency=1, limits=None, chunkSize=1024,
+            chunkedGroups=CHUNKED_GROUPS, history=10000):
+        self.lib = cpyads.AdsDll.lib() if lib is None else lib
+        self.concurrency = concurrency
+        self.limits = {p: concurrency for p in PRIORITIES}
+        self.limits.update(limits or {})
+        self.chunkSize = chunkSize
+        self.chunkedGroups = frozenset(chunkedGroups)
+
+        self._condition = threading.Condition()
+        self._waiting = {p: deque() for p in PRIORITIES}
+        self._running = dict.fromkeys(PRIORITIES, 0)
+        self._inProgress = 0
+        self._requests = dict.fromkeys(PRIORITIES, 0)
+        self._wait = {p: deque(maxlen=history) for p in PRIORITIES}
+        self._previous = None
+
+    def __enter__(self):
+        self._previous = cpyads.AdsDll.install(self)
+        return self
+
+    def __exit__(self, *exc):
+        cpyads.AdsDll.install(self._previous)
+
+    def _mayStart(self, priority, ticket):
+        if (self._waiting[priority][0] is not ticket
+                or self._inProgress >= self.concurrency
+                or self._running[priority] >= self.limits[priority]):
+            return False
+        for higher in PRIORITIES[:PRIORITIES.index(priority)]:
+            if self._waiting[higher] and self._running[higher] < self.limits[higher]:
+                return False
+        return True
+
+    def _acquire(self, priority):
+        ticket = object()
+        with self._condition:
+            waiting = self._waiting[priority]
+            waiting.append(ticket)
+            start = time.monotonic()
+            while not self._mayStart(priority, ticket):
+                self._condition.wait()
+            waiting.popleft()
+            self._running[priority] += 1
+            self._inProgress += 1
+            self._requests[priority] += 1
+            self._wait[priority].append(time.monotonic() - start)
+            # The next request in line may be able to start as well
+            self._condition.notify_all()
+
+    def _release(self, priority):
+        with self._condition:
+            self._running[priority] -= 1
+            self._inProgress -= 1
+            self._condition.notify_all()
+
+    def _call(self, function, *args):
+        priority = getThreadPriority()
+        self._acquire(priority)
+        try:
+            return function(*args)
+        finally:
+            self._release(priority)
+
+    def _chunks(self, indexGroup, indexOffset, length, pData):
+        """
+        Yields (indexOffset, length, pData) of the chunks in which a read or
+        write of the current thread is performed
+        """
+        length = getattr(length, 'value', length)
+        if (length <= self.chunkSize or getThreadPriority() != BULK
+                or getattr(indexGroup, 'value', indexGroup) not in self.chunkedGroups):
+            yield indexOffset, length, pData
+            return
+        indexOffset = getattr(indexOffset, 'value', indexOffset)
+        address = cast(pData, c_void_p).value
+        for start in range(0, length, self.chunkSize):
+            yield (indexOffset + start, min(self.chunkSize, length - start),
+                c_void_p(address + start))
+
+    def __getattr__(self, name):
+        # Forward all other requests with scheduling, and the non-request
+        # functions (opening ports etc.) without
+        function = getattr(self.lib, name)
+        if name.startswith('AdsSync'):
+            return lambda *args: self._call(function, *args)
+        return function
+
+    def AdsSyncReadReq(self, pAddr, indexGroup, indexOffset, length, pData):
+        for chunk in self._chunks(indexGroup, indexOffset, length, pData):
+            self._call(self.lib.AdsSyncReadReq, pAddr, indexGroup, *chunk)
+
+    def AdsSyncWriteReq(self, pAddr, indexGroup, indexOffset, length, pData):
+        for chunk in self._chunks(indexGroup, indexOffset, length, pData):
+            self._call(self.lib.AdsSyncWriteReq, pAddr, indexGroup, *chunk)
+
+    def AdsSyncReadReqEx2(self, port, pAddr, indexGroup, indexOffset, length, pData, pcbReturn):
+        if pcbReturn is not None:
+            # The returned length of a chunked read is not supported
+            self._call(self.lib.AdsSyncReadReqEx2, port, pAddr, indexGroup,
+                indexOffset, length, pData, pcbReturn)
+            return
+        for chunk in self._chunks(indexGroup, indexOffset, length, pData):
+            self._call(self.lib.AdsSyncReadReqEx2, port, pAddr, indexGroup, *chunk, None)
+
+    def AdsSyncWriteReqEx(self, port, pAddr, indexGroup, indexOffset, length, pData):
+        for chunk in self._chunks(indexGroup, indexOffset, length, pData):
+            self._call(self.lib.AdsSyncWriteReqEx, port, pAddr, indexGroup, *chunk)
+
+    def statistics(self):
+        """
+        Returns a dict of priority class -> dict with the number of requests
+        (chunks count as separate requests), the number of requests waiting
+        and in progress, and percentiles of the queue wait [s] of recent
+        requests
+        """
+        with self._condition:
+            return {p: dict(
+                requests=self._requests[p],
+                waiting=len(self._waiting[p]),
+                running=self._running[p],
+                wait=percentiles(list(self._wait[p])),
+                ) for p in PRIORITIES}
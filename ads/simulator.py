@@ -0,0 +1,458 @@
+# Copyright (c) 2018, DEMCON advanced mechatronics
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# 
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+
+"""
+In-process simulation of an ADS device, which can be used in place of
+AdsDll.dll for tests, load- and throughput experiments without a TwinCAT
+runtime:
+
+    program = plcprogram.syntheticProgram(1000)
+    with SimulatedAdsDll() as lib:
+        lib.addDevice(SimulatedDevice(program, latency=0.001))
+        variables = adssymbols.getVariables()
+
+SimulatedDevice holds the state of the device: a byte-addressable process
+image per index group, the symbol and datatype blobs of a PLC program, symbol
+handles and the ADS state. SimulatedAdsDll implements the AdsDll.dll functions
+on top of one or more devices and is installed through cpyads.AdsDll.install.
+"""
+
+from . import cpyads
+from .adssymbols import (
+    ADSIGRP_SYM_HNDBYNAME, ADSIGRP_SYM_VALBYHND, ADSIGRP_SYM_UPLOADINFO,
+    ADSIGRP_SYM_UPLOAD, ADSIGRP_SYM_UPLOADINFO2, ADSIGRP_SYM_DT_UPLOAD,
+    ADSIGRP_SUMUP_READ, ADSIGRP_SUMUP_WRITE, ADSIGRP_SUMUP_READWRITE
+    )
+from collections import Counter
+from ctypes import memmove, string_at
+import random
+import struct
+import threading
+import time
+
+
+ADSIGRP_SYM_RELEASEHND = 0xF006
+
+# Default timeout [ms] of requests on a port, like the AMS router
+DEFAULT_TIMEOUT = cpyads.DEFAULT_TIMEOUT
+
+
+class SimulatedError(Exception):
+    """
+    Raised inside the simulation to return an ADS error code
+    """
+    def __init__(self, code):
+        super().__init__('ADS error %d' % code)
+        self.code = code
+
+
+def _value(x):
+    """
+    Value of a ctypes simple type or a Python int
+    """
+    return getattr(x, 'value', x)
+
+
+class SimulatedDevice:
+    """
+    Simulated ADS device (e.g. a PLC runtime)
+
+    program: plcprogram.PlcProgram whose symbols and datatypes are served, and
+      for which a process image is allocated in the program index group
+    latency: mean time [s] each request takes
+    jitter: each request takes latency +/- a uniformly distributed random
+      time of at most jitter [s]
+    seed: seed of the random generator used for the jitter
+
+    Set offline to True to simulate a device that does not respond: requests
+    then fail with a timeout after the timeout of the port.
+    """
+    def __init__(self, program=None, latency=0.0, jitter=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.offline = False
+        self.images = {} # indexGroup -> bytearray
+        self.adsState = cpyads.ADSSTATE_RUN
+        self.deviceState = 0
+        self.requests = Counter() # request function name -> number of requests
+        self.lock = threading.RLock()
+
+        self._random = random.Random(seed)
+        self._symbols = {} # upper case name -> plcprogram.Symbol
+        self._handles = {} # handle -> plcprogram.Symbol
+        self._nextHandle = 1
+        self._uploadInfo = (0,) * 6
+        self._symbolsBlob = b''
+        self._datatypesBlob = b''
+
+        if program is not None:
+            self.loadProgram(program)
+
+    def loadProgram(self, program):
+        """
+        Load (or replace, like an online change) the PLC program. Data in the
+        process image of the program index group is retained.
+        """
+        with self.lock:
+            image = self.images.get(program.indexGroup, bytearray())
+            if len(image) < program.imageSize:
+                image.extend(bytes(program.imageSize - len(image)))
+            self.images[program.indexGroup] = image
+
+            self._symbols = {name.upper(): s for name, s in program.symbols.items()}
+            self._symbolsBlob = program.symbolsBlob()
+            self._datatypesBlob = program.datatypesBlob()
+            self._uploadInfo = (len(program.symbols), len(self._symbolsBlob),
+                len(program.datatypes), len(self._datatypesBlob), 0, 0)
+
+    def addImage(self, indexGroup, size):
+        """
+        Add a zero-initialized process image of size bytes for indexGroup
+        """
+        with self.lock:
+            self.images[indexGroup] = bytearray(size)
+
+    def requestTime(self):
+        """
+        Returns the time [s] a single request takes (latency including jitter)
+        """
+        delay = self.latency
+        if self.jitter:
+            delay += self._random.uniform(-self.jitter, self.jitter)
+        return delay
+
+    @staticmethod
+    def _slice(data, indexOffset, length):
+        if indexOffset + length > len(data):
+            raise SimulatedError(cpyads.ADSERR_DEVICE_INVALIDSIZE)
+        return bytes(data[indexOffset:indexOffset + length])
+
+    def _image(self, indexGroup):
+        try:
+            return self.images[indexGroup]
+        except KeyError:
+            raise SimulatedError(cpyads.ADSERR_DEVICE_INVALIDGRP)
+
+    def _handle(self, handle):
+        try:
+            return self._handles[handle]
+        except KeyError:
+            raise SimulatedError(cpyads.ADSERR_DEVICE_INVALIDOFFSET)
+
+    def read(self, indexGroup, indexOffset, length):
+        """
+        Returns length bytes read from indexGroup, indexOffset
+        """
+        with self.lock:
+            if indexGroup == ADSIGRP_SYM_UPLOADINFO2:
+                data = struct.pack('<6L', *self._uploadInfo)
+            elif indexGroup == ADSIGRP_SYM_UPLOADINFO:
+                data = struct.pack('<2L', *self._uploadInfo[:2])
+            elif indexGroup == ADSIGRP_SYM_UPLOAD:
+                data = self._symbolsBlob
+            elif indexGroup == ADSIGRP_SYM_DT_UPLOAD:
+                data = self._datatypesBlob
+            elif indexGroup == ADSIGRP_SYM_VALBYHND:
+                symbol = self._handle(indexOffset)
+                return self._slice(self._image(symbol.iGroup), symbol.iOffs, min(length, symbol.size))
+            else:
+                return self._slice(self._image(indexGroup), indexOffset, length)
+            return self._slice(data, indexOffset, length)
+
+    def write(self, indexGroup, indexOffset, data):
+        with self.lock:
+            if indexGroup == ADSIGRP_SYM_VALBYHND:
+                symbol = self._handle(indexOffset)
+                if len(data) > symbol.size:
+                    raise SimulatedError(cpyads.ADSERR_DEVICE_INVALIDSIZE)
+                indexGroup, indexOffset = symbol.iGroup, symbol.iOffs
+            elif indexGroup == ADSIGRP_SYM_RELEASEHND:
+                handle, = struct.unpack('<L', data[:4])
+                self._handle(handle)
+                del self._handles[handle]
+                return
+
+            image = self._image(indexGroup)
+            if indexOffset + len(data) > len(image):
+                raise SimulatedError(cpyads.ADSERR_DEVICE_INVALIDSIZE)
+            image[indexOffset:indexOffset + len(data)] = data
+
+    def readWrite(self, indexGroup, indexOffset, readLength, data):
+        """
+        Combined write and read. Supports symbol handles and sum commands; on
+        other index groups the data is written and then readLength bytes are
+        read back from the same location.
+        """
+        with self.lock:
+            if indexGroup == ADSIGRP_SYM_HNDBYNAME:
+                name = data.split(b'\0')[0].decode('latin-1').upper()
+                try:
+                    symbol = self._symbols[name]
+                except KeyError:
+                    raise SimulatedError(cpyads.ADSERR_DEVICE_SYMBOLNOTFOUND)
+                handle = self._nextHandle
+                self._nextHandle += 1
+                self._handles[handle] = symbol
+                return struct.pack('<L', handle)[:readLength]
+
+            elif indexGroup == ADSIGRP_SUMUP_READ:
+                return self._sumRead(indexOffset, data)
+            elif indexGroup == ADSIGRP_SUMUP_WRITE:
+                return self._sumWrite(indexOffset, data)
+            elif indexGroup == ADSIGRP_SUMUP_READWRITE:
+                return self._sumReadWrite(indexOffset, data)
+
+            if data:
+                self.write(indexGroup, indexOffset, data)
+            return self.read(indexGroup, indexOffset, readLength) if readLength else b''
+
+    def _sumRead(self, n, data):
+        """
+        Sum read: data holds n (indexGroup, indexOffset, length) tuples. The
+        response holds n error codes followed by the data of all reads
+        """
+        errors = []
+        results = []
+        for indexGroup, indexOffset, length in struct.iter_unpack('<3L', data[:12 * n]):
+            try:
+                result = self.read(indexGroup, indexOffset, length)
+                error = 0
+            except SimulatedError as e:
+                result, error = bytes(length), e.code
+            errors.append(error)
+            results.append(result)
+        return struct.pack('<%dL' % n, *errors) + b''.join(results)
+
+    def _sumWrite(self, n, data):
+        """
+        Sum write: data holds n (indexGroup, indexOffset, length) tuples
+        followed by the data of all writes. The response holds n error codes
+        """
+        errors = []
+        p = 12 * n
+        for indexGroup, indexOffset, length in struct.iter_unpack('<3L', data[:p]):
+            try:
+                self.write(indexGroup, indexOffset, data[p:p + length])
+                error = 0
+            except SimulatedError as e:
+                error = e.code
+            errors.append(error)
+            p += length
+        return struct.pack('<%dL' % n, *errors)
+
+    def _sumReadWrite(self, n, data):
+        """
+        Sum read-write: data holds n (indexGroup, indexOffset, readLength,
+        writeLength) tuples followed by the data of all writes. The response
+        holds n (error code, returned length) tuples followed by the data of
+        all reads
+        """
+        headers = []
+        results = []
+        p = 16 * n
+        for indexGroup, indexOffset, readLength, writeLength in struct.iter_unpack('<4L', data[:p]):
+            try:
+                result = self.readWrite(indexGroup, indexOffset, readLength, data[p:p + writeLength])
+                error = 0
+            except SimulatedError as e:
+                result, error = b'', e.code
+            headers.append((error, len(result)))
+            results.append(result)
+            p += writeLength
+        return b''.join(struct.pack('<2L', *h) for h in headers) + b''.join(results)
+
+    def readState(self):
+        with self.lock:
+            return self.adsState, self.deviceState
+
+    def writeControl(self, adsState, deviceState, data=b''):
+        """
+        Change the ADS state. A reset clears all process images and stops the
+        device; start and run both result in the run state.
+        """
+        with self.lock:
+            if adsState == cpyads.ADSSTATE_RESET:
+                for image in self.images.values():
+                    image[:] = bytes(len(image))
+                self._handles.clear()
+                adsState = cpyads.ADSSTATE_STOP
+            elif adsState in (cpyads.ADSSTATE_START, cpyads.ADSSTATE_RUN):
+                adsState = cpyads.ADSSTATE_RUN
+            elif adsState != cpyads.ADSSTATE_STOP:
+                raise SimulatedError(cpyads.ADSERR_DEVICE_SRVNOTSUPP)
+            self.adsState = adsState
+            self.deviceState = deviceState
+
+
+class SimulatedAdsDll:
+    """
+    Replacement of AdsDll.dll which routes all requests to simulated devices.
+
+    Use as a context manager to install it for the duration of the with
+    block, or install it with cpyads.AdsDll.install
+    """
+    def __init__(self, localNetId='127.0.0.1.1.1', localPort=32768):
+        self.localNetId = tuple(map(int, localNetId.split('.')))
+        self.localPort = localPort
+        self.routes = {} # (netId, port) -> SimulatedDevice
+        self.openPorts = set()
+        self.timeouts = {} # port -> timeout [ms], if not DEFAULT_TIMEOUT
+        self._nextPort = localPort + 1
+        self._lock = threading.Lock()
+        self._previous = None
+
+    def addDevice(self, device, netId=None, port=851):
+        """
+        Route requests to netId (default: the local address), port to device
+        """
+        netId = self.localNetId if netId is None else tuple(map(int, netId.split('.')))
+        self.routes[(netId, port)] = device
+        return device
+
+    def __enter__(self):
+        self._previous = cpyads.AdsDll.install(self)
+        return self
+
+    def __exit__(self, *exc):
+        cpyads.AdsDll.install(self._previous)
+
+    def _device(self, port, pAddr):
+        if port not in self.openPorts:
+            raise SimulatedError(cpyads.ADSERR_CLIENT_PORTNOTOPEN)
+        data = string_at(pAddr, 8)
+        netId, port = tuple(data[:6]), struct.unpack('<H', data[6:])[0]
+        try:
+            return self.routes[(netId, port)]
+        except KeyError:
+            if any(n == netId for n, p in self.routes):
+                raise SimulatedError(cpyads.ADSERR_TARGET_PORT_NOT_FOUND)
+            raise SimulatedError(cpyads.ADSERR_TARGET_MACHINE_NOT_FOUND)
+
+    def _request(self, port, pAddr, function, *args):
+        """
+        Perform function(device, *args) on the device addressed by pAddr,
+        including the simulated latency. ADS errors are raised like
+        checkError does
+        """
+        try:
+            device = self._device(port, pAddr)
+            timeout = self.timeouts.get(port, DEFAULT_TIMEOUT) / 1000
+            delay = timeout if device.offline else device.requestTime()
+            if delay >= timeout:
+                time.sleep(timeout)
+                raise SimulatedError(cpyads.ADSERR_CLIENT_SYNCTIMEOUT)
+            with device.lock:
+                device.requests[function.__name__] += 1
+            if delay > 0:
+                time.sleep(delay)
+            return getattr(device, function.__name__)(*args)
+        except SimulatedError as e:
+            cpyads.checkError(e.code)
+
+    # AdsDll.dll functions
+    def AdsPortOpen(self):
+        with self._lock:
+            self.openPorts.add(self.localPort)
+        return self.localPort
+
+    def AdsPortClose(self):
+        self.AdsPortCloseEx(self.localPort)
+
+    def AdsGetLocalAddress(self, pAddr):
+        self.AdsGetLocalAddressEx(self.localPort, pAddr)
+
+    def AdsSyncReadReq(self, pAddr, indexGroup, indexOffset, length, pData):
+        self.AdsSyncReadReqEx2(self.localPort, pAddr, indexGroup, indexOffset, length, pData, None)
+
+    def AdsSyncWriteReq(self, pAddr, indexGroup, indexOffset, length, pData):
+        self.AdsSyncWriteReqEx(self.localPort, pAddr, indexGroup, indexOffset, length, pData)
+
+    def AdsSyncReadWriteReq(self, pAddr, indexGroup, indexOffset, readLength, pReadData, writeLength, pWriteData):
+        self.AdsSyncReadWriteReqEx2(self.localPort, pAddr, indexGroup,
+            indexOffset, readLength, pReadData, writeLength, pWriteData, None)
+
+    def AdsSyncReadStateReq(self, pAddr, pAdsState, pDeviceState):
+        self.AdsSyncReadStateReqEx(self.localPort, pAddr, pAdsState, pDeviceState)
+
+    def AdsSyncWriteControlReq(self, pAddr, adsState, deviceState, length, pData):
+        self.AdsSyncWriteControlReqEx(self.localPort, pAddr, adsState, deviceState, length, pData)
+
+    def AdsSyncSetTimeout(self, timeout):
+        self.AdsSyncSetTimeoutEx(self.localPort, timeout)
+
+    def AdsPortOpenEx(self):
+        with self._lock:
+            port = self._nextPort
+            self._nextPort += 1
+            self.openPorts.add(port)
+        return port
+
+    def AdsPortCloseEx(self, port):
+        with self._lock:
+            if port not in self.openPorts:
+                cpyads.checkError(cpyads.ADSERR_CLIENT_PORTNOTOPEN)
+            self.openPorts.remove(port)
+            self.timeouts.pop(port, None)
+
+    def AdsSyncSetTimeoutEx(self, port, timeout):
+        with self._lock:
+            if port not in self.openPorts:
+                cpyads.checkError(cpyads.ADSERR_CLIENT_PORTNOTOPEN)
+            self.timeouts[port] = _value(timeout)
+
+    def AdsGetLocalAddressEx(self, port, pAddr):
+        memmove(pAddr, bytes(self.localNetId) + struct.pack('<H', _value(port)), 8)
+
+    def AdsSyncReadReqEx2(self, port, pAddr, indexGroup, indexOffset, length, pData, pcbReturn):
+        data = self._request(port, pAddr, SimulatedDevice.read, indexGroup, indexOffset, length)
+        memmove(pData, data, len(data))
+        if pcbReturn is not None:
+            memmove(pcbReturn, struct.pack('<L', len(data)), 4)
+
+    def AdsSyncWriteReqEx(self, port, pAddr, indexGroup, indexOffset, length, pData):
+        self._request(port, pAddr, SimulatedDevice.write, indexGroup, indexOffset, string_at(pData, length))
+
+    def AdsSyncReadWriteReqEx2(self, port, pAddr, indexGroup, indexOffset, readLength, pReadData, writeLength, pWriteData, pcbReturn):
+        data = self._request(port, pAddr, SimulatedDevice.readWrite, indexGroup,
+            indexOffset, readLength, string_at(pWriteData, writeLength) if writeLength else b'')
+        if len(data) > readLength:
+            cpyads.checkError(cpyads.ADSERR_DEVICE_INVALIDSIZE)
+        memmove(pReadData, data, len(data))
+        if pcbReturn is not None:
+            memmove(pcbReturn, struct.pack('<L', len(data)), 4)
+
+    def AdsSyncReadStateReqEx(self, port, pAddr, pAdsState, pDeviceState):
+        adsState, deviceState = self._request(port, pAddr, SimulatedDevice.readState)
+        memmove(pAdsState, struct.pack('<H', adsState), 2)
+        memmove(pDeviceState, struct.pack('<H', deviceState), 2)
+
+    def AdsSyncWriteControlReqEx(self, port, pAddr, adsState, deviceState, length, pData):
+        self._request(port, pAddr, SimulatedDevice.writeControl, _value(adsState),
+            _value(deviceState), string_at(pData, length) if length else b'')
@@ -0,0 +1,428 @@
+# Copyright (c) 2018, DEMCON advanced mechatronics
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# 
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+
+"""
+Recording of the ADS requests of an application into a trace file, and
+replay of the recorded responses without a PLC, e.g. to profile or benchmark
+the client side against a production traffic pattern:
+
+    with TraceRecorder('session.adstrace'):
+        v = adssymbols.getVariables()
+        ...
+
+    with ReplayAdsDll('session.adstrace', timeScale=0.0):
+        v = adssymbols.getVariables()   # served from the trace
+        ...
+
+Both are installed in place of the ADS lib (see cpyads.AdsDll.install). The
+trace holds a record per request: its kind, the target address, the index
+group and offset, the written data, the response data, the ADS error code
+and its start time and duration. Use readTrace to iterate over the records.
+
+On replay, each request is answered with the response of a recorded request
+with the same kind, target, index group, offset and lengths, in the order
+in which they were recorded. The written data only identifies read-write
+requests of which it selects the data that is read (a symbol handle by name
+or a sum read); writes, sum writes and exchanges may write other data than
+was recorded, unless ReplayAdsDll verifies it. The recorded duration of the request is simulated, scaled by
+timeScale.
+"""
+
+from . import cpyads
+from .adssymbols import ADSIGRP_SYM_HNDBYNAME, ADSIGRP_SUMUP_READ
+from collections import defaultdict, deque, namedtuple
+from ctypes import memmove, string_at
+import struct
+import threading
+import time
+
+
+MAGIC = b'ADSTRACE'
+VERSION = 1
+
+# Kinds of records
+READ = 1
+WRITE = 2
+READWRITE = 3
+READSTATE = 4
+WRITECONTROL = 5
+LOCALADDRESS = 6
+
+TraceRecord = namedtuple('TraceRecord', 'kind start duration error address '
+    'indexGroup indexOffset readLength writeData response')
+TraceRecord.__doc__ = """
+A recorded request
+
+kind: READ, WRITE, READWRITE, READSTATE, WRITECONTROL or LOCALADDRESS
+start: start time [s] relative to the start of the recording
+duration: duration [s] of the request
+error: ADS error code (0 if the request succeeded)
+address: target address (str 'netId:port')
+indexGroup, indexOffset: index group and offset; for WRITECONTROL the ADS
+  and device state
+readLength: number of bytes requested to read
+writeData: bytes written
+response: bytes returned (for READSTATE the ADS and device state, for
+  LOCALADDRESS the 8 byte local address)
+"""
+
+# kind, error, start, duration, address, indexGroup, indexOffset, readLength,
+# length of writeData, length of response
+_header = struct.Struct('<BLdd8sLLLLL')
+
+# Index groups of read-write requests of which the written data selects the
+# data that is read, so it identifies the request on replay
+QUERY_GROUPS = frozenset([ADSIGRP_SYM_HNDBYNAME, ADSIGRP_SUMUP_READ])
+
+
+def _address(data):
+    return '%s:%d' % ('.'.join(map(str, data[:6])), int.from_bytes(data[6:8], 'little'))
+
+def _value(x):
+    return getattr(x, 'value', x)
+
+def readTrace(file):
+    """
+    Iterate over the TraceRecords in file (a path or a binary file object)
+    """
+    if isinstance(file, str):
+        with open(file, 'rb') as f:
+            yield from readTrace(f)
+        return
+
+    if file.read(len(MAGIC)) != MAGIC:
+        raise ValueError('Not an ADS trace file')
+    version, = struct.unpack('<H', file.read(2))
+    if version != VERSION:
+        raise ValueError('Unsupported ADS trace version %d' % version)
+
+    while True:
+        header = file.read(_header.size)
+        if not header:
+            return
+        if len(header) < _header.size:
+            raise ValueError('Truncated ADS trace file')
+        (kind, error, start, duration, address, indexGroup, indexOffset,
+            readLength, writeLength, responseLength) = _header.unpack(header)
+        writeData = file.read(writeLength)
+        response = file.read(responseLength)
+        yield TraceRecord(kind, start, duration, error, _address(address),
+            indexGroup, indexOffset, readLength, writeData, response)
+
+
+class TraceRecorder:
+    """
+    Replacement of the ADS lib which forwards all requests to lib (default:
+    the currently installed lib) and records them in file (a path or a
+    binary file object).
+
+    Use as a context manager to install it and close the file afterwards,
+    or install it with cpyads.AdsDll.install and call close()
+    """
+    def __init__(self, file, lib=None):
+        self.lib = cpyads.AdsDll.lib() if lib is None else lib
+        if isinstance(file, str):
+            file = open(file, 'wb')
+            self._ownsFile = True
+        else:
+            self._ownsFile = False
+        self.file = file
+        self.records = 0
+        self.file.write(MAGIC + struct.pack('<H', VERSION))
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self._previous = None
+
+    def __enter__(self):
+        self._previous = cpyads.AdsDll.install(self)
+        return self
+
+    def __exit__(self, *exc):
+        cpyads.AdsDll.install(self._previous)
+        self.close()
+
+    def close(self):
+        with self._lock:
+            if self._ownsFile:
+                self.file.close()
+            else:
+                self.file.flush()
+
+    def _write(self, kind, start, duration, error, pAddr, indexGroup=0,
+            indexOffset=0, readLength=0, writeData=b'', response=b''):
+        header = _header.pack(kind, error, start - self._start, duration,
+            string_at(pAddr, 8), _value(indexGroup), _value(indexOffset),
+            _value(readLength), len(writeData), len(response))
+        with self._lock:
+            self.file.write(header + writeData + response)
+            self.records += 1
+
+    def _record(self, kind, function, args, pAddr, indexGroup=0, indexOffset=0,
+            readLength=0, writeData=b'', response=None):
+        """
+        Call function(*args) and record it. response is a function that
+        returns the response data after a successful call
+        """
+        start = time.perf_counter()
+        try:
+            function(*args)
+        except cpyads.AdsError as e:
+            self._write(kind, start, time.perf_counter() - start, e.code, pAddr,
+                indexGroup, indexOffset, readLength, writeData)
+            raise
+        duration = time.perf_counter() - start
+        self._write(kind, start, duration, 0, pAddr, indexGroup, indexOffset,
+            readLength, writeData, response() if response is not None else b'')
+
+    def __getattr__(self, name):
+        # Other functions (opening ports, setting timeouts) are not recorded
+        return getattr(self.lib, name)
+
+    def AdsGetLocalAddress(self, pAddr):
+        self.lib.AdsGetLocalAddress(pAddr)
+        now = time.perf_counter()
+        self._write(LOCALADDRESS, now, 0.0, 0, pAddr, response=string_at(pAddr, 8))
+
+    def AdsGetLocalAddressEx(self, port, pAddr):
+        self.lib.AdsGetLocalAddressEx(port, pAddr)
+        now = time.perf_counter()
+        self._write(LOCALADDRESS, now, 0.0, 0, pAddr, response=string_at(pAddr, 8))
+
+    def AdsSyncReadReq(self, pAddr, indexGroup, indexOffset, length, pData):
+        self._record(READ, self.lib.AdsSyncReadReq, (pAddr, indexGroup, indexOffset, length, pData),
+            pAddr, indexGroup, indexOffset, length,
+            response=lambda: string_at(pData, _value(length)))
+
+    def AdsSyncReadReqEx2(self, port, pAddr, indexGroup, indexOffset, length, pData, pcbReturn):
+        def response():
+            n = _value(length)
+            if pcbReturn is not None:
+                n, = struct.unpack('<L', string_at(pcbReturn, 4))
+            return string_at(pData, n)
+        self._record(READ, self.lib.AdsSyncReadReqEx2,
+            (port, pAddr, indexGroup, indexOffset, length, pData, pcbReturn),
+            pAddr, indexGroup, indexOffset, length, response=response)
+
+    def AdsSyncWriteReq(self, pAddr, indexGroup, indexOffset, length, pData):
+        self._record(WRITE, self.lib.AdsSyncWriteReq, (pAddr, indexGroup, indexOffset, length, pData),
+            pAddr, indexGroup, indexOffset, writeData=string_at(pData, _value(length)))
+
+    def AdsSyncWriteReqEx(self, port, pAddr, indexGroup, indexOffset, length, pData):
+        self._record(WRITE, self.lib.AdsSyncWriteReqEx,
+            (port, pAddr, indexGroup, indexOffset, length, pData),
+            pAddr, indexGroup, indexOffset, writeData=string_at(pData, _value(length)))
+
+    def AdsSyncReadWriteReq(self, pAddr, indexGroup, indexOffset, readLength, pReadData, writeLength, pWriteData):
+        self._record(READWRITE, self.lib.AdsSyncReadWriteReq,
+            (pAddr, indexGroup, indexOffset, readLength, pReadData, writeLength, pWriteData),
+            pAddr, indexGroup, indexOffset, readLength,
+            string_at(pWriteData, _value(writeLength)) if _value(writeLength) else b'',
+            response=lambda: string_at(pReadData, _value(readLength)))
+
+    def AdsSyncReadWriteReqEx2(self, port, pAddr, indexGroup, indexOffset, readLength, pReadData,
+            writeLength, pWriteData, pcbReturn):
+        def response():
+            n = _value(readLength)
+            if pcbReturn is not None:
+                n, = struct.unpack('<L', string_at(pcbReturn, 4))
+            return string_at(pReadData, n)
+        self._record(READWRITE, self.lib.AdsSyncReadWriteReqEx2,
+            (port, pAddr, indexGroup, indexOffset, readLength, pReadData, writeLength, pWriteData, pcbReturn),
+            pAddr, indexGroup, indexOffset, readLength,
+            string_at(pWriteData, _value(writeLength)) if _value(writeLength) else b'',
+            response=response)
+
+    def AdsSyncReadStateReq(self, pAddr, pAdsState, pDeviceState):
+        self._record(READSTATE, self.lib.AdsSyncReadStateReq, (pAddr, pAdsState, pDeviceState),
+            pAddr, response=lambda: string_at(pAdsState, 2) + string_at(pDeviceState, 2))
+
+    def AdsSyncReadStateReqEx(self, port, pAddr, pAdsState, pDeviceState):
+        self._record(READSTATE, self.lib.AdsSyncReadStateReqEx, (port, pAddr, pAdsState, pDeviceState),
+            pAddr, response=lambda: string_at(pAdsState, 2) + string_at(pDeviceState, 2))
+
+    def AdsSyncWriteControlReq(self, pAddr, adsState, deviceState, length, pData):
+        self._record(WRITECONTROL, self.lib.AdsSyncWriteControlReq,
+            (pAddr, adsState, deviceState, length, pData), pAddr, adsState, deviceState,
+            writeData=string_at(pData, _value(length)) if _value(length) else b'')
+
+    def AdsSyncWriteControlReqEx(self, port, pAddr, adsState, deviceState, length, pData):
+        self._record(WRITECONTROL, self.lib.AdsSyncWriteControlReqEx,
+            (port, pAddr, adsState, deviceState, length, pData), pAddr, adsState, deviceState,
+            writeData=string_at(pData, _value(length)) if _value(length) else b'')
+
+
+class TraceMismatchError(LookupError):
+    """
+    Raised on replay for a request of which no response was recorded
+    """
+
+
+class ReplayAdsDll:
+    """
+    Replacement of the ADS lib which answers requests with the responses
+    recorded in a trace file (see the module documentation).
+
+    file: path or binary file object of the trace
+    timeScale: factor by which the recorded durations of the requests are
+      scaled (1.0 for the original timing, 0.0 to answer immediately)
+    loop: when all recorded responses to a request have been served, start
+      again with the first one. Otherwise, TraceMismatchError is raised.
+    verifyWrites: raise TraceMismatchError when a request writes other data
+      than the recorded request of which the response is replayed
+
+    Use as a context manager to install it for the duration of the with
+    block, or install it with cpyads.AdsDll.install
+    """
+    def __init__(self, file, timeScale=1.0, loop=True, verifyWrites=False):
+        self.timeScale = timeScale
+        self.loop = loop
+        self.verifyWrites = verifyWrites
+        self.localAddress = bytes([127, 0, 0, 1, 1, 1]) + struct.pack('<H', 32768)
+        self._responses = defaultdict(list) # key -> list of records
+        self._next = defaultdict(int) # key -> index of the next record
+        self._lock = threading.Lock()
+        self._nextPort = 32769
+        self._previous = None
+
+        for record in readTrace(file):
+            if record.kind == LOCALADDRESS:
+                self.localAddress = record.response
+            else:
+                self._responses[self._key(record.kind, record.address,
+                    record.indexGroup, record.indexOffset, record.readLength,
+                    record.writeData)].append(record)
+
+    def __enter__(self):
+        self._previous = cpyads.AdsDll.install(self)
+        return self
+
+    def __exit__(self, *exc):
+        cpyads.AdsDll.install(self._previous)
+
+    @staticmethod
+    def _key(kind, address, indexGroup, indexOffset, readLength, writeData):
+        # Written data only identifies read-write requests that select what
+        # is read (e.g. a symbol handle by name); other requests may write
+        # other data than was recorded
+        if kind == READWRITE and indexGroup in QUERY_GROUPS:
+            return (kind, address, indexGroup, indexOffset, readLength, writeData)
+        return (kind, address, indexGroup, indexOffset, readLength, len(writeData))
+
+    def _replay(self, kind, pAddr, indexGroup=0, indexOffset=0, readLength=0, writeData=b''):
+        """
+        Returns the response of the next matching record, after simulating
+        its duration. The recorded error is raised like checkError does
+        """
+        key = self._key(kind, _address(string_at(pAddr, 8)), _value(indexGroup),
+            _value(indexOffset), _value(readLength), writeData)
+        with self._lock:
+            records = self._responses.get(key)
+            i = self._next[key]
+            if not records or (i >= len(records) and not self.loop):
+                raise TraceMismatchError('No recorded response to %r' % (key,))
+            record = records[i % len(records)]
+            self._next[key] = i + 1
+        if self.verifyWrites and record.writeData != writeData:
+            raise TraceMismatchError('Request %r writes %r instead of the recorded %r'
+                % (key, writeData, record.writeData))
+
+        if self.timeScale:
+            time.sleep(record.duration * self.timeScale)
+        cpyads.checkError(record.error)
+        return record.response
+
+    @staticmethod
+    def _returnRead(response, pData, pcbReturn=None):
+        memmove(pData, response, len(response))
+        if pcbReturn is not None:
+            memmove(pcbReturn, struct.pack('<L', len(response)), 4)
+
+    def AdsPortOpen(self):
+        return int.from_bytes(self.localAddress[6:], 'little')
+
+    def AdsPortClose(self):
+        pass
+
+    def AdsPortOpenEx(self):
+        with self._lock:
+            self._nextPort += 1
+            return self._nextPort - 1
+
+    def AdsPortCloseEx(self, port):
+        pass
+
+    def AdsSyncSetTimeout(self, timeout):
+        pass
+
+    def AdsSyncSetTimeoutEx(self, port, timeout):
+        pass
+
+    def AdsGetLocalAddress(self, pAddr):
+        memmove(pAddr, self.localAddress, 8)
+
+    def AdsGetLocalAddressEx(self, port, pAddr):
+        memmove(pAddr, self.localAddress[:6] + struct.pack('<H', _value(port)), 8)
+
+    def AdsSyncReadReq(self, pAddr, indexGroup, indexOffset, length, pData):
+        self._returnRead(self._replay(READ, pAddr, indexGroup, indexOffset, length), pData)
+
+    def AdsSyncReadReqEx2(self, port, pAddr, indexGroup, indexOffset, length, pData, pcbReturn):
+        self._returnRead(self._replay(READ, pAddr, indexGroup, indexOffset, length), pData, pcbReturn)
+
+    def AdsSyncWriteReq(self, pAddr, indexGroup, indexOffset, length, pData):
+        self._replay(WRITE, pAddr, indexGroup, indexOffset, writeData=string_at(pData, _value(length)))
+
+    def AdsSyncWriteReqEx(self, port, pAddr, indexGroup, indexOffset, length, pData):
+        self.AdsSyncWriteReq(pAddr, indexGroup, indexOffset, length, pData)
+
+    def AdsSyncReadWriteReq(self, pAddr, indexGroup, indexOffset, readLength, pReadData, writeLength, pWriteData):
+        self.AdsSyncReadWriteReqEx2(None, pAddr, indexGroup, indexOffset, readLength,
+            pReadData, writeLength, pWriteData, None)
+
+    def AdsSyncReadWriteReqEx2(self, port, pAddr, indexGroup, indexOffset, readLength, pReadData,
+            writeLength, pWriteData, pcbReturn):
+        writeData = string_at(pWriteData, _value(writeLength)) if _value(writeLength) else b''
+        self._returnRead(self._replay(READWRITE, pAddr, indexGroup, indexOffset, readLength, writeData),
+            pReadData, pcbReturn)
+
+    def AdsSyncReadStateReq(self, pAddr, pAdsState, pDeviceState):
+        response = self._replay(READSTATE, pAddr)
+        memmove(pAdsState, response[:2], 2)
+        memmove(pDeviceState, response[2:4], 2)
+
+    def AdsSyncReadStateReqEx(self, port, pAddr, pAdsState, pDeviceState):
+        self.AdsSyncReadStateReq(pAddr, pAdsState, pDeviceState)
+
+    def AdsSyncWriteControlReq(self, pAddr, adsState, deviceState, length, pData):
+        self._replay(WRITECONTROL, pAddr, adsState, deviceState,
+            writeData=string_at(pData, _value(length)) if _value(length) else b'')
+
+    def AdsSyncWriteControlReqEx(self, port, pAddr, adsState, deviceState, length, pData):
+        self.AdsSyncWriteControlReq(pAddr, adsState, deviceState, length, pData)
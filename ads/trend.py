@@ -0,0 +1,243 @@
+# Copyright (c) 2018, DEMCON advanced mechatronics
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# 
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+
+"""
+Trends of variables: samples in fixed size ring buffers, and min/max
+decimation of the samples for plotting (see browser.TrendPane)
+"""
+
+from .adssymbols import readSum
+from .sampler import CyclicSampler
+from array import array
+import math
+import threading
+
+
+class RingBuffer:
+    """
+    The last capacity values appended, in an array of typecode. Indexing
+    counts from the oldest value.
+
+    The minimum and maximum of each block of blockSize values are kept as
+    well, so envelope() of a large number of values takes time in the order
+    of the number of blocks instead of the number of values. The capacity
+    is rounded up to a multiple of blockSize.
+    """
+    def __init__(self, capacity, typecode='d', blockSize=64):
+        blocks = max(1, -(-capacity // blockSize))
+        self.blockSize = blockSize
+        self.capacity = blocks * blockSize
+        self.data = array(typecode, [0]) * self.capacity
+        self.mins = array(typecode, [0]) * blocks
+        self.maxs = array(typecode, [0]) * blocks
+        self.count = 0 # number of values appended in total
+
+    def append(self, value):
+        i = self.count % self.capacity
+        self.data[i] = value
+        self.count += 1
+        if self.count % self.blockSize == 0:
+            block = self.data[i + 1 - self.blockSize:i + 1]
+            self.mins[i // self.blockSize] = min(block)
+            self.maxs[i // self.blockSize] = max(block)
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def __getitem__(self, i):
+        n = len(self)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError('index out of range')
+        return self.data[(self.count - n + i) % self.capacity]
+
+    def tolist(self):
+        """
+        Returns a list of all values, oldest first
+        """
+        if self.count <= self.capacity:
+            return self.data[:self.count].tolist()
+        start = self.count % self.capacity
+        return self.data[start:].tolist() + self.data[:start].tolist()
+
+    def envelope(self, bins, start=0, stop=None):
+        """
+        Min/max decimation of the values start:stop (indices as for
+        indexing, default all values) into at most bins bins of consecutive
+        values. Returns (starts, mins, maxs): the index of the first value
+        of each bin and the minimum and maximum of each bin.
+
+        The bins are aligned to multiples of their size, so the bins of the
+        older values remain the same while values are appended (which
+        avoids flicker when plotting). Bins of more than half a block are
+        rounded up to whole blocks, so they are computed from the minima
+        and maxima of the blocks.
+        """
+        n = len(self)
+        stop = n if stop is None else min(stop, n)
+        first = self.count - n # Sequence number of the oldest value
+        lo, hi = first + start, first + stop
+        if hi - lo <= bins:
+            values = self._values(lo, hi).tolist() if hi > lo else []
+            return list(range(start, max(start, stop))), values, values[:]
+
+        B = self.blockSize
+        if bins == 1:
+            size = hi - lo
+            edges = [lo, hi]
+        else:
+            # The first and last bin may be partial
+            size = -(-(hi - lo) // max(1, bins - 2))
+            if size > B // 2:
+                # Whole blocks per bin, at the expense of less bins
+                size = -(-size // B) * B
+            edges = [lo] + list(range((lo // size + 1) * size, hi, size)) + [hi]
+        starts, mins, maxs = [], [], []
+        if size % B == 0 and size // B == 1 and len(edges) > 3:
+            # A bin per block: the minima and maxima of the blocks of all
+            # bins but the first and last one
+            starts.append(lo - first)
+            self._minmax(lo, edges[1], mins, maxs)
+            starts.extend(range(edges[1] - first, edges[-2] - first, B))
+            mins.extend(self._blocks(self.mins, edges[1] // B, edges[-2] // B))
+            maxs.extend(self._blocks(self.maxs, edges[1] // B, edges[-2] // B))
+            edges = edges[-2:]
+        for a, b in zip(edges, edges[1:]):
+            starts.append(a - first)
+            self._minmax(a, b, mins, maxs)
+        return starts, mins, maxs
+
+    def _minmax(self, lo, hi, mins, maxs):
+        """
+        Append the minimum and maximum of sequence numbers lo:hi to mins and
+        maxs
+        """
+        B = self.blockSize
+        loBlock, hiBlock = -(-lo // B), hi // B
+        if hiBlock > loBlock:
+            # The values before the first whole block, the whole blocks, and
+            # the values after the last whole block
+            parts = [p for p in (self._values(lo, loBlock * B), self._values(hiBlock * B, hi)) if p]
+            mins.append(min([min(p) for p in parts] + [min(self._blocks(self.mins, loBlock, hiBlock))]))
+            maxs.append(max([max(p) for p in parts] + [max(self._blocks(self.maxs, loBlock, hiBlock))]))
+        else:
+            values = self._values(lo, hi)
+            mins.append(min(values))
+            maxs.append(max(values))
+
+    def _values(self, lo, hi):
+        """
+        Values of sequence numbers lo:hi
+        """
+        i = lo % self.capacity
+        if i + hi - lo <= self.capacity:
+            return self.data[i:i + hi - lo]
+        return self.data[i:] + self.data[:i + hi - lo - self.capacity]
+
+    def _blocks(self, blocks, lo, hi):
+        """
+        Items lo:hi (block sequence numbers) of mins or maxs
+        """
+        i = lo % len(blocks)
+        if i + hi - lo <= len(blocks):
+            return blocks[i:i + hi - lo]
+        return blocks[i:] + blocks[:i + hi - lo - len(blocks)]
+
+
+class Trend:
+    """
+    Samples a set of (numeric) variables at a fixed period on a background
+    thread, reading them with one sum read per sample, into ring buffers
+    holding the last duration [s] of samples. The samples are plotted from
+    envelope(), which takes the same time regardless of duration.
+
+    names: names of the variables (default: their names)
+
+    Use start() and stop(), or use as a context manager. Failed reads are
+    skipped (and counted by the sampler).
+    """
+    def __init__(self, variables, period=0.01, duration=600, names=None):
+        self.variables = list(variables)
+        self.names = list(names) if names is not None else [(~v).name for v in self.variables]
+        capacity = int(math.ceil(duration / period))
+        self.times = RingBuffer(capacity)
+        self.signals = [RingBuffer(capacity) for v in self.variables]
+        self.sampler = CyclicSampler(self.variables, period, self._add, read=readSum)
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        self.sampler.start()
+
+    def stop(self):
+        self.sampler.stop()
+
+    def _add(self, sample):
+        if sample.values is None:
+            return
+        with self._lock:
+            self.times.append(sample.timestamp)
+            for signal, value in zip(self.signals, sample.values):
+                signal.append(float(value))
+
+    def __len__(self):
+        return len(self.times)
+
+    def envelope(self, bins, duration=None):
+        """
+        Min/max decimation of the samples of the last duration [s] (default
+        all samples) into at most bins bins. Returns (times, signals): the
+        time.monotonic() time of the first sample of each bin, and per
+        variable a tuple of the minimum and maximum of each bin
+        """
+        with self._lock:
+            start = 0
+            n = len(self.times)
+            if duration is not None and n > 0:
+                # Bisect the (increasing) times
+                t = self.times[-1] - duration
+                hi = n
+                while start < hi:
+                    mid = (start + hi) // 2
+                    if self.times[mid] < t:
+                        start = mid + 1
+                    else:
+                        hi = mid
+            starts, _, _ = self.times.envelope(bins, start)
+            times = [self.times[i] for i in starts]
+            signals = [signal.envelope(bins, start)[1:] for signal in self.signals]
+        return times, signals
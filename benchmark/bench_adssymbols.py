@@ -0,0 +1,169 @@
+# Copyright (c) 2018, DEMCON advanced mechatronics
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# 
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+
+"""
+Benchmarks of the adssymbols module against a synthetic PLC program
+
+The ADS calls are served by an in-process simulated device (see
+ads.simulator), so no PLC (nor AdsDll.dll) is required. The results are
+written as JSON, e.g.
+
+    python benchmark/bench_adssymbols.py --symbols 100 1000 10000 -o out.json
+"""
+
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ads import adssymbols, cpyads
+from ads.plcprogram import syntheticProgram
+from ads.simulator import SimulatedAdsDll, SimulatedDevice
+import argparse
+import json
+import platform
+import time
+import tracemalloc
+import warnings
+
+
+def timeit(function, repeat):
+    """
+    Returns the minimum wall clock time of repeat calls of function
+    """
+    best = float('inf')
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def walk(node, leaves):
+    """
+    Traverse the variable tree, appending all leaf Variables to leaves
+    """
+    for name, child in node:
+        if isinstance(child, adssymbols.Variables):
+            walk(child, leaves)
+            continue
+        try:
+            children = list(child)
+        except (TypeError, NotImplementedError):
+            children = []
+        if children:
+            walk(children, leaves)
+        else:
+            leaves.append(child)
+    return leaves
+
+def benchmark(nSymbols, repeat):
+    with SimulatedAdsDll() as lib:
+        device = lib.addDevice(SimulatedDevice(syntheticProgram(nSymbols)))
+        cpyads.adsPortOpen()
+        return _benchmark(nSymbols, repeat, device, cpyads.SAmsAddr(port=851))
+
+def _benchmark(nSymbols, repeat, device, address):
+    results = []
+
+    def result(name, seconds, **kwargs):
+        kwargs.update(benchmark=name, symbols=nSymbols, seconds=seconds)
+        results.append(kwargs)
+
+    # Construction of the definition: parsing of the blobs, generation of the
+    # ctypes and the variable tree
+    t = timeit(lambda: adssymbols.AdsVariablesDefinition(address, registry=None), repeat)
+    tracemalloc.start()
+    defs = adssymbols.AdsVariablesDefinition(address, registry=None)
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    result('construct', t, datatypes=len(defs.dtypes), currentBytes=size, peakBytes=peak)
+
+    # Construction of another definition of the same program, which shares
+    # the datatypes of the first one through a type registry
+    registry = adssymbols.TypeRegistry()
+    first = adssymbols.AdsVariablesDefinition(address, registry=registry)
+    t = timeit(lambda: adssymbols.AdsVariablesDefinition(address, registry=registry), repeat)
+    tracemalloc.start()
+    shared = adssymbols.AdsVariablesDefinition(address, registry=registry)
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    result('constructShared', t, datatypes=len(shared.dtypes), currentBytes=size, peakBytes=peak)
+
+    # Generation of the ctypes for all datatypes
+    def getCtypes():
+        defs.types.ctypes = adssymbols.basictypes.copy()
+        for dtypename in defs.dtypes:
+            defs.getCtype(dtypename)
+    result('getCtype', timeit(getCtypes, repeat), datatypes=len(defs.dtypes))
+
+    # Traversal of the complete variable tree down to the leaves
+    leaves = []
+    t = timeit(lambda: walk(defs.variables, leaves.clear() or leaves), repeat)
+    result('traverse', t, leaves=len(leaves))
+
+    # Read and write call overhead
+    sample = leaves[::max(1, len(leaves) // 1000)]
+    values = [var() for var in sample]
+
+    calls = device.requests['read']
+    t = timeit(lambda: [var() for var in sample], repeat)
+    result('read', t / len(sample), calls=(device.requests['read'] - calls) // repeat)
+
+    calls = device.requests['write']
+    t = timeit(lambda: [var(value) for var, value in zip(sample, values)], repeat)
+    result('write', t / len(sample), calls=(device.requests['write'] - calls) // repeat)
+
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--symbols', type=int, nargs='+', default=[100, 1000, 10000],
+        help='number of symbols of the synthetic programs')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('-o', '--output', help='output file (default: stdout)')
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore')
+    results = []
+    for nSymbols in args.symbols:
+        results.extend(benchmark(nSymbols, args.repeat))
+
+    output = json.dumps(dict(
+        python=platform.python_version(),
+        platform=platform.platform(),
+        results=results), indent=2)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+if __name__ == '__main__':
+    main()
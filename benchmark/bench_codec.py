@@ -0,0 +1,137 @@
+# Copyright (c) 2018, DEMCON advanced mechatronics
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# 
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+
+"""
+Benchmark of decoding variables to Python objects with compiled codecs (see
+ads.codec) compared to converting the ctypes objects returned by reading a
+variable. The results are written as JSON, e.g.
+
+    python benchmark/bench_codec.py --items 10 100 1000
+"""
+
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ads import adssymbols
+from ads.adssymbols import PLCString
+from ads.plcprogram import PlcProgram
+from ads.simulator import SimulatedAdsDll, SimulatedDevice
+from ctypes import Array, Structure
+import argparse
+import json
+import platform
+import time
+
+
+def timeit(function, repeat):
+    """
+    Returns the minimum wall clock time of repeat calls of function
+    """
+    best = float('inf')
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def toPython(data):
+    """
+    Conversion of a ctypes object to Python objects through attribute access
+    """
+    if isinstance(data, PLCString):
+        return str(data)
+    if isinstance(data, Structure):
+        return {name: toPython(getattr(data, name)) for name, type in data._fields_ if name}
+    if isinstance(data, Array):
+        return [toPython(item) for item in data]
+    return data
+
+def program(nItems):
+    program = PlcProgram()
+    program.addAlias('E_State', 'INT')
+    program.addStruct('ST_Vector', [('x', 'LREAL'), ('y', 'LREAL'), ('z', 'LREAL')])
+    program.addStruct('ST_Axis', [
+        ('enabled', 'BOOL'), ('state', 'E_State'), ('position', 'ST_Vector'),
+        ('name', 'STRING(31)'), ('history', program.arrayType('REAL', [(-5, 11)]))])
+    program.addSymbol('MAIN.axes', program.arrayType('ST_Axis', [(1, nItems)]))
+    program.addSymbol('MAIN.samples', program.arrayType('LREAL', [(0, nItems * 10)]))
+    return program
+
+def benchmark(nItems, repeat):
+    results = []
+    with SimulatedAdsDll() as lib:
+        lib.addDevice(SimulatedDevice(program(nItems)))
+        v = adssymbols.getVariables()
+
+        for name in ['axes', 'samples']:
+            var = getattr(v.MAIN, name)
+            info = ~var
+            codec = info.variablesDefinition.getCodec(info.ctype)
+            data = var()
+            assert codec.decode(data) == toPython(data)
+
+            ctypesTime = timeit(lambda: toPython(data), repeat)
+            codecTime = timeit(lambda: codec.decode(data), repeat)
+            ctypesReadTime = timeit(lambda: toPython(var()), repeat)
+            codecReadTime = timeit(var.read_python, repeat)
+            results.append(dict(
+                variable=name, items=nItems, bytes=codec.size,
+                ctypesDecodeSeconds=ctypesTime, codecDecodeSeconds=codecTime,
+                decodeSpeedup=ctypesTime / codecTime,
+                ctypesReadSeconds=ctypesReadTime, codecReadSeconds=codecReadTime,
+                readSpeedup=ctypesReadTime / codecReadTime))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--items', type=int, nargs='+', default=[10, 100, 1000],
+        help='number of items of the arrays')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('-o', '--output', help='output file (default: stdout)')
+    args = parser.parse_args()
+
+    results = []
+    for nItems in args.items:
+        results.extend(benchmark(nItems, args.repeat))
+
+    output = json.dumps(dict(
+        python=platform.python_version(),
+        platform=platform.platform(),
+        results=results), indent=2)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+# Copyright (c) 2018, DEMCON advanced mechatronics
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# 
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+
+"""
+Benchmark of bulk access to NonzeroBasedArray compared to plain (zero based)
+ctypes arrays. The results are written as JSON, e.g.
+
+    python benchmark/bench_nonzerobasedarray.py --length 50000
+"""
+
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ads.nonzerobasedarray import NonzeroBasedArray
+import argparse
+import ctypes
+import json
+import platform
+import time
+
+
+def timeit(function, repeat):
+    """
+    Returns the minimum wall clock time of repeat calls of function
+    """
+    best = float('inf')
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--length', type=int, default=50000)
+    parser.add_argument('--lbound', type=int, default=-1000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('-o', '--output', help='output file (default: stdout)')
+    args = parser.parse_args()
+
+    n, lbound = args.length, args.lbound
+    plain = (ctypes.c_double * n)(*range(n))
+    nonzero = NonzeroBasedArray.create(ctypes.c_double, lbound, n)(*range(n))
+    lo, hi = n // 4, 3 * n // 4
+    values = list(range(hi - lo))
+
+    benchmarks = [
+        ('iterate', lambda: list(plain), lambda: list(nonzero)),
+        ('tolist', lambda: plain[:], nonzero.tolist),
+        ('view.tolist', lambda: memoryview(plain).cast('B').cast('d').tolist(),
+            lambda: nonzero.view().tolist()),
+        ('elementwise', lambda: [plain[i] for i in range(n)],
+            lambda: [nonzero[i] for i in range(lbound, lbound + n)]),
+        ('sliceRead', lambda: plain[lo:hi],
+            lambda: nonzero[lbound + lo:lbound + hi]),
+        ('sliceWrite', lambda: plain.__setitem__(slice(lo, hi), values),
+            lambda: nonzero.__setitem__(slice(lbound + lo, lbound + hi), values)),
+        ]
+
+    results = []
+    for name, plainFunction, nonzeroFunction in benchmarks:
+        plainTime = timeit(plainFunction, args.repeat)
+        nonzeroTime = timeit(nonzeroFunction, args.repeat)
+        results.append(dict(benchmark=name, length=n, plainSeconds=plainTime,
+            nonzeroSeconds=nonzeroTime, ratio=nonzeroTime / plainTime))
+
+    output = json.dumps(dict(
+        python=platform.python_version(),
+        platform=platform.platform(),
+        results=results), indent=2)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+if __name__ == '__main__':
+    main()
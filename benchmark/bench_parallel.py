@@ -0,0 +1,107 @@
+# Copyright (c) 2018, DEMCON advanced mechatronics
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# 
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+
+"""
+Benchmark of the read throughput of readParallel as a function of the number
+of workers, against a simulated device with a fixed latency per request.
+The results are written as JSON, e.g.
+
+    python benchmark/bench_parallel.py --workers 1 2 4 8 16 --latency 0.001
+"""
+
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ads import adssymbols, cpyads
+from ads.plcprogram import PlcProgram
+from ads.simulator import SimulatedAdsDll, SimulatedDevice
+import argparse
+import json
+import platform
+import time
+
+
+def timed(function):
+    t0 = time.perf_counter()
+    function()
+    return time.perf_counter() - t0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--variables', type=int, default=200,
+        help='number of variables read per cycle')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--latency', type=float, default=0.001,
+        help='simulated latency per request [s]')
+    parser.add_argument('--jitter', type=float, default=0.0002,
+        help='simulated jitter per request [s]')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('-o', '--output', help='output file (default: stdout)')
+    args = parser.parse_args()
+
+    program = PlcProgram()
+    for i in range(args.variables):
+        program.addSymbol('MAIN.var%d' % i, 'LREAL')
+
+    results = []
+    with SimulatedAdsDll() as lib:
+        lib.addDevice(SimulatedDevice(program, args.latency, args.jitter, seed=0))
+        v = adssymbols.getVariables()
+        variables = [var for name, var in v.MAIN]
+
+        def result(name, workers, seconds):
+            results.append(dict(benchmark=name, workers=workers,
+                seconds=seconds, readsPerSecond=len(variables) / seconds))
+
+        best = min(timed(lambda: [var() for var in variables]) for i in range(args.repeat))
+        result('sequential', 1, best)
+
+        for workers in args.workers:
+            best = min(timed(lambda: adssymbols.readParallel(variables, workers))
+                for i in range(args.repeat))
+            result('readParallel', workers, best)
+
+    output = json.dumps(dict(
+        python=platform.python_version(),
+        platform=platform.platform(),
+        variables=args.variables,
+        latency=args.latency,
+        jitter=args.jitter,
+        results=results), indent=2)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+if __name__ == '__main__':
+    main()
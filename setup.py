@@ -7,10 +7,15 @@ setup(
     description='Python library to interface with Automation Device Specification (ADS)',
     author='Rob Reilink',
     packages=["ads"],
+    entry_points={
+        'console_scripts': ['python-ads = ads.cli:main'],
+    },
+    python_requires='>=3.8',
     license='BSD',
     url="https://github.com/demcon/python-ads",
     classifiers=[
-        'Programming Language :: Python :: 3.6',
+        'Programming Language :: Python :: 3',
+        'Programming Language :: Python :: 3 :: Only',
         'Intended Audience :: Developers',
     ]
 )
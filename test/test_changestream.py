@@ -0,0 +1,51 @@
+from ads import adssymbols
+from ads.changestream import ChangeStream, Change
+from ads.plcprogram import PlcProgram
+from ads.simulator import SimulatedAdsDll, SimulatedDevice
+import pytest
+
+
+def program():
+    program = PlcProgram()
+    program.addStruct('ST_Item', [('id', 'UDINT'), ('value', 'LREAL'), ('name', 'STRING(15)')])
+    program.addStruct('ST_Big', [
+        ('items', program.arrayType('ST_Item', [(1, 20)])),
+        ('counter', 'DINT'),
+        ])
+    program.addSymbol('MAIN.big', 'ST_Big')
+    program.addSymbol('MAIN.speed', 'REAL')
+    return program
+
+
+def test_change_stream():
+    with SimulatedAdsDll() as lib:
+        device = lib.addDevice(SimulatedDevice(program()))
+        v = adssymbols.getVariables()
+
+        stream = ChangeStream({'big': v.MAIN.big, 'speed': v.MAIN.speed},
+            deadbands={'speed': 0.5})
+        changes = stream.poll()
+        assert len(changes) == 20 * 3 + 1 + 1
+        assert Change('big.items[3].name', '') in changes
+
+        assert stream.poll() == []
+        reads = device.requests['read']
+
+        v.MAIN.big.items[3].value(2.5)
+        v.MAIN.big.items[17].name('abc')
+        v.MAIN.big.counter(-1)
+        v.MAIN.speed(0.25)
+        assert stream.poll() == [
+            Change('big.items[3].value', 2.5),
+            Change('big.items[17].name', 'abc'),
+            Change('big.counter', -1),
+            ]
+        assert device.requests['read'] - reads == 2
+
+        v.MAIN.speed(0.75)
+        assert stream.poll() == [Change('speed', 0.75)]
+        v.MAIN.speed(0.5)
+        assert stream.poll() == []
+
+        with pytest.raises(ValueError):
+            ChangeStream([v.MAIN.speed], deadbands={'speed.x': 1})
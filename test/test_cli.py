@@ -0,0 +1,147 @@
+from ads import adssymbols, cli
+from ads.plcprogram import PlcProgram
+from ads.simulator import SimulatedAdsDll, SimulatedDevice
+import json
+import pytest
+
+
+def program():
+    program = PlcProgram()
+    program.addAlias('E_Mode', 'DINT')
+    program.addStruct('ST_Param', [
+        ('enabled', 'BOOL'), ('gain', 'LREAL'), ('mode', 'E_Mode'),
+        ('name', 'STRING(20)'), ('table', program.arrayType('REAL', [(-2, 5)]))])
+    program.addSymbol('GVL_Param.axis1', 'ST_Param')
+    program.addSymbol('GVL_Param.axis2', 'ST_Param')
+    program.addSymbol('GVL_Param.count', 'UINT')
+    program.addSymbol('MAIN.state', 'INT')
+    return program
+
+
+def setValues(v):
+    v.GVL_Param.axis1.enabled(True)
+    v.GVL_Param.axis1.gain(0.25)
+    v.GVL_Param.axis1.name('x "axis", 1')
+    v.GVL_Param.axis2.mode(-3)
+    v.GVL_Param.axis2.table[2](1.5)
+    v.GVL_Param.count(7)
+    v.MAIN.state(5)
+
+
+def reset(device):
+    for image in device.images.values():
+        image[:] = bytes(len(image))
+
+
+@pytest.mark.parametrize('format', cli.FORMATS)
+def test_dump_restore(tmp_path, capsys, format):
+    path = str(tmp_path / ('params.' + format))
+    with SimulatedAdsDll() as lib:
+        device = lib.addDevice(SimulatedDevice(program()))
+        v = adssymbols.getVariables()
+        setValues(v)
+
+        reads = device.requests['read']
+        cli.main(['dump', 'gvl_param.*', '-o', path])
+        assert device.requests['read'] - reads - 3 == 1 # 3 reads to upload the symbols
+        report = capsys.readouterr().err
+        assert report.startswith('dump: 3 symbols') and 'in 1 requests' in report
+
+        if format == 'jsonl':
+            with open(path) as f:
+                records = [json.loads(line) for line in f]
+            assert {'path': 'GVL_Param.axis1.gain', 'value': 0.25} in records
+            assert {'path': 'GVL_Param.axis2.table[2]', 'value': 1.5} in records
+            assert len(records) == 2 * 9 + 1
+
+        reset(device)
+        writes, sums = device.requests['write'], device.requests['readWrite']
+        cli.main(['restore', path])
+        # Raw data is written as a whole; the leaves of structures with
+        # padding are written separately, in a single sum write
+        if format == 'raw':
+            assert device.requests['write'] - writes == 1
+        else:
+            assert device.requests['readWrite'] - sums == 1
+        assert capsys.readouterr().err.startswith('restore: 3 symbols')
+
+        assert v.GVL_Param.axis1.enabled()
+        assert v.GVL_Param.axis1.gain() == 0.25
+        assert v.GVL_Param.axis1.name() == 'x "axis", 1'
+        assert v.GVL_Param.axis2.mode() == -3
+        assert v.GVL_Param.axis2.table[2]() == 1.5
+        assert v.GVL_Param.count() == 7
+        assert v.MAIN.state() == 0
+
+        # Restoring a selection
+        reset(device)
+        cli.main(['restore', path, '*.count'])
+        assert v.GVL_Param.count() == 7
+        assert v.GVL_Param.axis1.gain() == 0
+
+
+def test_spans():
+    with SimulatedAdsDll() as lib:
+        device = lib.addDevice(SimulatedDevice(program()))
+        v = adssymbols.getVariables()
+        definition = (~v.MAIN.state).variablesDefinition
+        symbols = cli.selectSymbols(definition, ['*'])
+        assert [s.name for s in symbols] == list(definition.symbols)
+
+        assert len(list(cli.spans(symbols, 64, 65536))) == 1
+        size = symbols[0].size
+        assert [len(s[3]) for s in cli.spans(symbols, 64, size * 2)] == [2, 2]
+        assert len(list(cli.spans(symbols, 0, 65536))) == 1 + (symbols[2].iOffs > symbols[1].iOffs + size)
+
+
+def test_restore_partial(tmp_path, capsys):
+    path = str(tmp_path / 'partial.jsonl')
+    with open(path, 'w') as f:
+        f.write(json.dumps({'path': 'GVL_Param.axis1.gain', 'value': 2.0}) + '\n')
+        f.write(json.dumps({'path': 'GVL_Param.axis1.table[-1]', 'value': 3.0}) + '\n')
+
+    with SimulatedAdsDll() as lib:
+        device = lib.addDevice(SimulatedDevice(program()))
+        v = adssymbols.getVariables()
+        setValues(v)
+        writes, sums = device.requests['write'], device.requests['readWrite']
+        cli.main(['restore', path])
+        # The two leaves are written in a single sum write request
+        assert device.requests['write'] - writes == 0
+        assert device.requests['readWrite'] - sums == 1
+        assert v.GVL_Param.axis1.gain() == 2.0
+        assert v.GVL_Param.axis1.table[-1]() == 3.0
+        assert v.GVL_Param.axis1.enabled()
+        assert v.GVL_Param.axis1.name() == 'x "axis", 1'
+
+        with open(path, 'a') as f:
+            f.write(json.dumps({'path': 'GVL_Param.axis1.missing', 'value': 0}) + '\n')
+        with pytest.raises(KeyError):
+            cli.main(['restore', path])
+
+
+def test_restore_unknown_member(tmp_path):
+    program = PlcProgram()
+    program.addStruct('ST_Hidden', [('x', 'DINT')])
+    program.addStruct('ST_Holder', [('a', 'INT'), ('hidden', 'ST_Hidden'), ('b', 'INT')])
+    program.addSymbol('MAIN.holder', 'ST_Holder')
+    # The datatype of the member is not uploaded, so it has no leaves
+    del program.datatypes['ST_Hidden']
+
+    path = str(tmp_path / 'holder.jsonl')
+    with SimulatedAdsDll() as lib:
+        device = lib.addDevice(SimulatedDevice(program))
+        with pytest.warns(UserWarning):
+            v = adssymbols.getVariables()
+        v.MAIN.holder.a(1)
+        v.MAIN.holder.b(2)
+        cli.main(['dump', '*', '-o', path])
+
+        symbol = program.symbols['MAIN.holder']
+        image = device.images[symbol.iGroup]
+        image[symbol.iOffs + 4:symbol.iOffs + 8] = b'\x07\x00\x00\x00'
+        v.MAIN.holder.a(0)
+        cli.main(['restore', path])
+        assert v.MAIN.holder.a() == 1
+        assert v.MAIN.holder.b() == 2
+        assert image[symbol.iOffs + 4:symbol.iOffs + 8] == b'\x07\x00\x00\x00'
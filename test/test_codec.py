@@ -0,0 +1,87 @@
+from ads import adssymbols
+from ads.adssymbols import PLCString
+from ads.codec import Codec
+from ads.plcprogram import PlcProgram
+from ads.simulator import SimulatedAdsDll, SimulatedDevice
+from ctypes import Array, Structure
+import pytest
+
+
+def program():
+    program = PlcProgram()
+    program.addAlias('E_State', 'INT')
+    program.addStruct('ST_Point', [('valid', 'BOOL'), ('x', 'LREAL'), ('label', 'STRING(7)')])
+    program.addStruct('ST_Data', [
+        ('state', 'E_State'),
+        ('counter', 'ULINT'),
+        ('points', program.arrayType('ST_Point', [(-1, 3)])),
+        ('matrix', program.arrayType('INT', [(1, 2), (0, 3)])),
+        ('names', program.arrayType('STRING(5)', [(1, 2)])),
+        ('flags', program.arrayType('BOOL', [(0, 5)])),
+        ])
+    program.addSymbol('MAIN.data', 'ST_Data')
+    program.addSymbol('MAIN.table', program.arrayType('ST_Data', [(1, 2)]))
+    program.addSymbol('MAIN.text', 'STRING(20)')
+    program.addSymbol('MAIN.value', 'REAL')
+    return program
+
+
+def toPython(data):
+    """
+    Conversion of ctypes objects to Python objects through attribute access
+    """
+    if isinstance(data, PLCString):
+        return str(data)
+    if isinstance(data, Structure):
+        return {name: toPython(getattr(data, name)) for name, type in data._fields_ if name}
+    if isinstance(data, Array):
+        return [toPython(item) for item in data]
+    return data
+
+
+def test_codec():
+    with SimulatedAdsDll() as lib:
+        lib.addDevice(SimulatedDevice(program()))
+        v = adssymbols.getVariables()
+
+        v.MAIN.data.state(3)
+        v.MAIN.data.counter(2 ** 40)
+        v.MAIN.data.points[0].valid(True)
+        v.MAIN.data.points[0].x(-1.5)
+        v.MAIN.data.points[1].label('abc')
+        v.MAIN.data.matrix[2, 1](-9)
+        v.MAIN.data.names[2]('xy')
+        v.MAIN.data.flags[4](True)
+        v.MAIN.table[2].counter(7)
+        v.MAIN.table[1].points[0].x(2.5)
+        v.MAIN.text('hello')
+        v.MAIN.value(0.5)
+
+        value = v.MAIN.data.read_python()
+        assert value == toPython(v.MAIN.data())
+        assert value['state'] == 3
+        assert value['counter'] == 2 ** 40
+        assert value['points'][1] == {'valid': True, 'x': -1.5, 'label': ''}
+        assert value['points'][2]['label'] == 'abc'
+        assert value['matrix'] == [[0, 0, 0], [0, -9, 0]]
+        assert value['names'] == ['', 'xy']
+        assert value['flags'] == [False] * 4 + [True]
+
+        assert v.MAIN.table.read_python() == toPython(v.MAIN.table())
+        assert v.MAIN.table.read_python()[1]['counter'] == 7
+        assert v.MAIN.text.read_python() == 'hello'
+        assert v.MAIN.value.read_python() == 0.5
+        assert v.MAIN.data.points.read_python()[1]['x'] == -1.5
+
+        ctype = (~v.MAIN.table).ctype
+        definition = (~v.MAIN.table).variablesDefinition
+        codec = definition.getCodec(ctype)
+        assert definition.getCodec(ctype) is codec
+        assert codec.bounds == [(1, 2)]
+        assert codec.struct.size == codec.size
+
+        # Decoding from a larger buffer, to tuples
+        data = bytes(3) + bytes(v.MAIN.table())
+        value = Codec(ctype, tuples=True).decode(data, 3)
+        assert value[1][1] == 7
+        assert value[0][2][1] == (False, 2.5, '')
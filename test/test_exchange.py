@@ -0,0 +1,61 @@
+from ads import adssymbols, cpyads
+from ads.plcprogram import PlcProgram
+from ads.simulator import SimulatedAdsDll, SimulatedDevice
+from ctypes import c_double, c_int16, c_uint32, create_string_buffer
+import pytest
+
+
+def program():
+    program = PlcProgram()
+    program.addStruct('ST_Response', [('id', 'UDINT'), ('result', 'LREAL')])
+    program.addSymbol('MAIN.command', 'UDINT')
+    program.addSymbol('MAIN.response', 'ST_Response')
+    program.addSymbol('MAIN.counter', 'INT')
+    return program
+
+
+class MailboxDevice(SimulatedDevice):
+    """
+    Device that answers a command written to MAIN.command in MAIN.response
+    """
+    def write(self, indexGroup, indexOffset, data):
+        super().write(indexGroup, indexOffset, data)
+        command = self._symbols['MAIN.COMMAND']
+        if (indexGroup, indexOffset) == (command.iGroup, command.iOffs):
+            response = self._symbols['MAIN.RESPONSE']
+            value = c_uint32.from_buffer_copy(data)
+            super().write(response.iGroup, response.iOffs,
+                bytes(value) + bytes(4) + bytes(c_double(value.value / 2)))
+
+
+def test_exchange():
+    with SimulatedAdsDll() as lib:
+        device = lib.addDevice(MailboxDevice(program()))
+        v = adssymbols.getVariables()
+
+        requests = sum(device.requests.values())
+        response = v.MAIN.command.exchange(42, v.MAIN.response)
+        assert sum(device.requests.values()) - requests == 1
+        assert device.requests['readWrite'] == 1
+        assert (response.id, response.result) == (42, 21.0)
+        assert v.MAIN.command() == 42
+
+        assert v.MAIN.counter.exchange(c_int16(-3), v.MAIN.command) == 42
+        assert v.MAIN.counter() == -3
+
+        with pytest.raises(ValueError):
+            other = adssymbols.getVariables()
+            v.MAIN.command.exchange(1, other.MAIN.response)
+
+
+def test_read_write_request():
+    with SimulatedAdsDll() as lib:
+        device = lib.addDevice(SimulatedDevice(program()))
+        cpyads.adsPortOpen()
+        address = cpyads.SAmsAddr(None, 851)
+        handle = cpyads.adsSyncReadWriteReq(address,
+            adssymbols.ADSIGRP_SYM_HNDBYNAME, 0, c_uint32,
+            create_string_buffer(b'MAIN.counter'))
+        cpyads.adsSyncWriteReq(address, adssymbols.ADSIGRP_SYM_VALBYHND,
+            handle.value, c_int16(7))
+        assert adssymbols.getVariables().MAIN.counter() == 7
@@ -0,0 +1,82 @@
+from ads import cpyads
+from ads.fleet import Fleet
+from ads.plcprogram import PlcProgram
+from ads.simulator import SimulatedAdsDll, SimulatedDevice
+import time
+
+
+def program(extra=False):
+    program = PlcProgram()
+    program.addStruct('ST_Axis', [('position', 'LREAL'), ('enabled', 'BOOL')])
+    program.addSymbol('MAIN.counter', 'DINT')
+    program.addSymbol('MAIN.axes', program.arrayType('ST_Axis', [(1, 2)]))
+    if extra:
+        program.addSymbol('MAIN.extra', 'INT')
+    return program
+
+
+def test_fleet():
+    paths = ['MAIN.counter', 'MAIN.axes[2].position', 'MAIN.extra']
+
+    with SimulatedAdsDll() as lib:
+        targets = []
+        for i in range(6):
+            netId = '10.0.0.%d.1.1' % i
+            device = lib.addDevice(SimulatedDevice(program(extra=i != 1)), netId)
+            symbol = program().symbols['MAIN.counter']
+            device.images[symbol.iGroup][symbol.iOffs] = i
+            targets.append(cpyads.SAmsAddr(netId, 851))
+
+        # Slow target, and a target that does not exist
+        lib.addDevice(SimulatedDevice(program(True), latency=0.15), '10.0.0.99.1.1')
+        targets.append(cpyads.SAmsAddr('10.0.0.99.1.1', 851))
+        targets.append(cpyads.SAmsAddr('10.0.0.100.1.1', 851))
+
+        with Fleet(targets, paths, workers=4, timeout=0.1) as fleet:
+            t0 = time.monotonic()
+            result = fleet.read()
+            assert time.monotonic() - t0 < 1
+
+            assert [row[0] for row in result.values[:6]] == list(range(6))
+            assert all(result.ok(i) for i in (0, 2, 3, 4, 5))
+
+            # Path missing on a single target
+            assert not result.ok(1)
+            assert result.values[1][:2] == [1, 0.0]
+            assert isinstance(result.errors[1][2], KeyError)
+
+            assert isinstance(result.errors[6][0], TimeoutError)
+            assert isinstance(result.errors[7][0], IOError)
+
+            # Slow target is skipped while its read is still in progress
+            result = fleet.read()
+            assert isinstance(result.errors[6][0], TimeoutError)
+            assert result.asDict()['10.0.0.0.1.1:851']['MAIN.counter'] == 0
+
+        assert lib.openPorts == set()
+
+
+def test_offline_targets():
+    with SimulatedAdsDll() as lib:
+        targets = []
+        devices = []
+        for i in range(8):
+            netId = '10.0.0.%d.1.1' % i
+            devices.append(lib.addDevice(SimulatedDevice(program()), netId))
+            targets.append(cpyads.SAmsAddr(netId, 851))
+
+        with Fleet(targets, ['MAIN.counter'], workers=4, timeout=0.2) as fleet:
+            assert all(fleet.read().ok(i) for i in range(8))
+
+            # The offline targets occupy all workers first, but time out at
+            # the ADS port, so the healthy targets are read in the same cycle
+            for device in devices[:4]:
+                device.offline = True
+            for cycle in range(2):
+                result = fleet.read()
+                assert all(isinstance(result.errors[i][0], TimeoutError) for i in range(4))
+                assert all(result.ok(i) for i in range(4, 8))
+                assert [row[0] for row in result.values[4:]] == [0] * 4
+
+            t0 = time.monotonic()
+        assert time.monotonic() - t0 < 0.5
@@ -0,0 +1,148 @@
+from ads import adssymbols, cpyads, gateway as gatewayModule
+from ads.gateway import Gateway, GatewayClient
+from ads.plcprogram import PlcProgram
+from ads.simulator import SimulatedAdsDll, SimulatedDevice
+import os
+import pytest
+import struct
+import subprocess
+import sys
+import threading
+
+
+def program():
+    program = PlcProgram()
+    program.addStruct('ST_Axis', [('position', 'LREAL'), ('velocity', 'REAL'), ('name', 'STRING(15)')])
+    program.addSymbol('MAIN.axes', program.arrayType('ST_Axis', [(1, 4)]))
+    program.addSymbol('MAIN.counter', 'DINT')
+    program.addSymbol('MAIN.unpublished', 'INT')
+    return program
+
+
+def test_gateway():
+    with SimulatedAdsDll() as lib:
+        device = lib.addDevice(SimulatedDevice(program()))
+        cpyads.adsPortOpen()
+        definition = adssymbols.AdsVariablesDefinition(cpyads.SAmsAddr(port=851))
+        v = definition.variables
+        v.MAIN.axes[2].position(1.5)
+        v.MAIN.axes[3].name('z')
+        v.MAIN.counter(7)
+
+        with Gateway(definition, ['MAIN.axes', 'MAIN.counter']) as gateway:
+            gateway.poll()
+            reads = device.requests['read']
+
+            with GatewayClient(gateway.name) as client:
+                assert client.status()[0] == 1
+                assert client.variables.MAIN.axes[2].position() == 1.5
+                assert client.getVariable('MAIN.axes[3].name')() == 'z'
+                assert client.variables.MAIN.counter() == 7
+                assert device.requests['read'] == reads
+
+                v.MAIN.counter(8)
+                assert client.variables.MAIN.counter() == 7
+                gateway.poll()
+                assert client.variables.MAIN.counter() == 8
+                assert client.status()[0] == 2
+
+                with pytest.raises(IOError):
+                    client.variables.MAIN.unpublished()
+                with pytest.raises(IOError):
+                    client.variables.MAIN.counter(1)
+
+
+def test_gateway_consistency():
+    with SimulatedAdsDll() as lib:
+        lib.addDevice(SimulatedDevice(program()))
+        cpyads.adsPortOpen()
+        definition = adssymbols.AdsVariablesDefinition(cpyads.SAmsAddr(port=851))
+        v = definition.variables
+
+        with Gateway(definition, ['MAIN.axes'], period=0.001) as gateway:
+            stop = threading.Event()
+
+            def writer():
+                # Keep all positions equal, so a torn read shows as a mismatch
+                i = 0
+                while not stop.is_set():
+                    i += 1
+                    v.MAIN.axes(*[(i, 0)] * 4)
+
+            thread = threading.Thread(target=writer)
+            thread.start()
+            gateway.start()
+            try:
+                with GatewayClient(gateway.name) as client:
+                    for i in range(200):
+                        positions = [axis.position for axis in client.variables.MAIN.axes()]
+                        assert len(set(positions)) == 1
+            finally:
+                gateway.stop()
+                stop.set()
+                thread.join()
+            assert gateway.statistics()['samples'] > 0
+
+
+def test_gateway_torn_read(monkeypatch):
+    with SimulatedAdsDll() as lib:
+        lib.addDevice(SimulatedDevice(program()))
+        cpyads.adsPortOpen()
+        definition = adssymbols.AdsVariablesDefinition(cpyads.SAmsAddr(port=851))
+        v = definition.variables
+        v.MAIN.counter(7)
+
+        with Gateway(definition, ['MAIN.counter']) as gateway:
+            gateway.poll()
+            v.MAIN.counter(8)
+
+            class InterleavingStruct:
+                """
+                The struct module, of which unpack_from (used by the client
+                between copying the data and checking the sequence number
+                again) first publishes a new cycle
+                """
+                calls = 0
+
+                def unpack_from(self, *args):
+                    self.calls += 1
+                    if self.calls == 1:
+                        gateway.poll()
+                    return struct.unpack_from(*args)
+
+                def __getattr__(self, name):
+                    return getattr(struct, name)
+
+            with GatewayClient(gateway.name) as client:
+                interleaving = InterleavingStruct()
+                monkeypatch.setattr(gatewayModule, 'struct', interleaving)
+                # The data copied before the new cycle is discarded
+                assert client.variables.MAIN.counter() == 8
+                assert interleaving.calls == 2
+
+
+def test_gateway_client_process():
+    # Clients in other processes must not remove the segment when they exit
+    script = (
+        'from ads.gateway import GatewayClient\n'
+        'with GatewayClient(%r) as client:\n'
+        '    print(client.variables.MAIN.counter())\n')
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    with SimulatedAdsDll() as lib:
+        lib.addDevice(SimulatedDevice(program()))
+        cpyads.adsPortOpen()
+        definition = adssymbols.AdsVariablesDefinition(cpyads.SAmsAddr(port=851))
+        definition.variables.MAIN.counter(7)
+
+        gateway = Gateway(definition, ['MAIN.counter'])
+        gateway.poll()
+        for i in range(2):
+            result = subprocess.run([sys.executable, '-c', script % gateway.name],
+                cwd=root, capture_output=True, text=True, check=True)
+            assert result.stdout.strip() == '7'
+            assert 'leaked' not in result.stderr
+
+        with GatewayClient(gateway.name) as client:
+            assert client.variables.MAIN.counter() == 7
+        gateway.close()
@@ -0,0 +1,69 @@
+from ads import adssymbols
+from ads.plcprogram import PlcProgram
+from ads.simulator import SimulatedAdsDll, SimulatedDevice
+from ctypes import sizeof
+import pytest
+
+
+def program():
+    program = PlcProgram()
+    program.addAlias('E_State', 'INT')
+    program.addStruct('ST_Point', [('valid', 'BOOL'), ('x', 'LREAL'), ('label', 'STRING(7)')])
+    program.addStruct('ST_Data', [
+        ('state', 'E_State'),
+        ('points', program.arrayType('ST_Point', [(-1, 3)])),
+        ('matrix', program.arrayType('INT', [(1, 2), (0, 3)])),
+        ])
+    program.addSymbol('MAIN.data', 'ST_Data')
+    program.addSymbol('MAIN.table', program.arrayType('ST_Data', [(1, 100)]))
+    program.addSymbol('MAIN.value', 'REAL')
+    return program
+
+
+def traverse(path, var, baseOffset):
+    """
+    The leaves of var found by iterating over Variables
+    """
+    try:
+        children = list(var)
+    except TypeError:
+        children = []
+    if not children:
+        info = ~var
+        return [(path, info.offset - baseOffset, sizeof(info.ctype))]
+    leaves = []
+    for name, child in children:
+        leaves += traverse(path + (name if name.startswith('[') else '.' + name), child, baseOffset)
+    return leaves
+
+
+def test_leaves():
+    with SimulatedAdsDll() as lib:
+        lib.addDevice(SimulatedDevice(program()))
+        v = adssymbols.getVariables()
+        definition = (~v.MAIN.data).variablesDefinition
+
+        layout = definition.leaves(v.MAIN.data)
+        assert len(layout) == 1 + 3 * 3 + 6
+        assert [(leaf.path, leaf.offset, leaf.size) for leaf in layout] == traverse('', v.MAIN.data, (~v.MAIN.data).offset)
+        assert layout[2].path == '.points[-1].x'
+        assert layout[2].ctype is (~v.MAIN.data.points[-1].x).ctype
+        assert layout.path(len(layout) - 1) == '.matrix[2,2]'
+
+        # Layouts are built once per datatype and relative to the variable
+        table = definition.leaves(v.MAIN.table)
+        assert definition.leaves(v.MAIN.table) is table
+        assert definition.leaves(v.MAIN.table[3]) is layout
+        assert definition.leaves(v.MAIN.table[3].points) is definition.leaves(v.MAIN.data.points)
+        assert len(table) == 100 * len(layout)
+        assert table.paths() == [path for path, offset, size in traverse('', v.MAIN.table, (~v.MAIN.table).offset)]
+        assert table.offsets[len(layout)] == (~v.MAIN.table[2]).offset - (~v.MAIN.table).offset
+
+        # Prefix sharing: one node per path segment
+        assert len(table.segments) == 100 * (1 + 1 + 1 + 3 * (1 + 3) + 1 + 6)
+
+        # Simple variables
+        value, = definition.leaves(v.MAIN.value)
+        assert value.path == '' and value.offset == 0 and value.size == 4
+        state, = definition.leaves(v.MAIN.data.state)
+        assert state.size == 2
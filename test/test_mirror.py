@@ -0,0 +1,119 @@
+from ads import adssymbols
+from ads.mirror import VerifyError
+from ads.plcprogram import PlcProgram
+from ads.simulator import SimulatedAdsDll, SimulatedDevice
+import pytest
+
+
+def program():
+    program = PlcProgram()
+    program.addStruct('ST_Axis', [('enabled', 'BOOL'), ('position', 'LREAL'), ('name', 'STRING(15)')])
+    program.addStruct('ST_Config', [
+        ('speed', 'LREAL'),
+        ('acceleration', 'LREAL'),
+        ('name', 'STRING(80)'),
+        ('axes', program.arrayType('ST_Axis', [(1, 4)])),
+        ('matrix', program.arrayType('INT', [(-1, 3), (0, 2)])),
+        ('reserved', program.arrayType('BYTE', [(0, 4000)])),
+        ('limit', 'DINT'),
+        ])
+    program.addSymbol('MAIN.config', 'ST_Config')
+    return program
+
+
+class ClampingDevice(SimulatedDevice):
+    """
+    Device on which MAIN.config.limit is clamped to 100 by the PLC program
+    """
+    def write(self, indexGroup, indexOffset, data):
+        super().write(indexGroup, indexOffset, data)
+        limit = self.limitOffset
+        if indexOffset <= limit < indexOffset + len(data):
+            value = int.from_bytes(self.images[indexGroup][limit:limit + 4], 'little', signed=True)
+            self.images[indexGroup][limit:limit + 4] = min(value, 100).to_bytes(4, 'little', signed=True)
+
+
+def test_mirror():
+    with SimulatedAdsDll() as lib:
+        device = lib.addDevice(SimulatedDevice(program()))
+        v = adssymbols.getVariables()
+        v.MAIN.config.name('initial')
+        v.MAIN.config.axes[3].position(3.0)
+
+        writes = device.requests['write']
+        reads = device.requests['read']
+        sums = device.requests['readWrite']
+        with v.MAIN.config.edit() as config:
+            assert config.name == 'initial'
+            assert config.axes[3].position == 3.0
+            config.speed = 1.5
+            config.acceleration = 2.5
+            config.axes[2].enabled = True
+            config.matrix[1, 0] = -7
+            config.limit = 12
+            assert config.speed == 1.5
+            assert config.dirtyRanges() == [(0, 16), ((~v.MAIN.config.axes[2]).offset, (~v.MAIN.config.axes[2]).offset + 1),
+                ((~v.MAIN.config.matrix[1, 0]).offset, (~v.MAIN.config.matrix[1, 0]).offset + 2),
+                ((~v.MAIN.config.limit).offset, (~v.MAIN.config.limit).offset + 4)]
+        # One read of the mirror and one sum write of all modified ranges
+        assert device.requests['read'] - reads == 1
+        assert device.requests['write'] - writes == 0
+        assert device.requests['readWrite'] - sums == 1
+        assert v.MAIN.config.speed() == 1.5
+        assert v.MAIN.config.acceleration() == 2.5
+        assert v.MAIN.config.axes[2].enabled()
+        assert v.MAIN.config.matrix[1, 0]() == -7
+        assert v.MAIN.config.limit() == 12
+        assert v.MAIN.config.name() == 'initial'
+
+        # Structures can be assigned as a whole, and modifications discarded
+        config = v.MAIN.config.edit()
+        config.axes[1] = dict(enabled=True, position=4.0, name='x')
+        assert config.axes[1].name == 'x'
+        assert config.axes[1].position == 4.0
+        config.matrix = [[1, 2]] * 3
+        assert config.matrix[1, 1] == 2
+        config.name = 'discarded'
+        config.discard()
+        assert config.name == 'initial'
+        assert config.commit() == []
+
+        # Nothing is written after an exception
+        writes = device.requests['write']
+        with pytest.raises(ZeroDivisionError):
+            with v.MAIN.config.edit() as config:
+                config.speed = 1 / 0
+        assert device.requests['write'] == writes
+
+        with pytest.raises(TypeError):
+            v.MAIN.config.speed.edit()
+
+
+def test_verify():
+    with SimulatedAdsDll() as lib:
+        device = lib.addDevice(ClampingDevice(program()))
+        v = adssymbols.getVariables()
+        limit = ~v.MAIN.config.limit
+        device.limitOffset = limit.symbol.iOffs + limit.offset
+
+        config = v.MAIN.config.edit()
+        config.limit = 50
+        config.speed = 1.0
+        assert config.commit(verify=True) == [(0, 8), (limit.offset, limit.offset + 4)]
+
+        config.limit = 500
+        writes, sums = device.requests['write'], device.requests['readWrite']
+        with pytest.raises(VerifyError) as e:
+            config.commit(verify=True)
+        assert e.value.ranges == [(limit.offset, limit.offset + 4)]
+        # One plain write of the single range and one sum read to verify it
+        assert device.requests['write'] - writes == 1
+        assert device.requests['readWrite'] - sums == 1
+
+        config.limit = 20
+        config.speed = 2.0
+        writes, sums = device.requests['write'], device.requests['readWrite']
+        config.commit(verify=True)
+        assert device.requests['write'] - writes == 0
+        assert device.requests['readWrite'] - sums == 2
+        assert v.MAIN.config.limit() == 20
@@ -15,3 +15,60 @@ def test_usage():
     
     t1[-1] = 4
     assert t1[-1] == 4
+
+
+def test_bulk_access():
+    T = NonzeroBasedArray.create(ctypes.c_int32, -50000, 100000)
+    t = T(*range(100))
+    t[49999] = -1
+
+    assert list(t)[:3] == [0, 1, 2]
+    assert t.tolist() == list(range(100)) + [0] * 99899 + [-1]
+    assert list(reversed(t))[0] == -1
+    assert t[-49999:-49996] == [1, 2, 3]
+
+    t[-2:2] = [7, 8, 9, 10]
+    assert t[-2:2] == [7, 8, 9, 10]
+    assert t[-2] == 7 and t[1] == 10
+
+    view = t.view()
+    assert view.format == 'i' and len(view) == 100000
+    assert view[49998] == 7
+    view[0] = 42
+    assert t[-50000] == 42
+
+
+def test_struct_items():
+    class S(ctypes.Structure):
+        _fields_ = [('x', ctypes.c_double)]
+
+    T = NonzeroBasedArray.create(S, 1, 3)
+    t = T()
+    for i, item in enumerate(t, 1):
+        item.x = i
+    assert [item.x for item in t] == [1, 2, 3]
+    assert t[3].x == 3
+    assert len(t.view()) == 24
+
+
+def test_char_items():
+    T = NonzeroBasedArray.create(ctypes.c_char, 1, 3)
+    t = T(b'a', b'b', b'c')
+    assert list(t) == [b'a', b'b', b'c'] == [t[1], t[2], t[3]]
+
+
+def test_lazy_iteration():
+    T = NonzeroBasedArray.create(ctypes.c_int32, -500, 1000)
+    t = T(*range(1000))
+
+    # Items are decoded as the iteration proceeds, not all up front
+    items = iter(t)
+    assert next(items) == 0
+    t[400] = -1
+    assert list(items) == list(range(1, 900)) + [-1] + list(range(901, 1000))
+
+    items = reversed(t)
+    assert next(items) == 999
+    t[-500] = -2
+    assert list(items)[-3:] == [2, 1, -2]
+    assert list(reversed(t)) == t.tolist()[::-1]
@@ -0,0 +1,75 @@
+from ads import adssymbols, cpyads
+from ads.pathindex import PathIndex
+from ads.plcprogram import PlcProgram, syntheticProgram
+from ads.simulator import SimulatedAdsDll, SimulatedDevice
+
+
+def program():
+    program = PlcProgram()
+    program.addAlias('E_State', 'INT')
+    program.addStruct('ST_Status', [('state', 'E_State'), ('errorId', 'UDINT')])
+    program.addStruct('ST_Axis', [('position', 'LREAL'), ('status', 'ST_Status')])
+    program.addSymbol('MAIN.axes', program.arrayType('ST_Axis', [(1, 2)]))
+    program.addSymbol('MAIN.samples', program.arrayType('LREAL', [(0, 1000)]))
+    program.addSymbol('GVL.state', 'E_State')
+    program.addSymbol('GVL.Sub.axis', 'ST_Axis')
+    return program
+
+
+def search(index, query, **kwargs):
+    return [index.path(i) for batch in index.search(query, **kwargs) for i in batch]
+
+
+def test_path_index():
+    with SimulatedAdsDll() as lib:
+        lib.addDevice(SimulatedDevice(program()))
+        cpyads.adsPortOpen()
+        definition = adssymbols.AdsVariablesDefinition(cpyads.SAmsAddr(port=851))
+        index = PathIndex(definition, maxArrayItems=10)
+        index.build()
+
+        paths = [index.path(i) for i in range(len(index))]
+        assert paths == [
+            'MAIN', 'MAIN.axes',
+            'MAIN.axes[1]', 'MAIN.axes[1].position', 'MAIN.axes[1].status',
+            'MAIN.axes[1].status.state', 'MAIN.axes[1].status.errorId',
+            'MAIN.axes[2]', 'MAIN.axes[2].position', 'MAIN.axes[2].status',
+            'MAIN.axes[2].status.state', 'MAIN.axes[2].status.errorId',
+            'MAIN.samples',
+            'GVL', 'GVL.state', 'GVL.Sub', 'GVL.Sub.axis', 'GVL.Sub.axis.position',
+            'GVL.Sub.axis.status', 'GVL.Sub.axis.status.state',
+            'GVL.Sub.axis.status.errorId',
+            ]
+        for path in paths:
+            if path not in ('MAIN', 'GVL', 'GVL.Sub'):
+                definition.getVariable(path)
+        assert index.names(paths.index('MAIN.axes[2].status')) == ['MAIN', 'axes', '[2]', 'status']
+
+        # Descendants of matches are not reported
+        assert search(index, 'STATUS') == [
+            'MAIN.axes[1].status', 'MAIN.axes[2].status', 'GVL.Sub.axis.status']
+        assert search(index, 'status') == search(index, 'status', batchSize=1)
+        assert search(index, 'gvl') == ['GVL']
+        assert search(index, 'axes state') == [
+            'MAIN.axes[1].status.state', 'MAIN.axes[2].status.state']
+        assert search(index, 'state', limit=2) == [
+            'MAIN.axes[1].status.state', 'MAIN.axes[2].status.state']
+
+        # Narrowing down while typing, and widening again
+        assert search(index, 'err') == [
+            'MAIN.axes[1].status.errorId', 'MAIN.axes[2].status.errorId',
+            'GVL.Sub.axis.status.errorId']
+        assert search(index, 'err sub') == ['GVL.Sub.axis.status.errorId']
+        assert search(index, 'sub') == ['GVL.Sub']
+
+
+def test_background_build():
+    with SimulatedAdsDll() as lib:
+        lib.addDevice(SimulatedDevice(syntheticProgram(2000)))
+        cpyads.adsPortOpen()
+        definition = adssymbols.AdsVariablesDefinition(cpyads.SAmsAddr(port=851))
+        index = PathIndex(definition).start()
+        results = search(index, 'var1', limit=100000)
+        assert index.ready.is_set()
+        assert results == ['%s.var%d' % ('MAIN' if i < 50 else 'GVL_%d' % (i // 50), i)
+            for i in range(2000) if str(i).startswith('1')]
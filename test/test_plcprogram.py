@@ -0,0 +1,49 @@
+from ads import adssymbols, cpyads
+from ads.plcprogram import PlcProgram, syntheticProgram
+from ads.simulator import SimulatedAdsDll, SimulatedDevice
+from ctypes import sizeof
+import warnings
+
+
+def test_datatype_roundtrip():
+    program = PlcProgram()
+    program.addAlias('E_State', 'INT')
+    program.addStruct('ST_Inner', [('a', 'BOOL'), ('b', 'LREAL'), ('s', 'STRING(10)')])
+    program.addStruct('ST_Outer', [
+        ('state', 'E_State'),
+        ('inner', 'ST_Inner'),
+        ('values', program.arrayType('DINT', [(-2, 5)])),
+        ])
+
+    dtypes = {t.name: t for t in adssymbols.AdsDatatypeEntry.iter(program.datatypesBlob())}
+    assert set(dtypes) == {'E_State', 'ST_Inner', 'ST_Outer', 'ARRAY [-2..2] OF DINT'}
+
+    inner = dtypes['ST_Inner']
+    assert [(s.name, s.type, s.offs, s.size) for s in inner.subItems.values()] == [
+        ('a', 'BOOL', 0, 1), ('b', 'LREAL', 8, 8), ('s', 'STRING(10)', 16, 11)]
+    assert inner.size == 32
+
+    array = dtypes['ARRAY [-2..2] OF DINT']
+    assert array.type == 'DINT'
+    assert array.array == [(-2, 5)]
+    assert array.size == 20
+    assert dtypes['ST_Outer'].hashValue == program.typeHash('ST_Outer')
+
+
+def test_symbol_roundtrip():
+    program = syntheticProgram(200)
+    symbols = list(adssymbols.AdsSymbolEntry.iter(program.symbolsBlob()))
+    assert len(symbols) == 200
+    for symbol, expected in zip(symbols, program.symbols.values()):
+        assert (symbol.name, symbol.type, symbol.iGroup, symbol.iOffs, symbol.size) == (
+            expected.name, expected.type, expected.iGroup, expected.iOffs, expected.size)
+
+
+def test_ctype_sizes_match():
+    with SimulatedAdsDll() as lib, warnings.catch_warnings():
+        warnings.simplefilter('error')
+        lib.addDevice(SimulatedDevice(syntheticProgram(10)))
+        cpyads.adsPortOpen()
+        defs = adssymbols.AdsVariablesDefinition(cpyads.SAmsAddr(port=851))
+        for name, dtype in defs.dtypes.items():
+            assert sizeof(defs.getCtype(name)) == dtype.size
@@ -0,0 +1,59 @@
+from ads import adssymbols
+from ads.nonzerobasedarray import NonzeroBasedArray
+from ads.plcprogram import PlcProgram
+from ads.simulator import SimulatedAdsDll, SimulatedDevice
+import pytest
+
+
+def program():
+    program = PlcProgram()
+    program.addStruct('ST_Point', [('valid', 'BOOL'), ('x', 'LREAL')])
+    program.addSymbol('MAIN.samples', program.arrayType('LREAL', [(-100, 10000)]))
+    program.addSymbol('MAIN.matrix', program.arrayType('DINT', [(1, 4), (0, 10)]))
+    program.addSymbol('MAIN.points', program.arrayType('ST_Point', [(0, 10)]))
+    return program
+
+
+def test_read_write_range():
+    with SimulatedAdsDll() as lib:
+        device = lib.addDevice(SimulatedDevice(program()))
+        v = adssymbols.getVariables()
+
+        writes, reads = device.requests['write'], device.requests['read']
+        v.MAIN.samples.write_range(900, [float(i) for i in range(900, 1100)])
+        data = v.MAIN.samples.read_range(1000, 1100)
+        assert device.requests['write'] - writes == 1
+        assert device.requests['read'] - reads == 1
+        assert isinstance(data, NonzeroBasedArray)
+        assert len(data) == 100
+        assert data[1000] == 1000.0 and data[1099] == 1099.0
+        assert list(data.view()) == [float(i) for i in range(1000, 1100)]
+        assert v.MAIN.samples[899]() == 0 and v.MAIN.samples[1100]() == 0
+        assert list(v.MAIN.samples.read_range(9898)) == [0.0] * 2
+
+        # Rows of a two-dimensional array
+        v.MAIN.matrix.write_range((3, 0), range(10))
+        assert list(v.MAIN.matrix.read_range((3, 0), (4, 0))) == list(range(10))
+        assert list(v.MAIN.matrix.read_range((3, 2), (3, 10))) == list(range(2, 10))
+        assert list(v.MAIN.matrix.read_range((2, 8), (3, 2))) == [0, 0, 0, 1]
+        assert v.MAIN.matrix[3, 9]() == 9
+
+        # Arrays of structures
+        points = v.MAIN.points.read_range(2, 5)
+        points[3].x = 1.5
+        v.MAIN.points.write_range(2, points)
+        assert v.MAIN.points[3].x() == 1.5
+        assert v.MAIN.points.read_range(3, 4)[3].x == 1.5
+
+        with pytest.raises(IndexError):
+            v.MAIN.samples.read_range(-101, 0)
+        with pytest.raises(IndexError):
+            v.MAIN.samples.read_range(0, 9901)
+        with pytest.raises(IndexError):
+            v.MAIN.samples.read_range(10, 5)
+        with pytest.raises(IndexError):
+            v.MAIN.samples.write_range(9899, [1.0, 2.0])
+        with pytest.raises(IndexError):
+            v.MAIN.matrix.read_range(1, 2)
+        with pytest.raises(TypeError):
+            v.MAIN.points[0].x.read_range(0, 1)
@@ -0,0 +1,66 @@
+from ads import adssymbols
+from ads.plcprogram import PlcProgram
+from ads.simulator import SimulatedAdsDll, SimulatedDevice
+import pytest
+
+
+def program(version):
+    program = PlcProgram()
+    program.addStruct('ST_Fixed', [('a', 'INT'), ('b', 'LREAL')])
+    if version == 1:
+        program.addStruct('ST_Changing', [('x', 'INT')])
+    else:
+        program.addStruct('ST_Changing', [('x', 'INT'), ('y', 'INT')])
+    program.addStruct('ST_Outer', [('inner', 'ST_Changing')])
+
+    program.addSymbol('MAIN.fixed', 'ST_Fixed')
+    program.addSymbol('MAIN.counter', 'DINT')
+    program.addSymbol('MAIN.outer', 'ST_Outer')
+    if version == 1:
+        program.addSymbol('GVL.removed', 'INT')
+    else:
+        program.addSymbol('GVL.added', 'ST_Changing')
+    return program
+
+
+def test_refresh():
+    with SimulatedAdsDll() as lib:
+        device = lib.addDevice(SimulatedDevice(program(1)))
+        v = adssymbols.getVariables()
+        defs = (~v.MAIN.fixed).variablesDefinition
+
+        assert defs.refresh() == adssymbols.RefreshResult([], [], [], [])
+
+        fixed = v.MAIN.fixed
+        counter = v.MAIN.counter
+        outer = v.MAIN.outer
+        removed = v.GVL.removed
+        fixedCtype = defs.ctypes['ST_Fixed']
+        fixed.b(1.5)
+        counter(3)
+
+        device.loadProgram(program(2))
+        result = defs.refresh()
+        assert result.added == ['GVL.added']
+        assert result.removed == ['GVL.removed']
+        assert result.changed == ['MAIN.outer']
+        assert result.datatypes == ['ST_Changing', 'ST_Outer']
+
+        # Unchanged symbols and datatypes are retained
+        assert v.MAIN.fixed is fixed
+        assert defs.ctypes['ST_Fixed'] is fixedCtype
+        assert fixed.b() == 1.5
+        assert counter() == 3
+
+        # Changed and removed symbols are invalidated
+        with pytest.raises(adssymbols.InvalidatedVariableError):
+            outer.inner.x()
+        with pytest.raises(adssymbols.InvalidatedVariableError):
+            removed(1)
+        assert not hasattr(v.GVL, 'removed')
+
+        v.MAIN.outer.inner.y(4)
+        assert v.MAIN.outer.inner.y() == 4
+        v.GVL.added.y(5)
+        assert defs.getVariable('GVL.added.y')() == 5
+        assert list(defs.symbols) == ['MAIN.fixed', 'MAIN.counter', 'MAIN.outer', 'GVL.added']
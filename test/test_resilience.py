@@ -0,0 +1,210 @@
+from ads import adssymbols, cpyads
+from ads.plcprogram import PlcProgram
+from ads.resilience import ResilientAdsDll, CircuitOpenError, CircuitBreaker, deadline
+from ads.simulator import SimulatedAdsDll, SimulatedDevice, SimulatedError
+from ctypes import c_uint32
+import pytest
+import time
+
+
+def program():
+    program = PlcProgram()
+    program.addSymbol('MAIN.counter', 'UDINT')
+    return program
+
+
+def test_typed_errors():
+    with SimulatedAdsDll() as lib:
+        device = lib.addDevice(SimulatedDevice(program()))
+        cpyads.adsPortOpen()
+
+        with pytest.raises(cpyads.AdsError) as e:
+            cpyads.adsSyncReadReq(cpyads.SAmsAddr(port=851), 0x1234, 0, c_uint32)
+        assert e.value.code == cpyads.ADSERR_DEVICE_INVALIDGRP
+        assert isinstance(e.value, IOError)
+        assert 'ADSERR_DEVICE_INVALIDGRP' in str(e.value)
+
+        with pytest.raises(cpyads.AdsTargetError) as e:
+            cpyads.adsSyncReadReq(cpyads.SAmsAddr(port=852), 0x4040, 0, c_uint32)
+        assert e.value.code == cpyads.ADSERR_TARGET_PORT_NOT_FOUND
+
+        device.offline = True
+        cpyads.adsSyncSetTimeout(10)
+        with pytest.raises(cpyads.AdsTimeoutError) as e:
+            cpyads.adsSyncReadReq(cpyads.SAmsAddr(port=851), 0x4040, 0, c_uint32)
+        assert isinstance(e.value, TimeoutError)
+
+
+def test_deadline():
+    with SimulatedAdsDll() as lib:
+        device = lib.addDevice(SimulatedDevice(program()))
+        v = adssymbols.getVariables(timeout=0.05)
+
+        with ResilientAdsDll(retries=10, backoff=0.001):
+            v.MAIN.counter(1)
+            device.offline = True
+
+            # The per-definition timeout limits the request including retries,
+            # rather than the 5 s port timeout
+            start = time.monotonic()
+            with pytest.raises(cpyads.AdsTimeoutError):
+                v.MAIN.counter()
+            assert time.monotonic() - start < 0.5
+
+            # A per-call deadline can only shorten it
+            start = time.monotonic()
+            with deadline(0.01):
+                with pytest.raises(cpyads.AdsTimeoutError):
+                    v.MAIN.counter()
+            assert time.monotonic() - start < 0.04
+
+
+def test_deadline_without_resilience():
+    with SimulatedAdsDll() as lib:
+        device = lib.addDevice(SimulatedDevice(program()))
+        v = adssymbols.getVariables(timeout=0.05)
+        v.MAIN.counter(1)
+        device.offline = True
+
+        # The definition timeout limits the port timeout also without
+        # ResilientAdsDll
+        start = time.monotonic()
+        with pytest.raises(cpyads.AdsTimeoutError):
+            v.MAIN.counter()
+        assert time.monotonic() - start < 0.5
+
+        # Requests without a deadline use the port timeout again
+        cpyads.adsSyncSetTimeout(200)
+        device.offline = False
+        assert v.MAIN.counter() == 1
+        device.offline = True
+        start = time.monotonic()
+        with pytest.raises(cpyads.AdsTimeoutError):
+            cpyads.adsSyncReadReq(cpyads.SAmsAddr(port=851), 0x4040, 0, c_uint32)
+        assert time.monotonic() - start >= 0.2
+
+
+def test_retry_and_circuit_breaker():
+    with SimulatedAdsDll() as lib:
+        device = lib.addDevice(SimulatedDevice(program()))
+        v = adssymbols.getVariables()
+
+        with ResilientAdsDll(timeout=0.01, retries=1, backoff=0.001,
+                failures=3, probeInterval=0.1) as resilient:
+            v.MAIN.counter(5)
+            device.offline = True
+
+            # Two attempts each; the breaker opens at the third failure
+            with pytest.raises(cpyads.AdsTimeoutError):
+                v.MAIN.counter()
+            with pytest.raises(cpyads.AdsTimeoutError):
+                v.MAIN.counter()
+            breaker, = resilient.breakers.values()
+            assert breaker.state == CircuitBreaker.OPEN
+
+            # Fail fast while open
+            start = time.monotonic()
+            with pytest.raises(CircuitOpenError) as e:
+                v.MAIN.counter()
+            assert e.value.code == cpyads.ADSERR_CLIENT_SYNCTIMEOUT
+            assert time.monotonic() - start < 0.01
+
+            # A probe after the probe interval closes the breaker again
+            device.offline = False
+            time.sleep(0.1)
+            assert v.MAIN.counter() == 5
+            assert breaker.state == CircuitBreaker.CLOSED
+
+            # Errors returned by the target do not count as failures
+            with pytest.raises(cpyads.AdsError):
+                cpyads.adsSyncReadReq(cpyads.SAmsAddr(port=851), 0x1234, 0, c_uint32)
+            assert breaker.consecutiveFailures == 0
+
+
+class LosingDevice(SimulatedDevice):
+    """
+    Device of which the responses to the first lost requests are lost, after
+    the request was executed
+    """
+    lost = 0
+
+    def read(self, indexGroup, indexOffset, length):
+        data = super().read(indexGroup, indexOffset, length)
+        self._lose()
+        return data
+
+    def write(self, indexGroup, indexOffset, data):
+        super().write(indexGroup, indexOffset, data)
+        self._lose()
+
+    def readWrite(self, indexGroup, indexOffset, readLength, data):
+        # The reads and writes of a sum request are not lost individually
+        lost, self.lost = self.lost, 0
+        try:
+            data = super().readWrite(indexGroup, indexOffset, readLength, data)
+        finally:
+            self.lost = lost
+        self._lose()
+        return data
+
+    def _lose(self):
+        if self.lost > 0:
+            self.lost -= 1
+            raise SimulatedError(cpyads.ADSERR_CLIENT_SYNCTIMEOUT)
+
+
+def test_no_retry_of_writes():
+    with SimulatedAdsDll() as lib:
+        device = lib.addDevice(LosingDevice(program()))
+        v = adssymbols.getVariables()
+
+        with ResilientAdsDll(retries=3, backoff=0.001, failures=10):
+            # A timed out write is sent exactly once
+            writes = device.requests['write']
+            device.lost = 1
+            with pytest.raises(cpyads.AdsTimeoutError):
+                v.MAIN.counter(5)
+            assert device.requests['write'] - writes == 1
+            assert device.lost == 0
+
+            # Reads are retried
+            reads = device.requests['read']
+            device.lost = 2
+            assert v.MAIN.counter() == 5
+            assert device.requests['read'] - reads == 3
+
+            # Sum reads are retried as well
+            sums = device.requests['readWrite']
+            device.lost = 1
+            assert adssymbols.readSum([v.MAIN.counter]) == [5]
+            assert device.requests['readWrite'] - sums == 2
+
+        with ResilientAdsDll(retries=3, backoff=0.001, retryWrites=True):
+            writes = device.requests['write']
+            device.lost = 1
+            v.MAIN.counter(6)
+            assert device.requests['write'] - writes == 2
+
+
+def test_timeout_restored_after_deadline():
+    with SimulatedAdsDll() as lib:
+        device = lib.addDevice(SimulatedDevice(program()))
+        v = adssymbols.getVariables()
+
+        with ResilientAdsDll():
+            with deadline(0.08):
+                v.MAIN.counter()
+            assert lib.timeouts[lib.localPort] <= 80
+
+            # Without a deadline the port has its default timeout again
+            device.latency = 0.2
+            v.MAIN.counter()
+            assert lib.timeouts[lib.localPort] == cpyads.DEFAULT_TIMEOUT
+
+            # or the timeout that was set on it
+            cpyads.adsSyncSetTimeout(1000)
+            device.latency = 0
+            with deadline(0.08):
+                v.MAIN.counter()
+            v.MAIN.counter()
+            assert lib.timeouts[lib.localPort] == 1000
@@ -0,0 +1,57 @@
+from ads import adssymbols
+from ads.plcprogram import PlcProgram
+from ads.sampler import CyclicSampler, percentiles
+from ads.simulator import SimulatedAdsDll, SimulatedDevice
+import queue
+import time
+
+
+def test_sampler():
+    program = PlcProgram()
+    program.addSymbol('MAIN.a', 'DINT')
+    program.addSymbol('MAIN.b', 'LREAL')
+
+    with SimulatedAdsDll() as lib:
+        lib.addDevice(SimulatedDevice(program, latency=0.001))
+        v = adssymbols.getVariables()
+        v.MAIN.a(3)
+
+        samples = queue.Queue()
+        with CyclicSampler([v.MAIN.a, v.MAIN.b], 0.01, samples) as sampler:
+            time.sleep(0.2)
+
+    samples = [samples.get_nowait() for i in range(samples.qsize())]
+    assert 15 <= len(samples) <= 21
+    assert samples[0].values == [3, 0.0]
+    for s in samples:
+        assert abs(s.deadline - samples[0].deadline - s.cycle * 0.01) < 1e-9
+        assert s.latency >= 0.002
+
+    stats = sampler.statistics()
+    assert stats['samples'] == len(samples)
+    assert stats['missed'] == samples[-1].cycle + 1 - len(samples)
+    assert stats['latency']['p50'] >= 0.002
+
+
+def test_missed_cycles():
+    delays = [0, 0.035, 0, 0, 0]
+    samples = []
+
+    def read(variables):
+        if delays:
+            time.sleep(delays.pop(0))
+        return []
+
+    with CyclicSampler([], 0.01, samples.append, read) as sampler:
+        time.sleep(0.1)
+
+    # The read of cycle 1 takes 3.5 periods; cycles 2 and 3 are skipped and
+    # cycle 4 is late
+    assert [s.cycle for s in samples[:3]] == [0, 1, 4]
+    assert sampler.missed == 2
+    assert samples[2].timestamp - samples[2].deadline > 0.004
+
+
+def test_percentiles():
+    assert percentiles(range(100)) == {'p50': 50, 'p90': 90, 'p99': 99, 'max': 99}
+    assert percentiles([]) == {}
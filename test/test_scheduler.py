@@ -0,0 +1,71 @@
+from ads import adssymbols, scheduler
+from ads.plcprogram import PlcProgram
+from ads.scheduler import RequestScheduler, BULK, CONTROL, INTERACTIVE
+from ads.simulator import SimulatedAdsDll, SimulatedDevice
+import pytest
+import threading
+
+
+def program():
+    program = PlcProgram()
+    program.addSymbol('MAIN.log', program.arrayType('LREAL', [(1, 4096)]))
+    program.addSymbol('MAIN.setpoint', 'LREAL')
+    return program
+
+
+def test_chunked_transfer():
+    with SimulatedAdsDll() as lib:
+        device = lib.addDevice(SimulatedDevice(program()))
+        v = adssymbols.getVariables()
+
+        with RequestScheduler(chunkSize=1000) as s:
+            with scheduler.priority(BULK):
+                v.MAIN.log(*range(4096))
+                log = v.MAIN.log()
+            assert device.requests['write'] == 33
+            assert device.requests['read'] == 3 + 33
+            reads = device.requests['read']
+            assert list(log) == list(range(4096))
+
+            # Other classes are not chunked
+            assert list(v.MAIN.log()) == list(range(4096))
+            assert device.requests['read'] - reads == 1
+
+        stats = s.statistics()
+        assert stats[BULK]['requests'] == 66
+        assert stats[INTERACTIVE]['requests'] == 1
+        assert stats[CONTROL]['requests'] == 0
+        assert stats[BULK]['waiting'] == stats[BULK]['running'] == 0
+
+    with pytest.raises(ValueError):
+        scheduler.setThreadPriority('urgent')
+
+
+def test_control_preempts_bulk():
+    with SimulatedAdsDll() as lib:
+        lib.addDevice(SimulatedDevice(program(), latency=0.002))
+        v = adssymbols.getVariables()
+
+        with RequestScheduler(chunkSize=1024) as s:
+            started = threading.Event()
+
+            def recorder():
+                with scheduler.priority(BULK):
+                    started.set()
+                    for i in range(2):
+                        v.MAIN.log()
+
+            thread = threading.Thread(target=recorder)
+            thread.start()
+            started.wait()
+            with scheduler.priority(CONTROL):
+                for i in range(10):
+                    v.MAIN.setpoint(i)
+            thread.join()
+
+        stats = s.statistics()
+        assert stats[BULK]['requests'] == 64
+        assert stats[CONTROL]['requests'] == 10
+        # A control request waits for at most the chunk in progress, rather
+        # than for a complete 32 KB transfer
+        assert stats[CONTROL]['wait']['max'] < 10 * 0.002
@@ -0,0 +1,90 @@
+from ads import adssymbols, cpyads
+from ads.plcprogram import PlcProgram
+from ads.simulator import (
+    SimulatedAdsDll, SimulatedDevice, ADSIGRP_SUMUP_READ, ADSIGRP_SUMUP_WRITE
+    )
+from ctypes import byref, c_ubyte, sizeof
+import pytest
+import struct
+import time
+
+
+def program():
+    program = PlcProgram()
+    program.addAlias('E_State', 'INT')
+    program.addStruct('ST_Data', [
+        ('state', 'E_State'), ('value', 'LREAL'), ('text', 'STRING(20)'),
+        ('items', program.arrayType('DINT', [(-2, 5)]))])
+    program.addSymbol('MAIN.counter', 'UDINT')
+    program.addSymbol('MAIN.data', 'ST_Data')
+    program.addSymbol('GVL.table', program.arrayType('ST_Data', [(1, 3)]))
+    return program
+
+
+def test_variables():
+    with SimulatedAdsDll() as lib:
+        device = lib.addDevice(SimulatedDevice(program()))
+        v = adssymbols.getVariables()
+
+        v.MAIN.counter(42)
+        assert v.MAIN.counter() == 42
+        v.MAIN.data.text('hello')
+        assert v.MAIN.data.text() == 'hello'
+        v.GVL.table[2].items[-2](-7)
+        assert v.GVL.table[2].items[-2]() == -7
+
+        symbol = (~v.MAIN.counter).symbol
+        assert device.images[symbol.iGroup][symbol.iOffs:symbol.iOffs + 4] == struct.pack('<L', 42)
+        assert device.requests['write'] == 3
+
+
+def test_errors():
+    with SimulatedAdsDll() as lib:
+        lib.addDevice(SimulatedDevice(program()))
+        addr = cpyads.SAmsAddr(port=851)
+        with pytest.raises(IOError):
+            # Port not open
+            cpyads.adsSyncReadReq(addr, 0x4040, 0, c_ubyte * 4)
+
+        cpyads.adsPortOpen()
+        with pytest.raises(IOError):
+            cpyads.adsSyncReadReq(addr, 0x1234, 0, c_ubyte * 4)
+        with pytest.raises(IOError):
+            cpyads.adsSyncReadReq(cpyads.SAmsAddr('1.2.3.4.1.1', 851), 0x4040, 0, c_ubyte * 4)
+
+
+def test_sum_commands():
+    with SimulatedAdsDll() as lib:
+        lib.addDevice(SimulatedDevice(program()))
+        lib.AdsPortOpen()
+        addr = cpyads.SAmsAddr(port=851)
+
+        request = struct.pack('<3L', 0x4040, 0, 4) + struct.pack('<3L', 0x9999, 0, 2) + b'\1\0\0\0\2\0'
+        response = (c_ubyte * 8)()
+        lib.AdsSyncReadWriteReq(byref(addr), ADSIGRP_SUMUP_WRITE, 2,
+            sizeof(response), byref(response), len(request), request)
+        assert struct.unpack('<2L', bytes(response)) == (0, cpyads.ADSERR_DEVICE_INVALIDGRP)
+
+        request = struct.pack('<3L', 0x4040, 0, 4)
+        response = (c_ubyte * 8)()
+        lib.AdsSyncReadWriteReq(byref(addr), ADSIGRP_SUMUP_READ, 1,
+            sizeof(response), byref(response), len(request), request)
+        assert struct.unpack('<2L', bytes(response)) == (0, 1)
+
+
+def test_state_and_latency():
+    with SimulatedAdsDll() as lib:
+        device = lib.addDevice(SimulatedDevice(program(), latency=0.01))
+        v = adssymbols.getVariables()
+        v.MAIN.counter(1)
+
+        addr = cpyads.SAmsAddr(port=851)
+        cpyads.adsRestart(addr)
+        adsState, deviceState = cpyads.adsGetAdsAndDeviceState(addr)
+        assert adsState.value == cpyads.ADSSTATE_RUN
+        assert v.MAIN.counter() == 0 # cleared by the reset
+
+        t0 = time.perf_counter()
+        for i in range(5):
+            v.MAIN.counter()
+        assert time.perf_counter() - t0 >= 0.05
@@ -0,0 +1,106 @@
+from ads import adssymbols, cpyads
+from ads.plcprogram import PlcProgram
+from ads.simulator import SimulatedAdsDll, SimulatedDevice
+from ads.trace import (
+    TraceRecorder, ReplayAdsDll, TraceMismatchError, readTrace,
+    READ, WRITE, READSTATE, LOCALADDRESS
+    )
+from ctypes import c_uint32
+import pytest
+import time
+
+
+def program():
+    program = PlcProgram()
+    program.addStruct('ST_Data', [('counter', 'UDINT'), ('value', 'LREAL'), ('name', 'STRING(20)')])
+    program.addSymbol('MAIN.data', 'ST_Data')
+    program.addSymbol('MAIN.speed', 'REAL')
+    return program
+
+
+def session():
+    """
+    Returns the values read by a session of ADS requests
+    """
+    v = adssymbols.getVariables()
+    v.MAIN.speed(2.5)
+    v.MAIN.data.name('recorded')
+    values = [v.MAIN.speed(), v.MAIN.data.name(), v.MAIN.data.value.read_python()]
+    values.append(cpyads.adsGetAdsAndDeviceState(cpyads.SAmsAddr(port=851))[0].value)
+    with pytest.raises(cpyads.AdsError) as e:
+        cpyads.adsSyncReadReq(cpyads.SAmsAddr(port=851), 0x1234, 0, c_uint32)
+    values.append(e.value.code)
+    return values
+
+
+def test_record_replay(tmp_path):
+    path = str(tmp_path / 'session.adstrace')
+    with SimulatedAdsDll() as lib:
+        device = lib.addDevice(SimulatedDevice(program(), latency=0.002))
+        with TraceRecorder(path) as recorder:
+            recorded = session()
+        # The recorded session got its data from the device
+        assert device.requests['write'] == 2
+
+    records = list(readTrace(path))
+    assert len(records) == recorder.records
+    assert [r.kind for r in records].count(WRITE) == 2
+    assert records[0].kind == LOCALADDRESS
+    speedWrite = [r for r in records if r.kind == WRITE][0]
+    assert speedWrite.writeData == b'\x00\x00\x20\x40'
+    assert speedWrite.address.endswith(':851')
+    assert speedWrite.duration >= 0.002
+    failed = [r for r in records if r.error]
+    assert len(failed) == 1 and failed[0].kind == READ and failed[0].indexGroup == 0x1234
+    assert [r for r in records if r.kind == READSTATE][0].response[:2] == b'\x05\x00'
+
+    # Replay without any device
+    with ReplayAdsDll(path, timeScale=0.0):
+        start = time.perf_counter()
+        assert session() == recorded
+        fast = time.perf_counter() - start
+
+    with ReplayAdsDll(path, timeScale=1.0):
+        start = time.perf_counter()
+        assert session() == recorded
+        original = time.perf_counter() - start
+    assert original > sum(r.duration for r in records) * 0.9
+    assert original > fast
+
+    with ReplayAdsDll(path, timeScale=0.0, loop=False):
+        v = adssymbols.getVariables()
+        with pytest.raises(TraceMismatchError):
+            v.MAIN.data.counter()
+
+
+def sumWrite(v, value):
+    writes = []
+    for var in (v.MAIN.data.counter, v.MAIN.speed):
+        info = ~var
+        writes.append((info.symbol.iGroup, info.symbol.iOffs + info.offset,
+            bytes(info.ctype(value))))
+    adssymbols.writeSumRaw(info.variablesDefinition, writes)
+
+
+def test_replay_other_writes(tmp_path):
+    path = str(tmp_path / 'writes.adstrace')
+    with SimulatedAdsDll() as lib:
+        lib.addDevice(SimulatedDevice(program()))
+        with TraceRecorder(path):
+            v = adssymbols.getVariables()
+            v.MAIN.speed(1.0)
+            v.MAIN.data.counter.exchange(1, v.MAIN.speed)
+            sumWrite(v, 1)
+
+    # A write workload is replayed with other written values
+    with ReplayAdsDll(path, timeScale=0.0):
+        v = adssymbols.getVariables()
+        v.MAIN.speed(2.0)
+        assert v.MAIN.data.counter.exchange(7, v.MAIN.speed) == 1.0
+        sumWrite(v, 3)
+
+    with ReplayAdsDll(path, timeScale=0.0, verifyWrites=True):
+        v = adssymbols.getVariables()
+        v.MAIN.speed(1.0)
+        with pytest.raises(TraceMismatchError):
+            v.MAIN.speed(2.0)
@@ -0,0 +1,72 @@
+from ads import adssymbols
+from ads.plcprogram import PlcProgram
+from ads.simulator import SimulatedAdsDll, SimulatedDevice
+from ads.trend import RingBuffer, Trend
+import random
+import time
+
+
+def test_ring_buffer():
+    buffer = RingBuffer(10, blockSize=4)
+    assert buffer.capacity == 12
+    assert len(buffer) == 0 and buffer.tolist() == []
+    assert buffer.envelope(5) == ([], [], [])
+
+    values = []
+    rnd = random.Random(0)
+    for i in range(100):
+        value = rnd.uniform(-1, 1)
+        buffer.append(value)
+        values = (values + [value])[-12:]
+        assert buffer.tolist() == values
+        assert buffer[0] == values[0] and buffer[-1] == values[-1]
+
+        for bins in (1, 2, 3, 5, 20):
+            for start in {0, len(values) // 2, len(values) - 1}:
+                starts, mins, maxs = buffer.envelope(bins, start)
+                assert len(starts) == len(mins) == len(maxs) <= bins
+                assert starts[0] == start and starts == sorted(set(starts))
+                for lo, hi, low, high in zip(starts, starts[1:] + [len(values)], mins, maxs):
+                    assert (low, high) == (min(values[lo:hi]), max(values[lo:hi]))
+
+
+def test_ring_buffer_blocks():
+    # Bins of whole blocks are taken from the block minima and maxima
+    buffer = RingBuffer(1000, blockSize=10)
+    for i in range(1234):
+        buffer.append(i % 100)
+    values = buffer.tolist()
+    starts, mins, maxs = buffer.envelope(50)
+    assert starts[0] == 0 and all(s % 10 == 6 for s in starts[1:])
+    for lo, hi, low, high in zip(starts, starts[1:] + [1000], mins, maxs):
+        assert (low, high) == (min(values[lo:hi]), max(values[lo:hi]))
+    assert buffer.envelope(1) == ([0], [0], [99])
+
+
+def test_trend():
+    program = PlcProgram()
+    program.addSymbol('MAIN.position', 'LREAL')
+    program.addSymbol('MAIN.enabled', 'BOOL')
+
+    with SimulatedAdsDll() as lib:
+        device = lib.addDevice(SimulatedDevice(program))
+        v = adssymbols.getVariables()
+        v.MAIN.position(1.5)
+        v.MAIN.enabled(True)
+
+        reads = device.requests['readWrite']
+        with Trend([v.MAIN.position, v.MAIN.enabled], period=0.002, duration=0.02) as trend:
+            time.sleep(0.2)
+        assert trend.names == ['position', 'enabled']
+        assert device.requests['readWrite'] - reads == trend.sampler.samples
+        assert trend.sampler.samples > 64
+        assert len(trend) == 64
+
+        times, signals = trend.envelope(10)
+        assert len(times) <= 10 and times == sorted(times)
+        assert signals == [([1.5] * len(times), [1.5] * len(times)),
+            ([1.0] * len(times), [1.0] * len(times))]
+
+        times, signals = trend.envelope(100, duration=0.01)
+        assert 4 <= len(times) <= 10
+        assert trend.times[-1] - times[0] <= 0.01
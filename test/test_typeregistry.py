@@ -0,0 +1,75 @@
+from ads import adssymbols, cpyads
+from ads.plcprogram import PlcProgram
+from ads.simulator import SimulatedAdsDll, SimulatedDevice
+import gc
+
+
+def program(version=1):
+    program = PlcProgram()
+    program.addStruct('ST_Fixed', [('a', 'INT'), ('b', 'LREAL')])
+    if version == 1:
+        program.addStruct('ST_Changing', [('x', 'INT')])
+    else:
+        program.addStruct('ST_Changing', [('x', 'INT'), ('y', 'INT')])
+    program.addSymbol('MAIN.fixed', 'ST_Fixed')
+    program.addSymbol('MAIN.changing', 'ST_Changing')
+    return program
+
+
+def test_shared_datatypes():
+    registry = adssymbols.TypeRegistry()
+    with SimulatedAdsDll() as lib:
+        cpyads.adsPortOpen()
+        definitions = []
+        for i in range(3):
+            netId = '10.0.0.%d.1.1' % i
+            lib.addDevice(SimulatedDevice(program()), netId)
+            definitions.append(adssymbols.AdsVariablesDefinition(
+                cpyads.SAmsAddr(netId, 851), registry=registry))
+        lib.addDevice(SimulatedDevice(program(2)), '10.0.0.9.1.1')
+        other = adssymbols.AdsVariablesDefinition(
+            cpyads.SAmsAddr('10.0.0.9.1.1', 851), registry=registry)
+        private = adssymbols.AdsVariablesDefinition(
+            cpyads.SAmsAddr('10.0.0.0.1.1', 851), registry=None)
+
+        first, second, third = definitions
+        assert first.types is second.types is third.types
+        assert first.dtypes['ST_Fixed'] is third.dtypes['ST_Fixed']
+        assert first.getCtype('ST_Fixed') is second.getCtype('ST_Fixed')
+        assert first.leaves(first.variables.MAIN.fixed) is second.leaves(second.variables.MAIN.fixed)
+        assert other.types is not first.types and private.types is not first.types
+        assert len(registry) == 2
+
+        # Symbols and data remain per PLC
+        for i, definition in enumerate(definitions):
+            definition.variables.MAIN.fixed.b(i + 0.5)
+        assert [d.variables.MAIN.fixed.b() for d in definitions] == [0.5, 1.5, 2.5]
+        assert first.variables.MAIN.fixed().b == 0.5
+
+        # An online change of one PLC does not affect the others; PLCs that
+        # receive the same change share the new datatypes again
+        fixedCtype = first.getCtype('ST_Fixed')
+        changingCtype = first.getCtype('ST_Changing')
+        fixed = first.variables.MAIN.fixed
+        lib.routes[((10, 0, 0, 0, 1, 1), 851)].loadProgram(program(2))
+        lib.routes[((10, 0, 0, 1, 1, 1), 851)].loadProgram(program(2))
+        assert first.refresh().datatypes == ['ST_Changing']
+        assert first.types is other.types
+        # Variables obtained before the refresh hit the layout cache of the
+        # adopted datatypes; Variables obtained after it use its ctypes
+        assert first.leaves(fixed) is first.leaves(fixed)
+        assert first.leaves(fixed) is other.leaves(other.variables.MAIN.fixed)
+        assert (~first.variables.MAIN.fixed).ctype is other.getCtype('ST_Fixed')
+        assert first.getCtype('ST_Fixed') is other.getCtype('ST_Fixed')
+        assert fixed.b() == 0.5
+        assert first.getCtype('ST_Changing') is not changingCtype
+        assert third.getCtype('ST_Changing') is changingCtype
+        assert third.getCtype('ST_Fixed') is fixedCtype
+        assert second.refresh().datatypes == ['ST_Changing']
+        assert second.types is first.types
+        assert first.variables.MAIN.fixed.b() == 0.5
+
+        # Unused datatypes are dropped from the registry
+        del definitions, definition, first, second, third
+        gc.collect()
+        assert len(registry) == 1
@@ -1,7 +1,142 @@
-
-from ads import adssymbols
-
-
-def test_plc_string():
-    s = adssymbols.PLCString.create(25)
-    print(s)
+
+from ads import adssymbols, cpyads
+from ads.plcprogram import PlcProgram
+from ads.simulator import SimulatedAdsDll, SimulatedDevice
+import array
+import mmap
+import pytest
+import threading
+
+
+def test_plc_string():
+    s = adssymbols.PLCString.create(25)
+    print(s)
+
+
+def test_read_parallel():
+    program = PlcProgram()
+    for i in range(50):
+        program.addSymbol('MAIN.var%d' % i, 'DINT')
+
+    with SimulatedAdsDll() as lib:
+        lib.addDevice(SimulatedDevice(program, latency=0.001))
+        v = adssymbols.getVariables()
+        variables = [getattr(v.MAIN, 'var%d' % i) for i in range(50)]
+        for i, var in enumerate(variables):
+            var(i * 3)
+
+        assert adssymbols.readParallel(variables, workers=8) == [i * 3 for i in range(50)]
+
+        # Only the port opened by getVariables remains open
+        assert lib.openPorts == {lib.localPort}
+        assert cpyads.getThreadPort() is None
+
+
+def test_shared_port_deadlines():
+    program = PlcProgram()
+    program.addSymbol('MAIN.counter', 'DINT')
+
+    with SimulatedAdsDll() as lib:
+        lib.addDevice(SimulatedDevice(program))
+        v = adssymbols.getVariables()
+
+        def worker(i):
+            # Threads on the same port, with and without a deadline
+            for j in range(200):
+                with cpyads.deadline(1.0 + i if j % 2 else None):
+                    v.MAIN.counter()
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # The timeout of the port matches the timeout recorded for it
+        with cpyads.deadline(0.5):
+            v.MAIN.counter()
+        assert lib.timeouts[lib.localPort] <= 500
+        v.MAIN.counter()
+        assert lib.timeouts[lib.localPort] == cpyads.DEFAULT_TIMEOUT
+
+
+def test_get_variable():
+    program = PlcProgram()
+    program.addStruct('ST_Item', [('a', 'INT'), ('b', program.arrayType('REAL', [(0, 2), (1, 3)]))])
+    program.addSymbol('MAIN.items', program.arrayType('ST_Item', [(-1, 3)]))
+
+    with SimulatedAdsDll() as lib:
+        lib.addDevice(SimulatedDevice(program))
+        cpyads.adsPortOpen()
+        defs = adssymbols.AdsVariablesDefinition(cpyads.SAmsAddr(port=851))
+
+        var = defs.getVariable('MAIN.items[-1].b[1,3]')
+        assert (~var).offset == 4 + 5 * 4
+        assert (~defs.getVariable('MAIN.items[1].a')).offset == 2 * 28
+
+        for path in ['MAIN', 'MAIN.items[3]', 'MAIN.items[0].c', '.MAIN.items', 'MAIN..items', 'MAIN.items[0]a']:
+            with pytest.raises(KeyError):
+                defs.getVariable(path)
+
+
+def test_buffer_access():
+    program = PlcProgram()
+    program.addSymbol('MAIN.values', program.arrayType('LREAL', [(1, 8)]))
+    program.addSymbol('MAIN.counter', 'UDINT')
+
+    with SimulatedAdsDll() as lib:
+        lib.addDevice(SimulatedDevice(program))
+        v = adssymbols.getVariables()
+        values = v.MAIN.values
+
+        values.write_buffer(array.array('d', range(8)))
+        target = array.array('d', [0] * 8)
+        assert values.readinto(target) == 64
+        assert list(target) == list(range(8))
+
+        # Part of the variable, into part of a caller-owned buffer
+        buffer = bytearray(32)
+        values.readinto(memoryview(buffer)[8:24], start=16)
+        assert array.array('d', bytes(buffer[8:24])).tolist() == [2, 3]
+
+        with mmap.mmap(-1, 8) as m:
+            values.readinto(m, start=56)
+            assert array.array('d', m[:]).tolist() == [7]
+
+        # Read-only buffer, and the raw slice interface
+        values.write_buffer(array.array('d', [-1]).tobytes(), start=8)
+        values[16:24] = array.array('d', [-2])
+        assert values[1]() == 0 and values[2]() == -1 and values[3]() == -2
+
+        v.MAIN.counter.write_buffer(b'\x01\x02\x00\x00')
+        assert v.MAIN.counter() == 0x201
+
+        with pytest.raises(ValueError):
+            values.readinto(bytearray(16), start=56)
+        with pytest.raises(ValueError):
+            values[0:8] = b'1234'
+
+
+def test_read_sum():
+    program = PlcProgram()
+    program.addStruct('ST_Point', [('valid', 'BOOL'), ('x', 'LREAL')])
+    program.addSymbol('MAIN.count', 'DINT')
+    program.addSymbol('MAIN.point', 'ST_Point')
+    program.addSymbol('MAIN.name', 'STRING(20)')
+
+    with SimulatedAdsDll() as lib:
+        device = lib.addDevice(SimulatedDevice(program))
+        v = adssymbols.getVariables()
+        v.MAIN.count(-5)
+        v.MAIN.point.x(2.5)
+        v.MAIN.name('abc')
+
+        requests = sum(device.requests.values())
+        count, x, name, point = adssymbols.readSum(
+            [v.MAIN.count, v.MAIN.point.x, v.MAIN.name, v.MAIN.point])
+        assert sum(device.requests.values()) - requests == 1
+        assert (count, x, name, point.x) == (-5, 2.5, 'abc', 2.5)
+        assert adssymbols.readSum([]) == []
+
+        with pytest.raises(ValueError):
+            adssymbols.readSum([v.MAIN.count, adssymbols.getVariables().MAIN.count])